@@ -0,0 +1,290 @@
+"""
+Benchmarks for the back testing, index and metrics hot paths
+
+Runs each stage on synthetic panels (scaled in dates, equities and features) and on fixtures built from
+the bundled data/ files, and reports wall time and peak traced memory per stage as JSON.
+A stored baseline can be compared against, to track scaling curves and regressions over time.
+
+usage (from the repository root):
+    python benchmarks/benchmark_hot_paths.py --output bench.json
+    python benchmarks/benchmark_hot_paths.py --features 10,100,1000 --equities 40,200 --save-baseline benchmarks/baseline.json
+    python benchmarks/benchmark_hot_paths.py --baseline benchmarks/baseline.json --fail-on-regression
+
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# add the base path to python system path
+base_path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+sys.path.append(base_path)
+
+from src.feature_backtesting_routines import get_detail_backtest_results
+from src.finance_functions import compute_levels, monthly_returns, multiple_returns_from_levels_vec
+from src.financial_metrics import multiple_extract_performance
+from src.index_functionality import index_levels_from_returns
+
+
+DATA_PATH = os.path.join(base_path, 'data')
+
+
+# synthetic generators
+
+def synthetic_long_panel(n_dates, n_equities, n_features, seed=1234):
+    """
+    long dataframe (date, equity, returns, feature columns) with some missing values and ties
+    """
+    rng = np.random.RandomState(seed)
+    dates = pd.date_range('2000-01-01', periods=n_dates, freq='MS')
+    equities = ['EQ%05d' % k for k in range(n_equities)]
+    index = pd.MultiIndex.from_product([dates, equities], names=['date', 'company'])
+
+    values = rng.normal(size=(n_dates * n_equities, n_features))
+    values[rng.uniform(size=values.shape) < 0.05] = np.nan
+    values[:, ::4] = np.round(values[:, ::4])
+
+    df = pd.DataFrame(values, index=index, columns=['feature%04d_bshift%d' % (k // 2, k % 2)
+                                                    for k in range(n_features)])
+    df['returns'] = rng.normal(0.0, 0.05, size=n_dates * n_equities)
+
+    return df.reset_index()
+
+
+def synthetic_weights_and_returns(n_dates, n_equities, seed=1234):
+    """
+    wide monthly returns and normalized, previous month weights
+    """
+    rng = np.random.RandomState(seed)
+    dates = pd.date_range('2000-01-01', periods=n_dates, freq='MS')
+    columns = ['EQ%05d' % k for k in range(n_equities)]
+
+    df_returns = pd.DataFrame(rng.normal(0.005, 0.05, size=(n_dates, n_equities)), index=dates, columns=columns)
+    df_weights = pd.DataFrame(rng.uniform(size=(n_dates, n_equities)), index=dates, columns=columns)
+    df_weights = df_weights.div(df_weights.sum(axis=1), axis=0)
+
+    return df_weights, df_returns
+
+
+def synthetic_daily_levels(n_days, n_columns, seed=1234):
+    """
+    wide business daily price levels
+    """
+    rng = np.random.RandomState(seed)
+    dates = pd.bdate_range('1950-01-02', periods=n_days)
+    returns = rng.normal(0.0003, 0.01, size=(n_days, n_columns))
+    levels = 100 * np.cumprod(1 + returns, axis=0)
+
+    return pd.DataFrame(levels, index=dates, columns=['C%04d' % k for k in range(n_columns)])
+
+
+def synthetic_return_dict(n_dates, n_portfolios, seed=1234):
+    """
+    dict in the multiple_extract_performance input format
+    """
+    rng = np.random.RandomState(seed)
+    dates = pd.date_range('2000-01-01', periods=n_dates, freq='MS')
+    d_return = {}
+    for k in range(n_portfolios):
+        df = pd.DataFrame({'returns': rng.normal(0.005, 0.04, size=n_dates)}, index=dates)
+        d_return['p%04d' % k] = {'df': df, 'col_name': 'returns', 'out_name': 'p%04d' % k}
+
+    return d_return
+
+
+# fixtures from the bundled data
+
+def fixture_monthly_long():
+    df = pd.read_csv(os.path.join(DATA_PATH, 'data_sample_monthly.csv'))
+    df['date'] = pd.to_datetime(df['date'])
+    df['size_factor'] = 1 / df['MarketCap_Mlns']
+    return df
+
+
+def fixture_index_history(name):
+    df = pd.read_csv(os.path.join(DATA_PATH, name + '.csv'))
+    df['Date'] = pd.to_datetime(df['Date'])
+    return df.set_index('Date')
+
+
+def fixture_monthly_weights_and_returns():
+    df = fixture_monthly_long()
+    df_prices = df.pivot(values='stock_price', index='date', columns='company')
+    df_returns = multiple_returns_from_levels_vec(df_prices.ffill()).iloc[1:]
+    df_market_cap = df.pivot(values='MarketCap_Mlns', index='date', columns='company').ffill().fillna(0.0)
+    df_weights = df_market_cap.div(df_market_cap.sum(axis=1), axis=0).shift(1).iloc[1:]
+    return df_weights, df_returns
+
+
+# measurement
+
+def measure(func, repeat=3):
+    """
+    run func repeat times; time of every run, and peak traced memory of the first run
+    """
+    times = []
+    peak = None
+    for k in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            if k == 0:
+                tracemalloc.start()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+            if k == 0:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+    return {'time_s': float(np.median(times)), 'time_min_s': float(np.min(times)),
+            'peak_mb': peak / 2 ** 20, 'repeat': repeat}
+
+
+def run_case(stage, case, params, func, repeat):
+    result = {'stage': stage, 'case': case, 'params': params}
+    try:
+        result.update(measure(func, repeat))
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = type(e).__name__ + ': ' + str(e)
+    print('%-32s %-36s %s' % (stage, case, '%.4fs %.1fMB' % (result['time_s'], result['peak_mb'])
+                              if result['status'] == 'ok' else result['error']), file=sys.stderr)
+    return result
+
+
+def benchmark_cases(l_features, l_equities, n_dates, repeat):
+    """
+    generator of benchmark results over all stages
+    """
+
+    # feature back testing, features x equities grid
+    for n_features in l_features:
+        for n_equities in l_equities:
+            df_long = synthetic_long_panel(n_dates, n_equities, n_features)
+            features = [col for col in df_long.columns if col.startswith('feature')]
+            yield run_case('get_detail_backtest_results', 'synthetic_f%d_e%d_d%d' % (n_features, n_equities, n_dates),
+                           {'n_features': n_features, 'n_equities': n_equities, 'n_dates': n_dates},
+                           lambda: get_detail_backtest_results(df_long, list(features), equity_identifier='company'),
+                           repeat)
+
+    df_long = fixture_monthly_long()
+    yield run_case('get_detail_backtest_results', 'data_sample_monthly', {},
+                   lambda: get_detail_backtest_results(df_long, ['volume', 'size_factor'],
+                                                       equity_identifier='company'), repeat)
+
+    # index levels with transaction costs
+    for n_equities in l_equities:
+        df_weights, df_returns = synthetic_weights_and_returns(n_dates, n_equities)
+        yield run_case('index_levels_from_returns', 'synthetic_e%d_d%d' % (n_equities, n_dates),
+                       {'n_equities': n_equities, 'n_dates': n_dates},
+                       lambda: index_levels_from_returns(df_weights, df_returns), repeat)
+
+    df_weights, df_returns = fixture_monthly_weights_and_returns()
+    yield run_case('index_levels_from_returns', 'data_sample_monthly', {},
+                   lambda: index_levels_from_returns(df_weights, df_returns), repeat)
+
+    # monthly returns of daily histories
+    for name in ['dow_jones', 's_and_p_index', 'dax', 'nikkei_225']:
+        df_index = fixture_index_history(name)
+        yield run_case('monthly_returns', name, {'n_rows': len(df_index)},
+                       lambda: monthly_returns(df_index, 'Close'), repeat)
+
+    df_levels = synthetic_daily_levels(25000, 1)
+    yield run_case('monthly_returns', 'synthetic_daily_25000', {'n_rows': 25000},
+                   lambda: monthly_returns(df_levels, 'C0000'), repeat)
+
+    # levels from returns
+    for n_columns in [1, 100]:
+        returns = np.random.RandomState(0).normal(0.0003, 0.01, size=(30000, n_columns))
+        yield run_case('compute_levels', 'synthetic_r30000_c%d' % n_columns, {'n_rows': 30000, 'n_columns': n_columns},
+                       lambda: compute_levels(1.0, returns), repeat)
+
+    # performance metrics of many portfolios
+    for n_portfolios in [10, 100]:
+        d_return = synthetic_return_dict(n_dates, n_portfolios)
+        yield run_case('multiple_extract_performance', 'synthetic_p%d_d%d' % (n_portfolios, n_dates),
+                       {'n_portfolios': n_portfolios, 'n_dates': n_dates},
+                       lambda: multiple_extract_performance(d_return), repeat)
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """
+    time ratio against the baseline for every (stage, case) present in both; ratios above threshold are regressions
+    """
+    d_baseline = {(item['stage'], item['case']): item for item in baseline['results'] if item['status'] == 'ok'}
+    comparison = []
+    for item in results:
+        key = (item['stage'], item['case'])
+        if item['status'] != 'ok' or key not in d_baseline:
+            continue
+        ratio = item['time_s'] / d_baseline[key]['time_s']
+        comparison.append({'stage': item['stage'], 'case': item['case'],
+                           'time_s': item['time_s'], 'baseline_time_s': d_baseline[key]['time_s'],
+                           'time_ratio': ratio,
+                           'peak_mb': item['peak_mb'], 'baseline_peak_mb': d_baseline[key]['peak_mb'],
+                           'regression': ratio > threshold})
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--features', default='10,100', help='comma separated feature counts')
+    parser.add_argument('--equities', default='40,200', help='comma separated equity counts')
+    parser.add_argument('--dates', type=int, default=120, help='number of months of the synthetic panels')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None, help='json output file, default stdout')
+    parser.add_argument('--baseline', default=None, help='baseline json to compare against')
+    parser.add_argument('--save-baseline', default=None, help='store the results as baseline json')
+    parser.add_argument('--threshold', type=float, default=1.25, help='time ratio counted as regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    l_features = [int(item) for item in args.features.split(',')]
+    l_equities = [int(item) for item in args.equities.split(',')]
+
+    results = list(benchmark_cases(l_features, l_equities, args.dates, args.repeat))
+
+    report = {'meta': {'timestamp': datetime.datetime.now().isoformat(),
+                       'python': platform.python_version(),
+                       'numpy': np.__version__,
+                       'pandas': pd.__version__,
+                       'platform': platform.platform(),
+                       'cpu_count': os.cpu_count()},
+              'results': results}
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['comparison'] = compare_to_baseline(results, baseline, args.threshold)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'meta': report['meta'], 'results': results}, f, indent=1)
+
+    text = json.dumps(report, indent=1)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text)
+
+    regressions = [item for item in report.get('comparison', []) if item['regression']]
+    if args.fail_on_regression and regressions:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Compact int-coded panel of the back testing inputs.
+
+Instead of a long dataframe with string equity identifiers and object dates, the data is held as:
+    dates, equities:  the coding dictionaries (code = position), the date and equity axes of the panel
+    present:          boolean (date x equity) array of the rows of the long dataframe
+    returns:          float32 (date x equity) returns
+    values:           float32 (date x equity x feature) feature values
+    fields:           dict of further float32 (date x equity) arrays, eg. market caps
+
+Row level codes are int32. Bins are int8 (0 outside any bin). Date filtering selects codes with a boolean mask
+and returns a panel sharing the arrays (basic slicing, no copy).
+
+get_detail_backtest_results, multiple_index_levels_from_returns, index_levels_from_returns and
+performance_metrics accept a CompactPanel in place of their dataframe input. Features are upcast to float64
+chunk by chunk inside the back test; results equal those of the long dataframe up to the float32 rounding
+of the stored inputs.
+
+Typical use:
+    panel = CompactPanel.from_long(input_df, features, return_col_name='returns', equity_identifier=eq_name,
+                                   field_cols=['MarketCap_Mlns'])
+    detail_results_df = get_detail_backtest_results(panel.restrict_dates(start_date, end_date), features)
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from .panel_backtesting import panel_codes, bins_from_values
+
+
+class CompactPanel(object):
+    """
+    date x equity x feature panel with int coded axes and float32 storage
+
+    :param dates: DatetimeIndex of the date axis (sorted)
+    :param equities: Index of the equity axis
+    :param present: boolean (date x equity) array
+    :param returns: (date x equity) returns
+    :param values: (date x equity x feature) feature values
+    :param features: feature names, in the order of the feature axis
+    :param fields: optional dict of name -> (date x equity) arrays
+    :param return_col_name: name of the returns, used by get_detail_backtest_results to skip it as a feature
+    """
+
+    def __init__(self, dates, equities, present, returns, values, features, fields=None, return_col_name='returns'):
+        assert values.shape[:2] == returns.shape == present.shape, 'panel shapes differ'
+        assert values.shape[2] == len(features), 'one feature name per feature column needed'
+
+        self.dates = pd.DatetimeIndex(dates)
+        self.equities = pd.Index(equities)
+        self.present = np.asarray(present, dtype=bool)
+        self.returns = np.asarray(returns, dtype=np.float32)
+        self.values = np.asarray(values, dtype=np.float32)
+        self.features = list(features)
+        self.fields = {name: np.asarray(field, dtype=np.float32) for name, field in (fields or {}).items()}
+        self.return_col_name = return_col_name
+
+    @classmethod
+    def from_long(cls,
+                  df_long,
+                  features,
+                  return_col_name='returns',
+                  equity_identifier='Equity Parent',
+                  date_col_name='date',
+                  field_cols=None):
+        """
+        build the panel from a long dataframe (date column or date index), one feature at a time
+        """
+        if date_col_name not in list(df_long.columns):
+            df_long = df_long.reset_index()
+            df_long.rename(columns={'index': 'date'}, inplace=True)
+
+        features = sorted(feature for feature in features if feature != return_col_name)
+
+        date_codes, equity_codes, dates, equities = panel_codes(df_long, equity_identifier, date_col_name)
+        date_codes = date_codes.astype(np.int32)
+        equity_codes = equity_codes.astype(np.int32)
+        n_dates = len(dates)
+        n_equities = len(equities)
+
+        present = np.zeros((n_dates, n_equities), dtype=bool)
+        present[date_codes, equity_codes] = True
+
+        def column_panel(col, out=None):
+            if out is None:
+                out = np.full((n_dates, n_equities), np.nan, dtype=np.float32)
+            out[date_codes, equity_codes] = df_long[col].to_numpy(dtype=np.float32, na_value=np.nan)
+            return out
+
+        values = np.full((n_dates, n_equities, len(features)), np.nan, dtype=np.float32)
+        for k, feature in enumerate(features):
+            column_panel(feature, values[:, :, k])
+
+        fields = {col: column_panel(col) for col in (field_cols or [])}
+
+        return cls(dates, equities, present, column_panel(return_col_name), values, features, fields,
+                   return_col_name)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.present.nbytes + self.returns.nbytes + self.values.nbytes + \
+            sum(field.nbytes for field in self.fields.values())
+
+    def date_mask(self, start_date=None, end_date=None):
+        """
+        boolean mask over the date codes, boundaries inclusive as in df_restrict_dates
+        """
+        mask = np.ones(len(self.dates), dtype=bool)
+        if start_date is not None:
+            mask &= self.dates >= pd.Timestamp(start_date)
+        if end_date is not None:
+            mask &= self.dates <= pd.Timestamp(end_date)
+        return mask
+
+    def restrict_dates(self, start_date=None, end_date=None):
+        """
+        panel restricted to a date range; the dates are sorted, so the arrays are sliced without copying
+        """
+        codes = np.flatnonzero(self.date_mask(start_date, end_date))
+        dates_slice = slice(codes[0], codes[-1] + 1) if len(codes) else slice(0, 0)
+        return self._take(dates_slice, slice(None))
+
+    def select_features(self, features):
+        """
+        panel with a subset of the features
+        """
+        positions = [self.features.index(feature) for feature in features]
+        panel = self._take(slice(None), slice(None))
+        panel.values = self.values[:, :, positions]
+        panel.features = list(features)
+        return panel
+
+    def _take(self, dates_index, equities_index):
+        panel = CompactPanel.__new__(CompactPanel)
+        panel.dates = self.dates[dates_index]
+        panel.equities = self.equities[equities_index]
+        panel.present = self.present[dates_index, equities_index]
+        panel.returns = self.returns[dates_index, equities_index]
+        panel.values = self.values[dates_index, equities_index]
+        panel.features = list(self.features)
+        panel.fields = {name: field[dates_index, equities_index] for name, field in self.fields.items()}
+        panel.return_col_name = self.return_col_name
+        return panel
+
+    def feature_values(self, features=None, dtype=np.float64):
+        """
+        (date x equity x feature) values of some features, upcast to dtype
+        """
+        if features is None:
+            return self.values.astype(dtype)
+        positions = [self.features.index(feature) for feature in features]
+        return self.values[:, :, positions].astype(dtype)
+
+    def bins(self, n_bins, features=None):
+        """
+        int8 (date x equity x feature) bin numbers, 0 outside any bin
+        """
+        return bins_from_values(self.feature_values(features), n_bins)
+
+    def wide(self, name=None):
+        """
+        (date x equity) dataframe of the returns (name None) or of a field, sharing the float32 array
+        """
+        array = self.returns if name is None or name == self.return_col_name else self.fields[name]
+        return pd.DataFrame(array, index=self.dates, columns=self.equities, copy=False)
+
+    def to_long(self, equity_identifier='Equity Parent', date_col_name='date'):
+        """
+        long dataframe with one row per present (date, equity)
+        """
+        date_codes, equity_codes = np.nonzero(self.present)
+        df_long = pd.DataFrame({date_col_name: self.dates[date_codes],
+                                equity_identifier: self.equities[equity_codes],
+                                self.return_col_name: self.returns[date_codes, equity_codes]})
+        for k, feature in enumerate(self.features):
+            df_long[feature] = self.values[date_codes, equity_codes, k]
+        for name, field in self.fields.items():
+            df_long[name] = field[date_codes, equity_codes]
+        return df_long
+
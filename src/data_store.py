@@ -0,0 +1,329 @@
+"""
+Columnar binary cache for the csv inputs
+
+The csv files are parsed once and stored as numpy .npy files next to a meta.json that records the
+size, modification time and hash of the source file. Later loads memory-map the arrays (no text parsing, no copy),
+so repeated runs and worker processes start quickly. The cache is rebuilt automatically when the source file
+changes: a load only stats the source file, and hashes it only if the modification time changed but not the size.
+
+Two layouts are supported:
+    long equity files (date, company, values ...), eg. data_sample_monthly.csv, data_sample_daily.csv:
+        dates.npy and equities.npy are the int coding dictionaries (code = position),
+        present.npy the boolean (date x equity) array of the rows of the csv,
+        panel_<column>.npy holds the pre-pivoted wide (date x equity) float panel of every numeric column,
+        codes_<column>.npy / labels_<column>.npy hold text columns as int32 coded panels,
+        price returns are derived from the forward filled price panel (as in the notebooks)
+    index files (Date, Open, High, ...), eg. dax.csv, dow_jones.csv:
+        dates.npy and one series_<column>.npy per numeric column
+
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .finance_functions import multiple_returns_from_levels_vec
+
+
+CACHE_VERSION = 2
+
+# price column of the bundled equity files, used to derive the returns panel
+PRICE_COLUMNS = {'data_sample_monthly.csv': 'stock_price',
+                 'data_sample_daily.csv': 'Price_USD'}
+
+PRICE_RETURNS = 'price_returns'
+
+
+def file_hash(path, block_size=1 << 20):
+    """
+    sha256 hex digest of a file's content
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_stat(path):
+    """
+    size and modification time (ns) of a file
+    """
+    stat = os.stat(path)
+    return {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+def default_cache_dir(csv_path):
+    """
+    <directory of the csv>/.cache/<file name without extension>
+    """
+    directory, file_name = os.path.split(os.path.abspath(csv_path))
+    return os.path.join(directory, '.cache', os.path.splitext(file_name)[0])
+
+
+def _read_meta(cache_dir):
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def _write_meta(cache_dir, meta):
+    with open(os.path.join(cache_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+
+def _is_valid(meta, csv_path, layout, cache_dir):
+    """
+    whether the cache matches the source file: unchanged size and modification time, or else unchanged size and
+    hash (eg. a touched or copied file), in which case the recorded modification time is updated
+    """
+    if meta is None or meta.get('version') != CACHE_VERSION or meta.get('layout') != layout:
+        return False
+
+    stat = file_stat(csv_path)
+    if meta.get('source_size') != stat['source_size']:
+        return False
+    if meta.get('source_mtime_ns') == stat['source_mtime_ns']:
+        return True
+    if meta.get('source_hash') != file_hash(csv_path):
+        return False
+
+    meta.update(stat)
+    _write_meta(cache_dir, meta)
+    return True
+
+
+def _write_cache(cache_dir, arrays, meta):
+    """
+    write arrays and meta.json into a temporary directory and move it into place
+    """
+    parent = os.path.dirname(cache_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, name + '.npy'), array, allow_pickle=False)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.rename(tmp_dir, cache_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def _load(cache_dir, name):
+    return np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r', allow_pickle=False)
+
+
+def build_equity_cache(csv_path, equity_col='company', date_col='date', price_col=None, cache_dir=None):
+    """
+    parse a long equity csv and store the coding dictionaries and wide panels
+
+    :param csv_path: path of the long csv file
+    :param equity_col: equity identifier column
+    :param date_col: date column
+    :param price_col: price column used for the derived returns panel, defaults to PRICE_COLUMNS for the bundled files
+    :param cache_dir: cache directory, defaults to default_cache_dir(csv_path)
+    :return: cache directory
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_path)
+    if price_col is None:
+        price_col = PRICE_COLUMNS.get(os.path.basename(csv_path))
+
+    # stat before reading, a change while the cache is built is caught by the next load
+    source_stat = file_stat(csv_path)
+    source_hash = file_hash(csv_path)
+
+    df = pd.read_csv(csv_path)
+    df[date_col] = pd.to_datetime(df[date_col])
+
+    date_codes, dates = pd.factorize(df[date_col], sort=True)
+    equity_codes, equities = pd.factorize(df[equity_col], sort=True)
+    shape = (len(dates), len(equities))
+
+    present = np.zeros(shape, dtype=bool)
+    present[date_codes, equity_codes] = True
+
+    arrays = {'dates': np.asarray(dates, dtype='datetime64[ns]'),
+              'equities': np.asarray(equities, dtype=str),
+              'present': present}
+    panels = []
+    text_columns = []
+
+    for col in df.columns:
+        if col in [date_col, equity_col]:
+            continue
+        panel_values = df[col]
+        if pd.api.types.is_numeric_dtype(panel_values):
+            panel = np.full(shape, np.nan)
+            panel[date_codes, equity_codes] = panel_values.to_numpy(dtype=float, na_value=np.nan)
+            arrays['panel_' + col] = panel
+            panels.append(col)
+        else:
+            codes, labels = pd.factorize(panel_values)
+            panel = np.full(shape, -1, dtype=np.int32)
+            panel[date_codes, equity_codes] = codes
+            arrays['codes_' + col] = panel
+            arrays['labels_' + col] = np.asarray(labels, dtype=str)
+            text_columns.append(col)
+
+    if price_col is not None:
+        df_prices = pd.DataFrame(arrays['panel_' + price_col])
+        arrays['panel_' + PRICE_RETURNS] = multiple_returns_from_levels_vec(df_prices.ffill()).values
+        panels.append(PRICE_RETURNS)
+
+    meta = {'version': CACHE_VERSION,
+            'layout': 'equity',
+            'source': os.path.abspath(csv_path),
+            'source_hash': source_hash,
+            'source_size': source_stat['source_size'],
+            'source_mtime_ns': source_stat['source_mtime_ns'],
+            'date_col': date_col,
+            'equity_col': equity_col,
+            'price_col': price_col,
+            'panels': panels,
+            'text_columns': text_columns}
+
+    _write_cache(cache_dir, arrays, meta)
+    return cache_dir
+
+
+def load_equity_panels(csv_path, equity_col='company', date_col='date', price_col=None, cache_dir=None,
+                       fields=None):
+    """
+    memory-mapped wide panels of a long equity csv, building the cache first if it is missing or stale
+
+    :param csv_path: path of the long csv file
+    :param fields: list of panel names to load, defaults to all; includes PRICE_RETURNS if a price column is known
+    :return: dict with 'dates' (DatetimeIndex, position = date code), 'equities' (Index, position = equity code),
+             'present' read-only memory mapped boolean (date x equity) array of the rows of the csv,
+             'panels' dict of wide data frames (date x equity) backed by read-only memory maps and
+             'text' dict of wide data frames for text columns
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_path)
+
+    meta = _read_meta(cache_dir)
+    if price_col is None and meta is not None:
+        price_col = meta.get('price_col')
+    if not _is_valid(meta, csv_path, 'equity', cache_dir) or meta['date_col'] != date_col or \
+            meta['equity_col'] != equity_col or meta['price_col'] != price_col:
+        build_equity_cache(csv_path, equity_col, date_col, price_col, cache_dir)
+        meta = _read_meta(cache_dir)
+
+    dates = pd.DatetimeIndex(np.asarray(_load(cache_dir, 'dates')), name=date_col)
+    equities = pd.Index(np.asarray(_load(cache_dir, 'equities')), name=equity_col)
+
+    load_all = fields is None
+    if load_all:
+        fields = meta['panels']
+
+    panels = {field: pd.DataFrame(_load(cache_dir, 'panel_' + field), index=dates, columns=equities, copy=False)
+              for field in fields if field in meta['panels']}
+
+    text = {}
+    for col in meta['text_columns']:
+        if load_all or col in fields:
+            codes = np.asarray(_load(cache_dir, 'codes_' + col))
+            labels = np.append(np.asarray(_load(cache_dir, 'labels_' + col), dtype=object), None)
+            text[col] = pd.DataFrame(labels[codes], index=dates, columns=equities)
+
+    return {'dates': dates, 'equities': equities, 'present': _load(cache_dir, 'present'), 'panels': panels,
+            'text': text}
+
+
+def write_equity_panels(cache_dir, named_panels):
+    """
+    add (date x equity) float panels to an existing equity cache, eg. generated features, one file at a time;
+    the panels must be on the date and equity axes of the cache. They are dropped when the cache is rebuilt.
+
+    :param cache_dir: equity cache directory
+    :param named_panels: iterable of (name, array) pairs
+    :return: list of the written names
+    """
+    meta = _read_meta(cache_dir)
+    assert meta is not None and meta.get('layout') == 'equity', 'no equity cache in ' + cache_dir
+    shape = (len(_load(cache_dir, 'dates')), len(_load(cache_dir, 'equities')))
+
+    names = []
+    for name, panel in named_panels:
+        panel = np.asarray(panel, dtype=float)
+        assert panel.shape == shape, 'panel ' + name + ' does not match the cache axes'
+        tmp_path = os.path.join(cache_dir, 'panel_' + name + '.tmp.npy')
+        np.save(tmp_path, panel, allow_pickle=False)
+        os.replace(tmp_path, os.path.join(cache_dir, 'panel_' + name + '.npy'))
+        names.append(name)
+
+    meta['panels'] = meta['panels'] + [name for name in names if name not in meta['panels']]
+    _write_meta(cache_dir, meta)
+
+    return names
+
+
+def build_index_cache(csv_path, date_col='Date', cache_dir=None):
+    """
+    parse an index history csv and store the dates and one array per numeric column
+
+    :param csv_path: path of the csv file
+    :param date_col: date column
+    :param cache_dir: cache directory, defaults to default_cache_dir(csv_path)
+    :return: cache directory
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_path)
+
+    # stat before reading, a change while the cache is built is caught by the next load
+    source_stat = file_stat(csv_path)
+    source_hash = file_hash(csv_path)
+
+    df = pd.read_csv(csv_path)
+    df[date_col] = pd.to_datetime(df[date_col])
+    df.sort_values(date_col, inplace=True)
+
+    arrays = {'dates': df[date_col].to_numpy(dtype='datetime64[ns]')}
+    columns = []
+    for col in df.columns:
+        if col != date_col and pd.api.types.is_numeric_dtype(df[col]):
+            arrays['series_' + col] = df[col].to_numpy(dtype=float, na_value=np.nan)
+            columns.append(col)
+
+    meta = {'version': CACHE_VERSION,
+            'layout': 'index',
+            'source': os.path.abspath(csv_path),
+            'source_hash': source_hash,
+            'source_size': source_stat['source_size'],
+            'source_mtime_ns': source_stat['source_mtime_ns'],
+            'date_col': date_col,
+            'columns': columns}
+
+    _write_cache(cache_dir, arrays, meta)
+    return cache_dir
+
+
+def load_index_history(csv_path, date_col='Date', cache_dir=None):
+    """
+    index history as a date indexed data frame, building the cache first if it is missing or stale
+    each column is backed by a read-only memory map
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_path)
+
+    meta = _read_meta(cache_dir)
+    if not _is_valid(meta, csv_path, 'index', cache_dir) or meta['date_col'] != date_col:
+        build_index_cache(csv_path, date_col, cache_dir)
+        meta = _read_meta(cache_dir)
+
+    dates = pd.DatetimeIndex(np.asarray(_load(cache_dir, 'dates')), name=date_col)
+    data = {col: _load(cache_dir, 'series_' + col) for col in meta['columns']}
+
+    return pd.DataFrame(data, index=dates, columns=meta['columns'], copy=False)
@@ -1,6 +1,16 @@
+import logging
+import numpy as np
 import pandas as pd
 import warnings
 
+from .compact_panel import CompactPanel
+from .instrumentation import NULL_INSTRUMENTATION
+from .panel_backtesting import panel_codes, scatter_to_panel, panel_backtest, panel_results_to_frame
+from .parallel_backtesting import parallel_panel_backtest
+
+
+logger = logging.getLogger(__name__)
+
 
 def add_bins_col_to_rank_df(df_feature,
                             n_bins,
@@ -81,9 +91,8 @@ def compute_date_level_metrics(df_detail,
 
     df_agg['spread'] = (df_agg[highest_bin_avg_col] - df_agg[lowest_bin_avg_col])*100
     corr_object = df_detail.groupby(date_col_name)[[return_col_name, feature]].corr(method=corr_method)
-    corr_series = corr_object.reset_index(1, drop=True)[return_col_name]
-    corr_series = corr_series[~corr_series.eq(1)]
-    df_agg['ic_cs'] = corr_series
+    # off-diagonal element, so that perfect correlations are kept
+    df_agg['ic_cs'] = corr_object.xs(feature, level=1)[return_col_name]
 
     return df_agg
 
@@ -130,6 +139,93 @@ def custom_formatwarning(message, category, filename, lineno, line=''):
     return str(message) + '\n'
 
 
+def warn_backtest_feature(feature,
+                          insufficient_bins_dates,
+                          bin_lowest_bad_dates,
+                          bin_highest_bad_dates,
+                          drop_months_outside_of_threshold=False):
+    """
+    Description: This function issues the back testing warnings for a feature: dates with insufficient bins,
+                 dates where the top or bottom portfolio deviates from the items per bin threshold,
+                 and the dates dropped because of it.
+
+    :param feature:Type string. Name of feature.
+    :param insufficient_bins_dates:Type list. formatted dates with insufficient bins.
+    :param bin_lowest_bad_dates:Type list. formatted dates where bin 1 deviates from the threshold.
+    :param bin_highest_bad_dates:Type list. formatted dates where the last bin deviates from the threshold.
+    :param drop_months_outside_of_threshold:Type boolean. whether the deviating months were dropped.
+    """
+
+    if len(insufficient_bins_dates) > 0:
+
+        warnings.warn('\nInsufficient bins warning:\nFeature: ' + feature+'\n'+'\n' +
+                         'Months with insufficient bins:' + str(insufficient_bins_dates)+ '\n' + '\n' +
+                         'These months are excluded from the back testing computation')
+
+    if len(bin_lowest_bad_dates) > 0 or len(bin_highest_bad_dates) > 0:
+
+        warnings.warn('\nDeviation from threshold warning:\nFeature: ' + feature+'\n'+'\n' +
+                        'Top Portfolio - Months which deviate from threshold: '+str(bin_highest_bad_dates)+'\n'+'\n' +
+                        'Bottom Portfolio - Months which deviate from threshold: '+str(bin_lowest_bad_dates))
+
+        if drop_months_outside_of_threshold:
+            months_to_drop = bin_lowest_bad_dates + bin_highest_bad_dates
+
+            warnings.warn('\nMonths dropped warning:\nFeature: ' + feature + '\n'+'\n' +
+                            'Months: '+str(months_to_drop) +' will be dropped from computation')
+
+
+def _serial_panel_backtest(df_long,
+                           features,
+                           return_col_name,
+                           equity_identifier,
+                           date_col_name,
+                           feature_chunk_size,
+                           backtest_kwargs,
+                           instrumentation=NULL_INSTRUMENTATION):
+    """
+    Generator over (chunk_features, dates, chunk_results) for the features back tested chunk by chunk in this process.
+    """
+
+    with instrumentation.stage('panel'):
+        date_codes, equity_codes, dates, equities = panel_codes(df_long, equity_identifier, date_col_name)
+
+        present = np.zeros((len(dates), len(equities)), dtype=bool)
+        present[date_codes, equity_codes] = True
+
+        returns = scatter_to_panel(date_codes, equity_codes, len(dates), len(equities),
+                                   df_long[return_col_name].to_numpy(dtype=float, na_value=np.nan))
+
+    for chunk_start in range(0, len(features), feature_chunk_size):
+
+        chunk_features = features[chunk_start:chunk_start + feature_chunk_size]
+
+        with instrumentation.stage('panel', len(chunk_features)):
+            values = scatter_to_panel(date_codes, equity_codes, len(dates), len(equities),
+                                      df_long[chunk_features].to_numpy(dtype=float, na_value=np.nan))
+
+        yield chunk_features, dates, panel_backtest(dates, present, returns, values,
+                                                    instrumentation=instrumentation, **backtest_kwargs)
+
+
+def _compact_panel_backtest(panel, features, feature_chunk_size, backtest_kwargs, instrumentation=NULL_INSTRUMENTATION):
+    """
+    Generator over (chunk_features, dates, chunk_results) for a CompactPanel, upcasting one chunk at a time.
+    """
+
+    returns = panel.returns.astype(np.float64)
+
+    for chunk_start in range(0, len(features), feature_chunk_size):
+
+        chunk_features = features[chunk_start:chunk_start + feature_chunk_size]
+
+        with instrumentation.stage('panel', len(chunk_features)):
+            values = panel.feature_values(chunk_features)
+
+        yield chunk_features, panel.dates, panel_backtest(panel.dates, panel.present, returns, values,
+                                                          instrumentation=instrumentation, **backtest_kwargs)
+
+
 def get_detail_backtest_results(input_df,
                                 features,
                                 return_col_name='returns',
@@ -139,10 +235,19 @@ def get_detail_backtest_results(input_df,
                                 bin_labels=None,
                                 corr_method='spearman',
                                 items_per_bin_deviation_threshold=1,
-                                drop_months_outside_of_threshold=False):
+                                drop_months_outside_of_threshold=False,
+                                feature_chunk_size=250,
+                                n_jobs=None,
+                                executor=None,
+                                instrumentation=None):
     """
     Description: This function generates the back testing results for a list of features.
 
+                 Features are processed in chunks of feature_chunk_size on a date x equity x feature panel,
+                 see panel_backtesting.panel_backtest.
+                 Setting n_jobs or executor shards the features across worker processes,
+                 see parallel_backtesting.parallel_panel_backtest. Warnings are issued here in sorted feature order.
+
                  This procedure does not handle subsetting for a specified date range.
                  Subset to a specified date range needs to be done prior to passing the input dataframe.
 
@@ -158,7 +263,8 @@ def get_detail_backtest_results(input_df,
                  drop_months_outside_of_threshold can be set to True, if the months deviating from the
                  above threshold should be excluded from back testing.
 
-    :param input_df: Type pandas dataframe. long format dataframe.
+    :param input_df: Type pandas dataframe. long format dataframe, or a compact_panel.CompactPanel
+                     (back tested in this process, the column name arguments are not used).
     :param features: Type list. list of features for which backtesting needs to be perforrmed. These should correspond
                      to the names of the columns in the df_long dataframe.
     :param return_col_name: Type str. Name of the return column.
@@ -171,6 +277,13 @@ def get_detail_backtest_results(input_df,
     :param items_per_bin_deviation_threshold:Type int. Permissible deviation from the expected number of items per bin.
     :param drop_months_outside_of_threshold:Type boolean. Decision to drop months that break deviate beyond the acceptable
                                                           items_per_bin_deviation_threshold.
+    :param feature_chunk_size:Type int. number of features back tested together in one panel.
+    :param n_jobs:Type int. number of worker processes for the parallel mode. None runs in this process.
+    :param executor:Type concurrent.futures.Executor. optional executor for the parallel mode, eg. a shared
+                    ProcessPoolExecutor.
+    :param instrumentation:Type instrumentation.BacktestInstrumentation. optional stage timers, per feature counters
+                           (rows in, rows dropped, dates dropped), progress events and profiling.
+                           Progress is otherwise only logged (logger of this module, level INFO).
 
     :return:Type pandas dataframe. detail backtesting results for each period
     """
@@ -178,103 +291,80 @@ def get_detail_backtest_results(input_df,
     if bin_labels is None:
         bin_labels = ['Q' + str(i + 1) for i in range(n_bins)]
 
-    df_long = input_df.copy()
-    long_cols = list(df_long.columns)
+    df_long = input_df
+    is_panel = isinstance(input_df, CompactPanel)
 
-    if date_col_name not in long_cols:
+    if is_panel:
+        return_col_name = input_df.return_col_name
+    elif date_col_name not in list(df_long.columns):
         df_long = df_long.reset_index()
         df_long.rename(columns={'index': 'date'}, inplace=True)
 
-    if return_col_name in features:
-        features.remove(return_col_name)
+    if instrumentation is None:
+        instrumentation = NULL_INSTRUMENTATION
 
-    detail_results = []
-    features = sorted(features)
-    feature_cnt = 0
+    features = sorted(feature for feature in features if feature != return_col_name)
     total_features = len(features)
-    print('Total features for processing: ' + str(total_features))
+    logger.info('Total features for processing: ' + str(total_features))
+    instrumentation.event('start', total_features=total_features)
 
     warnings.formatwarning = custom_formatwarning
 
-    for feature in features:
-
-        category = feature.split('_bshift')[0]
-        feature_cols = [equity_identifier, date_col_name, return_col_name, feature]
-
-        df_feature_detail = df_long[feature_cols].copy()
-
-        df_feature_detail = get_ranks(df_feature_detail,
-                                      date_col_name,
-                                      feature)
-
-        df_feature_detail = add_bins_col_to_rank_df(df_feature_detail,
-                                                    n_bins)
-
-        df_bin_check = pd.DataFrame(df_feature_detail.groupby(date_col_name)['bin_no'].max())
-        bin_check_mask = df_bin_check['bin_no'] != n_bins
-        insufficient_bins_dates = [item.date().strftime("%Y-%m-%d") for item in df_bin_check[bin_check_mask].index.tolist()]
-
-        if len(insufficient_bins_dates) > 0:
+    backtest_kwargs = {'n_bins': n_bins,
+                       'corr_method': corr_method,
+                       'items_per_bin_deviation_threshold': items_per_bin_deviation_threshold,
+                       'drop_months_outside_of_threshold': drop_months_outside_of_threshold}
+
+    if is_panel:
+        chunks = _compact_panel_backtest(input_df, features, feature_chunk_size, backtest_kwargs, instrumentation)
+    elif n_jobs is None and executor is None:
+        chunks = _serial_panel_backtest(df_long,
+                                        features,
+                                        return_col_name,
+                                        equity_identifier,
+                                        date_col_name,
+                                        feature_chunk_size,
+                                        backtest_kwargs,
+                                        instrumentation)
+    else:
+        chunks = parallel_panel_backtest(df_long,
+                                         features,
+                                         return_col_name,
+                                         equity_identifier,
+                                         date_col_name,
+                                         n_jobs=n_jobs,
+                                         executor=executor,
+                                         feature_chunk_size=feature_chunk_size,
+                                         instrumentation=instrumentation,
+                                         **backtest_kwargs)
 
-            warnings.warn('\nInsufficient bins warning:\nFeature: ' + feature+'\n'+'\n' +
-                             'Months with insufficient bins:' + str(insufficient_bins_dates)+ '\n' + '\n' +
-                             'These months are excluded from the back testing computation')
-
-            df_feature_detail = df_feature_detail[~df_feature_detail[date_col_name].isin(insufficient_bins_dates)]
-            print(df_feature_detail.shape)
-
-        total_no_of_items = df_feature_detail[equity_identifier].unique().shape[0]
-        expected_no_of_items_per_bin = total_no_of_items/n_bins
-
-        mask_bin_lowest = df_feature_detail['bin_no'] == 1
-        mask_bin_highest = df_feature_detail['bin_no'] == n_bins
-
-        df_bin_lowest = df_feature_detail[mask_bin_lowest].copy()
-        df_bin_highest = df_feature_detail[mask_bin_highest].copy()
-
-        bin_lowest_bad_dates = get_dates_deviating_from_threshold(df_bin_lowest,
-                                                                  date_col_name,
-                                                                  equity_identifier,
-                                                                  items_per_bin_deviation_threshold,
-                                                                  expected_no_of_items_per_bin)
-
-        bin_highest_bad_dates = get_dates_deviating_from_threshold(df_bin_highest,
-                                                                   date_col_name,
-                                                                   equity_identifier,
-                                                                   items_per_bin_deviation_threshold,
-                                                                   expected_no_of_items_per_bin)
-
-        if len(bin_lowest_bad_dates) > 0 or len(bin_highest_bad_dates) > 0:
-
-            warnings.warn('\nDeviation from threshold warning:\nFeature: ' + feature+'\n'+'\n' +
-                            'Top Portfolio - Months which deviate from threshold: '+str(bin_highest_bad_dates)+'\n'+'\n' +
-                            'Bottom Portfolio - Months which deviate from threshold: '+str(bin_lowest_bad_dates))
-
-            if drop_months_outside_of_threshold:
-                months_to_drop = bin_lowest_bad_dates + bin_highest_bad_dates
-
-                warnings.warn('\nMonths dropped warning:\nFeature: ' + feature + '\n'+'\n' +
-                                'Months: '+str(months_to_drop) +' will be dropped from computation')
-
-                df_feature_detail = df_feature_detail[~df_feature_detail[date_col_name].isin(months_to_drop)]
+    detail_results = []
+    feature_cnt = 0
 
-        df_feature_detail_agg = compute_date_level_metrics(df_feature_detail,
-                                                           bin_labels,
-                                                           date_col_name,
-                                                           return_col_name,
-                                                           feature,
-                                                           corr_method)
+    for chunk_features, dates, chunk_results in chunks:
 
-        df_feature_detail_agg['feature'] = feature
+        for k, feature in enumerate(chunk_features):
+            warn_backtest_feature(feature,
+                                  chunk_results['insufficient_bins_dates'][k],
+                                  chunk_results['bin_lowest_bad_dates'][k],
+                                  chunk_results['bin_highest_bad_dates'][k],
+                                  drop_months_outside_of_threshold)
 
-        df_feature_detail_agg['category'] = category
+            if instrumentation.enabled:
+                instrumentation.event('feature',
+                                      feature=feature,
+                                      rows_in=int(chunk_results['rows_in'][k]),
+                                      rows_dropped=int(chunk_results['rows_dropped'][k]),
+                                      dates_dropped=int(chunk_results['dates_dropped'][k]))
 
-        detail_results.append(df_feature_detail_agg)
+            feature_cnt += 1
 
-        feature_cnt += 1
+            if feature_cnt % 100 == 0:
+                logger.info(str(feature_cnt) + ' features completed')
+                instrumentation.event('progress', features_completed=feature_cnt, total_features=total_features)
 
-        if feature_cnt % 100 == 0:
-            print(str(feature_cnt) + ' features completed')
+        with instrumentation.stage('frame', len(chunk_features)):
+            detail_results.append(panel_results_to_frame(dates, chunk_features, chunk_results, bin_labels))
 
     detail_results_df = pd.concat(detail_results)
 
@@ -286,13 +376,15 @@ def perform_aggregation_across_time(detail_results):
     Description: This function takes as input the monthly level back testing results, and
                  returns a data frame with the results aggregated across time.
 
+                 Columns in cols_for_std that are not present (eg. Qe, mc_return when not merged) are skipped.
+
     :param detail_results: Type pandas dataframe. detail results that need to be aggregated.
     :return:Type pandas dataframe. Aggregated dataframe.
     """
     out_df = pd.DataFrame()
 
     all_cols = list(detail_results.columns)
-    cols_for_std = ['spread', 'ic_cs', 'Qe', 'mc_return']
+    cols_for_std = [col for col in ['spread', 'ic_cs', 'Qe', 'mc_return'] if col in all_cols]
     key_cols = ['feature', 'category']
     cols_for_avg = sorted(list(set(all_cols) - set(cols_for_std) - set(key_cols)))
 
@@ -0,0 +1,203 @@
+"""
+Generation of lagged (_bshift) features on wide (date x equity) panels.
+
+Every base signal is held once as a (date x equity) array; lags, rolling window transforms and ratios are computed
+for all equities at once along the date axis, and each generated feature allocates only its own (date x equity)
+array. Features are produced one at a time by iter_feature_panels, so they can be streamed into the columnar
+cache (generate_features_to_cache) or gathered into the long dataframe (generate_features_long).
+
+Names follow the convention the back test relies on (category = name before '_bshift'):
+    <col>_bshift<lag>                      lag of a base signal
+    <num>_over_<den>_bshift<lag>           ratio, eg. NetIncome_over_Revenues_bshift1
+    <col>_mean<w>_bshift<lag>              rolling mean over w dates
+    <col>_zscore<w>_bshift<lag>            (value - rolling mean) / rolling std over w dates
+    <col>_mom<w>_bshift<lag>               value / value w dates earlier - 1
+
+Lags are in dates of the panel: on a regular monthly panel a lag of 1 is the previous month. Unlike a per company
+groupby().shift(), a missing month is not skipped over.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from .data_store import load_equity_panels, default_cache_dir, write_equity_panels
+from .panel_backtesting import panel_codes, scatter_to_panel
+from .rolling_metrics import window_moments
+
+
+TRANSFORMS = ['mean', 'zscore', 'mom']
+
+
+def shift_panel(panel, lag):
+    """
+    (date x equity) panel shifted by lag dates, NaN for the first lag dates
+    """
+    if lag == 0:
+        return panel
+    shifted = np.full(panel.shape, np.nan)
+    shifted[lag:] = panel[:-lag]
+    return shifted
+
+
+def rolling_transform(panel, transform, window):
+    """
+    Description: This function applies a rolling window transform along the date axis for all equities at once.
+                 Windows with missing values give NaN (min_periods = window).
+
+    :param panel:Type numpy array. (date x equity) values.
+    :param transform:Type str. 'mean', 'zscore' or 'mom'.
+    :param window:Type int. number of dates in the window.
+    :return:Type numpy array. (date x equity) transformed values.
+    """
+    assert transform in TRANSFORMS, 'not implemented'
+
+    if transform == 'mom':
+        with np.errstate(all='ignore'):
+            previous = shift_panel(panel, window)
+            return np.where(previous != 0, panel / previous - 1.0, np.nan)
+
+    _, mean, std = window_moments(panel, window, min_periods=window)
+    if transform == 'mean':
+        return mean
+
+    with np.errstate(all='ignore'):
+        return np.where(std > 0, (panel - mean) / std, np.nan)
+
+
+def iter_feature_panels(panels,
+                        base_cols=None,
+                        lags=(1,),
+                        ratios=(),
+                        windows=(),
+                        transforms=TRANSFORMS):
+    """
+    Description: This function generates the lagged features one at a time.
+
+    :param panels:Type dict. name -> (date x equity) dataframe or array, eg. load_equity_panels(csv_path)['panels'].
+    :param base_cols:Type list. base signals that are lagged and transformed, defaults to all panels.
+    :param lags:Type list. lags in number of dates.
+    :param ratios:Type list. (numerator, denominator) pairs, eg. [('NetIncome', 'Revenues'), ('COGS', 'Revenues')].
+    :param windows:Type list. rolling window lengths in number of dates.
+    :param transforms:Type list. rolling transforms, any of 'mean', 'zscore' and 'mom'.
+    :return:Type generator. (feature name, (date x equity) float array) pairs.
+    """
+
+    if base_cols is None:
+        base_cols = list(panels.keys())
+
+    def unlagged():
+        for col in base_cols:
+            yield col, np.asarray(panels[col], dtype=float)
+        for numerator, denominator in ratios:
+            num = np.asarray(panels[numerator], dtype=float)
+            den = np.asarray(panels[denominator], dtype=float)
+            with np.errstate(all='ignore'):
+                yield numerator + '_over_' + denominator, np.where(den != 0, num / den, np.nan)
+        for col in base_cols:
+            base = np.asarray(panels[col], dtype=float)
+            for window in windows:
+                for transform in transforms:
+                    yield col + '_' + transform + str(window), rolling_transform(base, transform, window)
+
+    for name, panel in unlagged():
+        for lag in lags:
+            yield name + '_bshift' + str(lag), shift_panel(panel, lag)
+
+
+def long_to_wide_panels(df_long, cols, equity_identifier='Equity Parent', date_col_name='date'):
+    """
+    Description: This function pivots columns of a long dataframe into (date x equity) arrays.
+
+    :param df_long:Type pandas dataframe. long format dataframe with date and equity identifier columns.
+    :param cols:Type list. columns to pivot.
+    :param equity_identifier:Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :return:Type tuple. (date_codes, equity_codes, panels) with the row codes of df_long and a dict of arrays.
+    """
+
+    date_codes, equity_codes, dates, equities = panel_codes(df_long, equity_identifier, date_col_name)
+    panels = {col: scatter_to_panel(date_codes, equity_codes, len(dates), len(equities),
+                                    df_long[col].to_numpy(dtype=float, na_value=np.nan))
+              for col in cols}
+
+    return date_codes, equity_codes, panels
+
+
+def generate_features_long(input_df,
+                           base_cols,
+                           lags=(1,),
+                           ratios=(),
+                           windows=(),
+                           transforms=TRANSFORMS,
+                           equity_identifier='Equity Parent',
+                           date_col_name='date'):
+    """
+    Description: This function adds the generated features as columns of the long dataframe. The rows of
+                 input_df are kept in their order; the new columns are gathered from the panels and added in one
+                 concat, without a copy of the frame per feature.
+
+    :param input_df:Type pandas dataframe. long format dataframe (date column or date index).
+    :param base_cols:Type list. base signals that are lagged and transformed.
+    :param lags:Type list. lags in number of dates.
+    :param ratios:Type list. (numerator, denominator) pairs.
+    :param windows:Type list. rolling window lengths in number of dates.
+    :param transforms:Type list. rolling transforms, any of 'mean', 'zscore' and 'mom'.
+    :param equity_identifier:Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :return:Type pandas dataframe. input_df with the generated feature columns.
+    """
+
+    df_long = input_df
+    date_as_index = date_col_name not in list(df_long.columns)
+    if date_as_index:
+        df_long = df_long.reset_index()
+        df_long.rename(columns={'index': 'date'}, inplace=True)
+
+    ratio_cols = [col for pair in ratios for col in pair]
+    cols = list(dict.fromkeys(list(base_cols) + ratio_cols))
+    date_codes, equity_codes, panels = long_to_wide_panels(df_long, cols, equity_identifier, date_col_name)
+
+    new_cols = {name: panel[date_codes, equity_codes]
+                for name, panel in iter_feature_panels(panels, base_cols, lags, ratios, windows, transforms)}
+
+    df_out = pd.concat([df_long, pd.DataFrame(new_cols, index=df_long.index)], axis=1)
+    if date_as_index:
+        df_out = df_out.set_index(date_col_name)
+
+    return df_out
+
+
+def generate_features_to_cache(csv_path,
+                               base_cols,
+                               lags=(1,),
+                               ratios=(),
+                               windows=(),
+                               transforms=TRANSFORMS,
+                               equity_col='company',
+                               date_col='date',
+                               cache_dir=None):
+    """
+    Description: This function generates the features from the columnar cache of a long csv and writes each one
+                 to the cache as soon as it is computed, so they can be back tested out of core
+                 (out_of_core.backtest_to_disk) or loaded with load_equity_panels.
+
+    :param csv_path:Type str. path of the long csv file.
+    :param base_cols:Type list. base signals that are lagged and transformed.
+    :param lags:Type list. lags in number of dates.
+    :param ratios:Type list. (numerator, denominator) pairs.
+    :param windows:Type list. rolling window lengths in number of dates.
+    :param transforms:Type list. rolling transforms, any of 'mean', 'zscore' and 'mom'.
+    :param equity_col:Type str. equity identifier column.
+    :param date_col:Type str. date column.
+    :param cache_dir:Type str. cache directory, defaults to data_store.default_cache_dir(csv_path).
+    :return:Type list. names of the generated features.
+    """
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_path)
+
+    source = load_equity_panels(csv_path, equity_col=equity_col, date_col=date_col, cache_dir=cache_dir)
+
+    return write_equity_panels(cache_dir,
+                               iter_feature_panels(source['panels'], base_cols, lags, ratios, windows, transforms))
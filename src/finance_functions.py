@@ -44,10 +44,27 @@ def df_restrict_dates(df_in, start_date, end_date, multi_index=False, date_name=
 
 
 def levels_from_returns(df_in, infield='return', outfield='level', starting_level=1, frequency='daily',
-                        initial_date=None):
+                        initial_date=None, nan_policy='propagate'):
+    """
+    levels from returns, with an additional row for the starting level one period before the first date
+
+    :param df_in: pandas data frame with returns, index in datetime format and sorted ascending
+    :param infield: name of the return column, or list of return columns to compute all levels in one call
+    :param outfield: name of the level column, or list of names (one per infield); for a list of infields the
+                     default is to keep the column names
+    :param nan_policy: see compute_levels
+    :return: data frame with level column(s)
+    """
     assert frequency in ['daily', 'monthly', 'quarterly'], 'not implemented'
     start_date = df_in.index.min()
-    df_out = df_in[[infield]].copy()
+
+    if isinstance(infield, str):
+        infields = [infield]
+        outfields = [outfield]
+    else:
+        infields = list(infield)
+        outfields = infields if outfield == 'level' else list(outfield)
+        assert len(outfields) == len(infields), 'one outfield per infield needed'
 
     if initial_date is None:
         if frequency == 'daily':
@@ -57,52 +74,98 @@ def levels_from_returns(df_in, infield='return', outfield='level', starting_leve
         if frequency == 'quarterly':
             initial_date = start_date + relativedelta.relativedelta(months=-3)
 
-    df_out.loc[initial_date] = starting_level
+    levels = compute_levels(starting_level, df_in[infields].values, nan_policy=nan_policy)
+    index = pd.Index([initial_date]).append(df_in.index)
+    index.name = df_in.index.name
+    df_out = pd.DataFrame(levels, index=index, columns=outfields)
     df_out.sort_index(ascending=True, inplace=True)
-    df_out[outfield + '_temp'] = compute_levels(starting_level, df_in[infield].values)
-    df_out.drop(infield, axis=1, inplace=True)
-    df_out.rename(columns={outfield + '_temp': outfield}, inplace=True)
     return df_out
 
-def monthly_returns(df_in, field='Close', out_name='monthly_return', day_of_month='last'):
-    assert day_of_month in ['first', 'last'], 'not implemented'
-    start_date = df_in.index.min()
-    end_date = df_in.index.max()
-
-    shift_start_date = start_date + relativedelta.relativedelta(months=1)
-    first_date_returns = datetime.datetime(shift_start_date.year, shift_start_date.month, 1)
-    last_date_returns = datetime.datetime(end_date.year, end_date.month, 1)
-
-    date = first_date_returns
-    l_monthly_returns = []
-    l_dates = []
-    while date <= last_date_returns:
-        this_year = date.year
-        this_month = date.month
-        final_day = find_day_in_month(df_in.index, this_year, this_month, which=day_of_month)
-        mask = df_in.index == final_day
-        final_val = df_in[mask][field].iloc[0]
-        prev_date = date + relativedelta.relativedelta(months=-1)
-        prev_year = prev_date.year
-        prev_month = prev_date.month
-        initial_day = find_day_in_month(df_in.index, prev_year, prev_month, which=day_of_month)
-        mask = df_in.index == initial_day
-        prev_val = df_in[mask][field].iloc[0]
-        #print(prev_initial_day, prev_val)
-        if abs(prev_val) > 0.0:
-            monthly_return = (final_val - prev_val) / prev_val
-        else:
-            monthly_return = np.nan
-        l_monthly_returns.append(monthly_return)
-        l_dates.append(date)
-        date += relativedelta.relativedelta(months=1)
-
-    df_out = pd.DataFrame({out_name: l_monthly_returns}, index=l_dates)
+PERIOD_FREQUENCIES = {'weekly': 'W', 'monthly': 'M', 'quarterly': 'Q'}
+
+
+def period_returns(df_in, field='Close', out_name=None, day_of_period='last', period='monthly'):
+    """
+    period returns from the value on the first or last available day of each period, in a single pass
+
+    the return for a period compares the chosen day of the period with the chosen day of the previous period;
+    periods without any data give NaN returns, as do zero or NaN previous values
+
+    :param df_in: pandas data frame, index must be in datetime format
+    :param field: column name, list of column names or None for all columns
+    :param out_name: name of the output column if field is a single column, defaults to field
+    :param day_of_period: 'first' or 'last' available day of the period
+    :param period: 'weekly', 'monthly' or 'quarterly'
+    :return: data frame of returns indexed by the first calendar day of each period, from the second period on
+    """
+    assert day_of_period in ['first', 'last'], 'not implemented'
+    assert period in PERIOD_FREQUENCIES, 'not implemented'
+
+    if field is None:
+        fields = list(df_in.columns)
+    elif isinstance(field, str):
+        fields = [field]
+    else:
+        fields = list(field)
+
+    df = df_in[fields].sort_index()
+    periods = df.index.to_period(PERIOD_FREQUENCIES[period])
+
+    # position of the first/last row of each run of equal periods
+    new_period = np.ones(len(periods), dtype=bool)
+    new_period[1:] = periods[1:] != periods[:-1]
+    if day_of_period == 'first':
+        positions = np.flatnonzero(new_period)
+    else:
+        positions = np.append(np.flatnonzero(new_period)[1:] - 1, len(periods) - 1)
+
+    all_periods = pd.period_range(periods[0], periods[-1], freq=periods.freq)
+    values = np.full((len(all_periods), len(fields)), np.nan)
+    values[all_periods.get_indexer(periods[positions])] = df.values[positions].astype(float)
+
+    final_val = values[1:]
+    prev_val = values[:-1]
+    with np.errstate(all='ignore'):
+        returns = np.where(np.abs(prev_val) > 0.0, (final_val - prev_val) / prev_val, np.nan)
+
+    if isinstance(field, str) and out_name is not None:
+        fields = [out_name]
+
+    df_out = pd.DataFrame(returns, index=all_periods[1:].start_time, columns=fields)
     df_out.index.name = df_in.index.name
     return df_out
 
-def compute_levels(l0, returns):
-    levels = [l0]
-    for k in range(len(returns)):
-        levels.append(levels[k]*(1.0 + returns[k]))
-    return np.array(levels)
+
+def monthly_returns(df_in, field='Close', out_name='monthly_return', day_of_month='last'):
+    """
+    monthly returns, see period_returns; field can also be a list of columns or None for all columns
+    """
+    return period_returns(df_in, field=field, out_name=out_name, day_of_period=day_of_month, period='monthly')
+
+
+def compute_levels(l0, returns, nan_policy='propagate'):
+    """
+    levels from returns by cumulative product, levels[0] = l0 and levels[k+1] = levels[k] * (1 + returns[k])
+    the multiplications are done in the same order as the step by step recursion
+
+    :param l0: starting level, scalar or one value per column
+    :param returns: 1-d array of returns, or 2-d array (dates x columns) to compute many level series at once
+    :param nan_policy: 'propagate': a NaN return makes all later levels NaN (as the recursion does),
+                       'zero': NaN returns are treated as zero returns, i.e. the level is carried forward,
+                       'raise': NaN returns are not allowed
+    :return: numpy array with one more row than returns
+    """
+    assert nan_policy in ['propagate', 'zero', 'raise'], 'not implemented'
+
+    returns = np.asarray(returns, dtype=float)
+    nan_mask = np.isnan(returns)
+    if nan_policy == 'raise':
+        assert not nan_mask.any(), 'NaN in returns'
+    if nan_policy == 'zero':
+        returns = np.where(nan_mask, 0.0, returns)
+
+    factors = np.empty((returns.shape[0] + 1,) + returns.shape[1:])
+    factors[0] = l0
+    factors[1:] = 1.0 + returns
+
+    return np.cumprod(factors, axis=0)
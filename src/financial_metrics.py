@@ -11,7 +11,12 @@ import dateutil.relativedelta as relativedelta
 import pandas as pd
 import numpy as np
 
-from .finance_functions import levels_from_returns, monthly_returns
+from .compact_panel import CompactPanel
+from .finance_functions import levels_from_returns, monthly_returns, df_restrict_dates
+
+
+PERFORMANCE_METRICS = ['mean_returns', 'volatility', 'Sharpe_ratio', 'cumulative_returns', 'ave_annual_return',
+                       'max_drawdown']
 
 
 def extract_performance(df_in):
@@ -26,35 +31,101 @@ def extract_performance(df_in):
     return df_result
 
 
-def extract_performance_from_returns(df_returns, col_name='returns', out_name='index'):
-    exp_returns = df_returns[col_name].mean()
-    df_result = pd.DataFrame(np.nan, columns=[out_name], index=['mean_returns'])
-    df_result.loc['mean_returns'] = exp_returns
-    vol = df_returns[col_name].std()
-    df_result.loc['volatility'] = vol
-    df_result.loc['Sharpe_ratio'] = exp_returns / vol
-    cum_return = levels_from_returns(df_returns, col_name, frequency='monthly')['level'][-1] - 1.0
-    df_result.loc['cumulative_returns'] = cum_return
-
-    first_date = df_returns.index.min()
-    last_date = df_returns.index.max()
-    tdel = relativedelta.relativedelta(last_date, first_date)
-    n_years = tdel.years + tdel.months / 12
-    df_result.loc['ave_annual_return'] = (1.0 + cum_return) ** (1 / n_years) - 1.0
+def n_years_between(first_dates, last_dates):
+    """
+    whole years and months between pairs of dates (as relativedelta, days are ignored), one value per pair
+    """
+    pairs = pd.DataFrame({'first': first_dates, 'last': last_dates})
+    n_years = {}
+    for first_date, last_date in pairs.drop_duplicates().itertuples(index=False):
+        if pd.isnull(first_date) or pd.isnull(last_date):
+            n_years[(first_date, last_date)] = np.nan
+            continue
+        tdel = relativedelta.relativedelta(last_date, first_date)
+        n_years[(first_date, last_date)] = tdel.years + tdel.months / 12
+    return np.array([n_years[pair] for pair in pairs.itertuples(index=False)], dtype=float)
 
-    return df_result
 
+def performance_metrics(df_returns, df_turnover=None, start_date=None, end_date=None):
+    """
+    performance metrics of many portfolios in one vectorized pass
+
+    each column is one portfolio (bin, long-short, index, ...), the index holds the dates; columns may cover
+    different date ranges, NaN before the first and after the last return of a column are ignored.
+    mean, volatility and Sharpe ratio (mean / volatility, per period) skip NaN returns as pandas does; a NaN
+    return between the first and last return makes the cumulative and annual returns and the drawdown NaN,
+    as the level recursion does
+
+    :param df_returns: pandas data frame of period returns (dates x portfolios), index sorted ascending,
+                       or a CompactPanel (one column per equity)
+    :param df_turnover: optional pandas data frame of turnover (dates x portfolios), eg. from
+                        multiple_index_levels_from_returns; adds the mean turnover per period as 'ave_turnover'
+    :param start_date: optional first date (inclusive), used together with end_date
+    :param end_date: optional last date (inclusive)
+    :return: pandas data frame with one row per metric and one column per portfolio
+    """
+    if isinstance(df_returns, CompactPanel):
+        df_returns = df_returns.wide()
+
+    if start_date is not None and end_date is not None:
+        df_returns = df_restrict_dates(df_returns, start_date, end_date)
+        if df_turnover is not None:
+            df_turnover = df_restrict_dates(df_turnover, start_date, end_date)
+
+    returns = df_returns.to_numpy(dtype=float, na_value=np.nan)
+    valid = ~np.isnan(returns)
+    n = valid.sum(axis=0)
+
+    with np.errstate(all='ignore'):
+        mean = np.where(valid, returns, 0.0).sum(axis=0) / n
+        sq_dev = np.where(valid, (returns - mean) ** 2, 0.0).sum(axis=0)
+        vol = np.sqrt(sq_dev / (n - 1))
+    vol[n < 2] = np.nan
+
+    # span between the first and the last return of each column
+    started = np.logical_or.accumulate(valid, axis=0)
+    not_ended = np.logical_or.accumulate(valid[::-1], axis=0)[::-1]
+    gaps = (~valid & started & not_ended).any(axis=0)
+
+    levels = np.cumprod(np.where(valid, 1.0 + returns, 1.0), axis=0)
+    cum_return = levels[-1] - 1.0 if len(levels) else np.full(returns.shape[1], np.nan)
+    with np.errstate(all='ignore'):
+        drawdown = levels / np.maximum(np.maximum.accumulate(levels, axis=0), 1.0) - 1.0
+    max_drawdown = np.minimum(drawdown.min(axis=0, initial=0.0), 0.0)
+
+    # dates of the first and last return of each column
+    first_dates = pd.Series(df_returns.index[valid.argmax(axis=0)] if len(returns) else pd.NaT).where(n > 0)
+    last_dates = pd.Series(df_returns.index[len(returns) - 1 - valid[::-1].argmax(axis=0)]
+                           if len(returns) else pd.NaT).where(n > 0)
+    n_years = n_years_between(first_dates.values, last_dates.values)
+
+    cum_return[gaps | (n == 0)] = np.nan
+    max_drawdown[gaps | (n == 0)] = np.nan
+    with np.errstate(all='ignore'):
+        ave_annual_return = (1.0 + cum_return) ** (1 / n_years) - 1.0
+
+    df_result = pd.DataFrame([mean, vol, mean / vol, cum_return, ave_annual_return, max_drawdown],
+                             index=PERFORMANCE_METRICS, columns=df_returns.columns)
+
+    if df_turnover is not None:
+        df_result.loc['ave_turnover'] = df_turnover.reindex(columns=df_returns.columns).mean()
 
-def multiple_extract_performance(d_return, start_date=None, end_date=None):
-    for k, key in enumerate(d_return.keys()):
-        df_in = d_return[key]['df']
-        col_name = d_return[key]['col_name']
-        out_name = d_return[key]['out_name']
-        if start_date is not None and end_date is not None:
-            df_in = df_restrict_dates(df_in, start_date, end_date)
-        df_temp = extract_performance_from_returns(df_in, col_name=col_name, out_name=out_name)
-        if k == 0:
-            df_result = df_temp
-        else:
-            df_result = df_result.merge(df_temp, left_index=True, right_index=True)
     return df_result
+
+
+def extract_performance_from_returns(df_returns, col_name='returns', out_name='index'):
+    return performance_metrics(df_returns[[col_name]].rename(columns={col_name: out_name}))
+
+
+def multiple_extract_performance(d_return, start_date=None, end_date=None, df_turnover=None):
+    """
+    performance of several return series, see performance_metrics
+
+    :param d_return: dict of {'df': data frame, 'col_name': return column, 'out_name': name in the result}
+    :param df_turnover: optional turnover data frame with one column per out_name
+    :return: pandas data frame with one row per metric and one column per out_name
+    """
+    df_returns = pd.concat({d_return[key]['out_name']: d_return[key]['df'][d_return[key]['col_name']]
+                            for key in d_return.keys()}, axis=1)
+    df_returns.sort_index(inplace=True)
+    return performance_metrics(df_returns, df_turnover, start_date, end_date)
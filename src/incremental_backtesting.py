@@ -0,0 +1,271 @@
+"""
+Incremental (append new dates) back testing.
+
+A back testing state is kept next to the detail results:
+    'params':  the back testing parameters, new dates have to be run with the same ones
+    'last_date': the last date covered by the state
+    'items':   boolean dataframe (feature x equity), the equities counted in the expected number of items per bin
+    'n', 'mean', 'm2': running count, mean and sum of squared deviations of every detail results column,
+               per (feature, category)
+
+The state is a dict of pandas objects and can be persisted with pd.to_pickle / pd.read_pickle.
+
+Typical monthly workflow:
+    state = init_backtest_state(detail_results_df, input_df, features, equity_identifier=eq_name)
+    ...
+    new_detail_results, state = append_backtest_dates(state, new_input_df, features, equity_identifier=eq_name)
+    df_agg_results = aggregation_from_state(state)
+
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .feature_backtesting_routines import custom_formatwarning, warn_backtest_feature
+from .panel_backtesting import panel_codes, scatter_to_panel, panel_backtest, panel_results_to_frame
+
+
+KEY_COLS = ['feature', 'category']
+COLS_FOR_STD = ['spread', 'ic_cs', 'Qe', 'mc_return']
+
+
+def _moments(detail_results):
+    """
+    Count, mean and sum of squared deviations of the numeric detail columns per (feature, category).
+    """
+
+    value_cols = [col for col in detail_results.columns
+                  if col not in KEY_COLS and pd.api.types.is_numeric_dtype(detail_results[col])]
+    grouped = detail_results.groupby(KEY_COLS)[value_cols]
+
+    n = grouped.count()
+    mean = grouped.mean()
+    m2 = (grouped.var(ddof=0) * n).fillna(0.0)
+
+    return n, mean, m2
+
+
+def update_aggregation_state(state, detail_results):
+    """
+    Description: This function adds detail results rows to the running moments of the state,
+                 combining the counts, means and sums of squared deviations (Chan et al. pairwise update).
+                 Only the new rows are scanned.
+
+    :param state:Type dict. back testing state.
+    :param detail_results:Type pandas dataframe. new detail results rows, eg. with Qe and mc_return merged.
+    :return:Type dict. updated back testing state.
+    """
+
+    n_b, mean_b, m2_b = _moments(detail_results)
+
+    if 'n' not in state:
+        state.update({'n': n_b, 'mean': mean_b, 'm2': m2_b})
+        return state
+
+    index = state['n'].index.union(n_b.index)
+    columns = state['n'].columns.union(n_b.columns, sort=False)
+
+    def align(df):
+        return df.reindex(index=index, columns=columns)
+
+    n_a = align(state['n']).fillna(0.0)
+    n_b = align(n_b).fillna(0.0)
+    mean_a = align(state['mean']).fillna(0.0)
+    mean_b = align(mean_b).fillna(0.0)
+    m2_a = align(state['m2']).fillna(0.0)
+    m2_b = align(m2_b).fillna(0.0)
+
+    n = n_a + n_b
+    n_safe = n.where(n > 0)
+    delta = mean_b - mean_a
+
+    state['n'] = n
+    state['mean'] = (mean_a + delta * n_b / n_safe).where(n > 0)
+    state['m2'] = (m2_a + m2_b + delta ** 2 * n_a * n_b / n_safe).fillna(0.0)
+
+    return state
+
+
+def aggregation_from_state(state):
+    """
+    Description: This function returns the results aggregated across time from the running moments of the state,
+                 in the layout of perform_aggregation_across_time, without rescanning the detail results.
+                 Columns in cols_for_std that are not present (eg. Qe, mc_return when not merged) are skipped.
+
+    :param state:Type dict. back testing state.
+    :return:Type pandas dataframe. Aggregated dataframe.
+    """
+
+    n = state['n']
+    mean = state['mean'].where(n > 0)
+    std = np.sqrt(state['m2'] / (n - 1)).where(n > 1)
+
+    out_df = pd.DataFrame(index=n.index)
+
+    all_cols = list(n.columns)
+    cols_for_avg = sorted(list(set(all_cols) - set(COLS_FOR_STD)))
+
+    for col in cols_for_avg:
+        out_df[col] = mean[col]
+
+    for col in COLS_FOR_STD:
+        if col not in all_cols:
+            continue
+        out_df[col + '_avg'] = mean[col]
+        out_df[col + '_std'] = std[col]
+
+    return out_df
+
+
+def init_backtest_state(detail_results,
+                        input_df,
+                        features,
+                        equity_identifier='Equity Parent',
+                        date_col_name='date',
+                        **backtest_kwargs):
+    """
+    Description: This function builds the back testing state from a full history run of get_detail_backtest_results.
+                 This is the only step that scans the history.
+
+    :param detail_results:Type pandas dataframe. detail results of the history, as returned by
+                          get_detail_backtest_results (optionally with Qe and mc_return merged).
+    :param input_df:Type pandas dataframe. long format dataframe the detail results were computed from.
+    :param features:Type list. list of features that were back tested.
+    :param equity_identifier:Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :param backtest_kwargs: the back testing parameters used for the history run (n_bins, corr_method,
+                            items_per_bin_deviation_threshold, drop_months_outside_of_threshold, return_col_name).
+    :return:Type dict. back testing state.
+    """
+
+    df_long = input_df
+    if date_col_name not in list(df_long.columns):
+        df_long = df_long.reset_index()
+        df_long.rename(columns={'index': 'date'}, inplace=True)
+
+    features = sorted(features)
+
+    date_codes, equity_codes, dates, equities = panel_codes(df_long, equity_identifier, date_col_name)
+    present = np.zeros((len(dates), len(equities)))
+    present[date_codes, equity_codes] = 1.0
+
+    # dates retained per feature in the detail results
+    retained = pd.crosstab(detail_results.index, detail_results['feature'])
+    retained = retained.reindex(index=dates, columns=features, fill_value=0).to_numpy() > 0
+
+    items = pd.DataFrame(retained.T.astype(float) @ present > 0, index=features, columns=equities)
+
+    state = {'params': dict(backtest_kwargs),
+             'last_date': detail_results.index.max(),
+             'items': items}
+
+    return update_aggregation_state(state, detail_results)
+
+
+def append_backtest_dates(state,
+                          new_input_df,
+                          features,
+                          return_col_name='returns',
+                          equity_identifier='Equity Parent',
+                          date_col_name='date',
+                          n_bins=5,
+                          bin_labels=None,
+                          corr_method='spearman',
+                          items_per_bin_deviation_threshold=1,
+                          drop_months_outside_of_threshold=False,
+                          df_extra=None):
+    """
+    Description: This function back tests only the new dates and updates the state.
+
+                 The date level rows are independent of other dates, except for the expected number of items per bin,
+                 which is based on all equities seen so far (kept in the state). The threshold checks of the history
+                 are not revisited when new equities enter the universe.
+
+    :param state:Type dict. back testing state from init_backtest_state or a previous append_backtest_dates.
+    :param new_input_df:Type pandas dataframe. long format dataframe restricted to the new dates.
+    :param features:Type list. list of features for which backtesting needs to be performed.
+    :param return_col_name: Type str. Name of the return column.
+    :param equity_identifier : Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :param n_bins:Type int. number of bins to split the equities into.
+    :param bin_labels:Type list. list of bin labels, in descending order.
+    :param corr_method:Type string. correlation method being used.
+    :param items_per_bin_deviation_threshold:Type int. Permissible deviation from the expected number of items per bin.
+    :param drop_months_outside_of_threshold:Type boolean. Decision to drop months that deviate beyond the acceptable
+                                                          items_per_bin_deviation_threshold.
+    :param df_extra:Type pandas dataframe. optional date indexed columns merged onto the new detail rows before the
+                    aggregation state is updated, eg. the Qe and mc_return index returns.
+    :return:Type tuple. (new detail results rows, updated state)
+    """
+
+    params = {'return_col_name': return_col_name,
+              'n_bins': n_bins,
+              'corr_method': corr_method,
+              'items_per_bin_deviation_threshold': items_per_bin_deviation_threshold,
+              'drop_months_outside_of_threshold': drop_months_outside_of_threshold}
+    for key, value in state['params'].items():
+        assert params.get(key, value) == value, 'parameter ' + key + ' differs from the state'
+
+    if bin_labels is None:
+        bin_labels = ['Q' + str(i + 1) for i in range(n_bins)]
+
+    df_long = new_input_df
+    if date_col_name not in list(df_long.columns):
+        df_long = df_long.reset_index()
+        df_long.rename(columns={'index': 'date'}, inplace=True)
+
+    features = sorted(feature for feature in features if feature != return_col_name)
+
+    date_codes, equity_codes, dates, new_equities = panel_codes(df_long, equity_identifier, date_col_name)
+    assert dates.min() > state['last_date'], 'new dates have to be later than the last date of the state'
+
+    # equity axis covers the new data and the equities already in the state
+    items = state['items'].reindex(index=features, fill_value=False)
+    equities = items.columns.union(pd.Index(new_equities))
+    items = items.reindex(columns=equities, fill_value=False)
+    equity_codes = equities.get_indexer(new_equities)[equity_codes]
+
+    n_dates = len(dates)
+    n_equities = len(equities)
+
+    present = np.zeros((n_dates, n_equities), dtype=bool)
+    present[date_codes, equity_codes] = True
+    returns = scatter_to_panel(date_codes, equity_codes, n_dates, n_equities,
+                               df_long[return_col_name].to_numpy(dtype=float, na_value=np.nan))
+    values = scatter_to_panel(date_codes, equity_codes, n_dates, n_equities,
+                              df_long[features].to_numpy(dtype=float, na_value=np.nan))
+
+    results = panel_backtest(dates,
+                             present,
+                             returns,
+                             values,
+                             n_bins,
+                             corr_method,
+                             items_per_bin_deviation_threshold,
+                             drop_months_outside_of_threshold,
+                             prior_items=items.to_numpy(dtype=bool).T)
+
+    warnings.formatwarning = custom_formatwarning
+    for k, feature in enumerate(features):
+        warn_backtest_feature(feature,
+                              results['insufficient_bins_dates'][k],
+                              results['bin_lowest_bad_dates'][k],
+                              results['bin_highest_bad_dates'][k],
+                              drop_months_outside_of_threshold)
+
+    new_detail_results = panel_results_to_frame(dates, features, results, bin_labels)
+
+    df_update = new_detail_results
+    if df_extra is not None:
+        df_update = new_detail_results.merge(df_extra, left_index=True, right_index=True)
+
+    all_items = state['items'].reindex(columns=equities, fill_value=False)
+    all_items = all_items.reindex(index=all_items.index.union(features), fill_value=False)
+    all_items.loc[features] = results['items'].T
+
+    state = dict(state, items=all_items, last_date=dates.max())
+    state = update_aggregation_state(state, df_update)
+
+    return new_detail_results, state
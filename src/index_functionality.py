@@ -14,50 +14,118 @@ import dateutil.relativedelta as relativedelta
 import numpy as np
 import pandas as pd
 
-from .finance_functions import levels_from_returns
+from .compact_panel import CompactPanel
+from .finance_functions import levels_from_returns, compute_levels
+
+
+def initial_index_date(start_date, frequency='monthly'):
+    """
+    date of the starting level, one period before the first return date
+    """
+    assert frequency in ['daily', 'monthly', 'quarterly'], 'not implemented'
+    if frequency == 'daily':
+        return start_date + relativedelta.relativedelta(days=-1)
+    if frequency == 'monthly':
+        return start_date + relativedelta.relativedelta(months=-1)
+    return start_date + relativedelta.relativedelta(months=-3)
+
+
+def drift_and_rebalance(weights, returns, starting_level=100, cost_percentage=0.005):
+    """
+    drift-and-rebalance index engine on numpy arrays
+
+    weights[t] are the target weights held over period t. After period t the holdings have drifted to
+    weights[t] * (1 + returns[t]) / (1 + index_return[t]) and are rebalanced to weights[t + 1];
+    only buying is charged, with cost_percentage of the amount bought (bid-ask spread).
+    Missing weights and returns count as zero, weights not summing to one leave the rest in cash (zero return).
+    A date without any return is a missing period: its index return is NaN, and so are the levels from then on.
+
+    :param weights: array (dates x equities) or stack of weight schemes (schemes x dates x equities)
+    :param returns: array (dates x equities)
+    :param starting_level: index level before the first date
+    :param cost_percentage: transaction costs as fraction of the bought amount
+    :return: dict of arrays with leading scheme axis if weights is 3-d:
+             'index_returns' (dates), 'drifted_weights' (dates x equities), 'turnover' buy-side turnover (dates),
+             'net_returns' (dates) index returns after costs, 'levels' (dates + 1) index levels after costs
+    """
+
+    weights = np.nan_to_num(np.asarray(weights, dtype=float))
+    returns = np.asarray(returns, dtype=float)
+    growth = 1.0 + np.nan_to_num(returns)
+
+    index_returns = (weights * np.nan_to_num(returns)).sum(axis=-1)
+
+    with np.errstate(all='ignore'):
+        drifted_weights = weights * growth / (1.0 + index_returns)[..., np.newaxis]
+    drifted_weights = np.nan_to_num(drifted_weights)
+
+    # holdings do not drift over a missing period, but its return is unknown
+    index_returns = np.where(np.isnan(returns).all(axis=-1), np.nan, index_returns)
+
+    # buying needed to go from drifted weights to next period's target; no rebalancing after the last date
+    buy = np.zeros(weights.shape)
+    buy[..., :-1, :] = np.maximum(weights[..., 1:, :] - drifted_weights[..., :-1, :], 0.0)
+    turnover = buy.sum(axis=-1)
+
+    net_returns = (1.0 + index_returns) * (1.0 - cost_percentage * turnover) - 1.0
+    levels = compute_levels(starting_level, np.moveaxis(net_returns, -1, 0))
+
+    return {'index_returns': index_returns,
+            'drifted_weights': drifted_weights,
+            'turnover': turnover,
+            'net_returns': net_returns,
+            'levels': np.moveaxis(levels, 0, -1)}
 
 
 def index_levels_from_returns(df_weights, df_returns, starting_level=100, out_field='index_name',
                               transaction_costs=True, cost_percentage=0.005, frequency='monthly'):
     assert frequency in ['daily', 'monthly', 'quarterly'], 'not implemented'
 
-    df_index_returns = pd.DataFrame((df_returns * df_weights).sum(axis=1), columns=['return'])
-    if transaction_costs:
-
-        # weights after period
-        df_weights_actual = compute_actual_weights(df_weights, df_returns)
-        # difference, if negative we have to buy asset
-        df_weights_diff = weight_diff_actual_target(df_weights_actual, df_weights)
+    if isinstance(df_returns, CompactPanel):
+        df_returns = df_returns.wide()
 
-        start_date = df_returns.index.min()
+    if transaction_costs:
 
-        if frequency == 'daily':
-            initial_date = start_date + relativedelta.relativedelta(days=-1)
-        if frequency == 'monthly':
-            initial_date = start_date + relativedelta.relativedelta(months=-1)
-        if frequency == 'quarterly':
-            initial_date = start_date + relativedelta.relativedelta(months=-3)
+        result = drift_and_rebalance(df_weights.reindex_like(df_returns).values, df_returns.values,
+                                     starting_level=starting_level, cost_percentage=cost_percentage)
 
+        initial_date = initial_index_date(df_returns.index.min(), frequency)
         new_index = [initial_date] + list(df_returns.index)
-        df_index_levels = pd.DataFrame(np.nan, columns=[out_field], index=new_index)
-
-        value = starting_level
-        df_index_levels.loc[initial_date, out_field] = starting_level
-        for date in df_returns.index:
-            # value before rebalancing
-            # value = (1 + df_index_returns.loc[date].get_value('return')) * value
-            value = (1 + df_index_returns.at[date, 'return']) * value
-            proportion_buy = df_weights_diff.loc[date][df_weights_diff.loc[date] < 0.0].sum()
-            # print(proportion_buy)
-            buy_amount = abs(value * proportion_buy)
-            # value after rebalancing; only consider bid-ask spread costs for buying
-            value = value - buy_amount * cost_percentage
-            df_index_levels.loc[date, out_field] = value
+        df_index_levels = pd.DataFrame(result['levels'], columns=[out_field], index=new_index)
 
     else:
+        df_index_returns = pd.DataFrame((df_returns * df_weights).sum(axis=1), columns=['return'])
         df_index_levels = levels_from_returns(df_index_returns, infield='return',
                                               outfield=out_field, starting_level=starting_level,
                                               frequency=frequency)
     return df_index_levels
 
 
+def multiple_index_levels_from_returns(d_weights, df_returns, starting_level=100, transaction_costs=True,
+                                       cost_percentage=0.005, frequency='monthly'):
+    """
+    index levels for many weight schemes in one batched call
+
+    :param d_weights: dict of weight data frames (dates x equities), eg. d_weights of the index generation notebook;
+                      weights are aligned to the index and columns of df_returns
+    :param df_returns: data frame of equity returns (dates x equities), or a CompactPanel
+    :return: tuple (data frame of index levels, one column per scheme in sorted key order,
+                    data frame of buy-side turnover per date and scheme)
+    """
+    assert frequency in ['daily', 'monthly', 'quarterly'], 'not implemented'
+
+    if isinstance(df_returns, CompactPanel):
+        df_returns = df_returns.wide()
+
+    names = sorted(d_weights.keys())
+    weights = np.stack([d_weights[name].reindex_like(df_returns).values for name in names])
+
+    result = drift_and_rebalance(weights, df_returns.values, starting_level=starting_level,
+                                 cost_percentage=cost_percentage if transaction_costs else 0.0)
+
+    initial_date = initial_index_date(df_returns.index.min(), frequency)
+    new_index = pd.Index([initial_date]).append(df_returns.index)
+    df_levels = pd.DataFrame(result['levels'].T, index=new_index, columns=names)
+    df_turnover = pd.DataFrame(result['turnover'].T, index=df_returns.index, columns=names)
+
+    return df_levels, df_turnover
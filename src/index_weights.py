@@ -0,0 +1,225 @@
+"""
+Universe membership and index weight construction.
+
+A membership table (equity -> first date, or equity -> (first date, exit date)) is turned into a boolean
+(date x equity) mask by one broadcast comparison of the dates against the entry and exit dates. Weights are
+computed from the mask and the market caps on whole (date x equity) arrays and lagged by one date, so the weights
+of a month are determined by the information of the previous month:
+
+    membership = membership_frame(equity_name2first_date, date_projection=project_to_first)
+    mask = membership_mask(df_market_cap.index, df_market_cap.columns, membership)
+    d_weights = index_weights(df_market_cap, mask, schemes=['mcap', 'equal', 'capped'], cap=0.2)
+    df_levels, df_turnover = multiple_index_levels_from_returns(d_weights, df_returns)
+
+'mcap' and 'equal' reproduce the market cap and equal weights built in the notebooks: market caps forward
+filled, zero outside the membership, divided by the total and shifted by one date; equal weights over the
+equities with a positive lagged market cap weight. Dates without any member get NaN weights.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+
+WEIGHT_SCHEMES = ['mcap', 'equal', 'capped', 'custom']
+
+
+def membership_frame(membership, date_projection=None):
+    """
+    Description: This function brings a membership table into a dataframe of entry and exit dates.
+
+    :param membership:Type dict or pandas dataframe. equity -> first date (eg. equity_name2first_date),
+                      equity -> (first date, exit date), or a dataframe indexed by equity with 'first_date' and
+                      optional 'exit_date' columns. Exit dates are exclusive; None or NaT for current members.
+    :param date_projection:Type function. optional projection applied to the dates, eg. project_to_first.
+    :return:Type pandas dataframe. indexed by equity with 'first_date' and 'exit_date' columns.
+    """
+
+    if isinstance(membership, pd.DataFrame):
+        df_out = membership.reindex(columns=['first_date', 'exit_date'])
+    else:
+        rows = {equity: dates if isinstance(dates, (tuple, list)) else (dates, None)
+                for equity, dates in membership.items()}
+        df_out = pd.DataFrame.from_dict(rows, orient='index', columns=['first_date', 'exit_date'])
+
+    for col in ['first_date', 'exit_date']:
+        dates = pd.to_datetime(df_out[col])
+        if date_projection is not None:
+            dates = dates.map(lambda dt: dt if pd.isnull(dt) else date_projection(dt))
+        df_out[col] = pd.to_datetime(dates)
+
+    return df_out
+
+
+def membership_mask(dates, equities, membership, date_projection=None):
+    """
+    Description: This function computes the boolean (date x equity) membership mask in one vectorized step.
+                 An equity is a member from its first date (inclusive) until its exit date (exclusive);
+                 equities missing from the table are never members.
+
+    :param dates:Type DatetimeIndex. date axis, eg. df_market_cap.index.
+    :param equities:Type Index. equity axis, eg. df_market_cap.columns.
+    :param membership:Type dict or pandas dataframe. membership table, see membership_frame.
+    :param date_projection:Type function. optional projection applied to the entry and exit dates.
+    :return:Type pandas dataframe. boolean (date x equity) mask.
+    """
+
+    df_membership = membership_frame(membership, date_projection).reindex(pd.Index(equities))
+
+    date_values = pd.DatetimeIndex(dates).to_numpy()[:, np.newaxis]
+    first_dates = df_membership['first_date'].to_numpy(dtype='datetime64[ns]')[np.newaxis, :]
+    exit_dates = df_membership['exit_date'].to_numpy(dtype='datetime64[ns]')[np.newaxis, :]
+
+    # comparisons with NaT are False: no entry date -> never a member, no exit date -> still a member
+    mask = (date_values >= first_dates) & ~(date_values >= exit_dates)
+
+    return pd.DataFrame(mask, index=dates, columns=equities)
+
+
+def _normalize(values, mask):
+    """
+    rows of values (zero outside the mask) divided by their total, NaN for rows with a zero total
+    """
+    values = np.where(mask, values, 0.0)
+    total = values.sum(axis=1, keepdims=True)
+    with np.errstate(all='ignore'):
+        return np.where(total > 0, values / total, np.nan)
+
+
+def _lagged_frame(weights, like, lag):
+    return pd.DataFrame(weights, index=like.index, columns=like.columns).shift(lag)
+
+
+def market_cap_weights(df_market_cap, mask, lag=1, ffill=True):
+    """
+    Description: This function computes market cap weights over the members, lagged by lag dates.
+
+    :param df_market_cap:Type pandas dataframe. (date x equity) market caps.
+    :param mask:Type pandas dataframe. boolean (date x equity) membership mask.
+    :param lag:Type int. number of dates the weights are shifted by.
+    :param ffill:Type boolean. forward fill missing market caps with the previously available one.
+    :return:Type pandas dataframe. (date x equity) weights.
+    """
+
+    if ffill:
+        df_market_cap = df_market_cap.ffill()
+    market_cap = np.nan_to_num(df_market_cap.to_numpy(dtype=float, na_value=np.nan))
+
+    return _lagged_frame(_normalize(market_cap, mask.reindex_like(df_market_cap).to_numpy(dtype=bool)),
+                         df_market_cap, lag)
+
+
+def equal_weights(mask, df_market_cap=None, lag=1, ffill=True):
+    """
+    Description: This function computes equal weights over the members, lagged by lag dates. With market caps,
+                 only members with a positive (forward filled) market cap count, as in the notebooks.
+
+    :param mask:Type pandas dataframe. boolean (date x equity) membership mask.
+    :param df_market_cap:Type pandas dataframe. optional (date x equity) market caps.
+    :param lag:Type int. number of dates the weights are shifted by.
+    :param ffill:Type boolean. forward fill missing market caps with the previously available one.
+    :return:Type pandas dataframe. (date x equity) weights.
+    """
+
+    eligible = mask.to_numpy(dtype=bool)
+    if df_market_cap is not None:
+        df_market_cap = df_market_cap.reindex_like(mask)
+        if ffill:
+            df_market_cap = df_market_cap.ffill()
+        eligible = eligible & (np.nan_to_num(df_market_cap.to_numpy(dtype=float, na_value=np.nan)) > 0)
+
+    return _lagged_frame(_normalize(eligible.astype(float), eligible), mask, lag)
+
+
+def cap_weights(weights, cap, max_iter=100):
+    """
+    Description: This function caps weights at cap and redistributes the excess over the uncapped weights in
+                 proportion to their size, for all dates at once. The iterations run over capping rounds, not
+                 over equities; a row with fewer than 1 / cap positive weights ends with all of them at cap.
+
+    :param weights:Type numpy array or pandas dataframe. (date x equity) weights summing to one per date.
+    :param cap:Type float. maximum weight.
+    :param max_iter:Type int. maximum number of capping rounds.
+    :return:Type numpy array or pandas dataframe. capped weights, of the type of weights.
+    """
+
+    frame = weights if isinstance(weights, pd.DataFrame) else None
+    values = np.asarray(weights, dtype=float).copy()
+    missing = np.isnan(values)
+    values[missing] = 0.0
+
+    capped = np.zeros(values.shape, dtype=bool)
+    for _ in range(max_iter):
+        over = values > cap
+        if not over.any():
+            break
+        capped |= over
+        excess = np.where(over, values - cap, 0.0).sum(axis=1, keepdims=True)
+        values = np.where(over, cap, values)
+        free = np.where(capped, 0.0, values)
+        free_total = free.sum(axis=1, keepdims=True)
+        with np.errstate(all='ignore'):
+            values = values + np.where(free_total > 0, free / free_total, 0.0) * excess
+
+    values[missing] = np.nan
+    if frame is None:
+        return values
+    return pd.DataFrame(values, index=frame.index, columns=frame.columns)
+
+
+def custom_weights(mask, df_scores, lag=1):
+    """
+    Description: This function computes weights proportional to non-negative scores over the members, lagged by
+                 lag dates, eg. model predictions or fundamentals. Negative and missing scores get zero weight.
+
+    :param mask:Type pandas dataframe. boolean (date x equity) membership mask.
+    :param df_scores:Type pandas dataframe. (date x equity) scores.
+    :param lag:Type int. number of dates the weights are shifted by.
+    :return:Type pandas dataframe. (date x equity) weights.
+    """
+
+    scores = np.clip(np.nan_to_num(df_scores.reindex_like(mask).to_numpy(dtype=float, na_value=np.nan)), 0.0, None)
+
+    return _lagged_frame(_normalize(scores, mask.to_numpy(dtype=bool)), mask, lag)
+
+
+def index_weights(df_market_cap, mask, schemes=('mcap', 'equal'), lag=1, cap=0.1, df_scores=None,
+                  names=None):
+    """
+    Description: This function builds the weights of several schemes, as input of
+                 multiple_index_levels_from_returns.
+
+    :param df_market_cap:Type pandas dataframe. (date x equity) market caps.
+    :param mask:Type pandas dataframe. boolean (date x equity) membership mask.
+    :param schemes:Type list. any of 'mcap', 'equal', 'capped' (capped market cap weights) and 'custom'.
+    :param lag:Type int. number of dates the weights are shifted by.
+    :param cap:Type float. maximum weight of the 'capped' scheme.
+    :param df_scores:Type pandas dataframe. (date x equity) scores of the 'custom' scheme.
+    :param names:Type dict. optional scheme -> output name, eg. {'mcap': 'Market Cap 0', 'equal': 'Equal 0'}.
+    :return:Type dict. name -> (date x equity) weights dataframe.
+    """
+
+    for scheme in schemes:
+        assert scheme in WEIGHT_SCHEMES, 'not implemented'
+    if names is None:
+        names = {}
+
+    d_weights = {}
+    df_weights_mc = None
+    for scheme in schemes:
+        if scheme in ['mcap', 'capped'] and df_weights_mc is None:
+            df_weights_mc = market_cap_weights(df_market_cap, mask, lag)
+
+        if scheme == 'mcap':
+            df_weights = df_weights_mc
+        elif scheme == 'equal':
+            df_weights = equal_weights(mask, df_market_cap, lag)
+        elif scheme == 'capped':
+            df_weights = cap_weights(df_weights_mc, cap)
+        else:
+            assert df_scores is not None, 'df_scores needed for custom weights'
+            df_weights = custom_weights(mask, df_scores, lag)
+
+        d_weights[names.get(scheme, scheme)] = df_weights
+
+    return d_weights
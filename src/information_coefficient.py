@@ -0,0 +1,211 @@
+"""
+Cross sectional information coefficients (IC)
+
+Pearson, Spearman and Kendall correlations between the returns and feature values of each date, for all dates
+and features at once on (date x equity x feature) panels. Ranks are computed within each date with one sort,
+the correlations from sums along the equity axis over pairwise complete observations (as pandas corr does).
+Perfect correlations are returned as such.
+
+Rolling and exponentially decayed averages of the date level ICs are provided as well.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def tie_ranks(values, method='min', ascending=True, axis=1):
+    """
+    Description: This function ranks values along an axis in one sort, matching pandas rank for
+                 the 'min' and 'average' tie methods. NaN values are left unranked (NaN).
+
+    :param values:Type numpy array. values to rank.
+    :param method:Type str. tie method, 'min' or 'average'.
+    :param ascending:Type boolean. rank in ascending order if True.
+    :param axis:Type int. axis along which ranks are computed.
+    :return:Type numpy array. float ranks with the same shape as values.
+    """
+    assert method in ['min', 'average'], 'not implemented'
+
+    keys = np.ascontiguousarray(np.moveaxis(values if ascending else -values, axis, -1))
+    order = np.argsort(keys, axis=-1, kind='stable')
+    sorted_keys = np.take_along_axis(keys, order, axis=-1)
+
+    n = keys.shape[-1]
+    position = np.arange(1, n + 1)
+
+    group_start = np.ones(sorted_keys.shape, dtype=bool)
+    group_start[..., 1:] = sorted_keys[..., 1:] != sorted_keys[..., :-1]
+    first = np.maximum.accumulate(np.where(group_start, position, 0), axis=-1)
+
+    if method == 'min':
+        sorted_ranks = first.astype(float)
+    else:
+        group_end = np.ones(sorted_keys.shape, dtype=bool)
+        group_end[..., :-1] = group_start[..., 1:]
+        last = np.minimum.accumulate(np.where(group_end, position, n + 1)[..., ::-1], axis=-1)[..., ::-1]
+        sorted_ranks = (first + last) / 2.0
+
+    sorted_ranks[np.isnan(sorted_keys)] = np.nan
+
+    ranks = np.empty(sorted_ranks.shape)
+    np.put_along_axis(ranks, order, sorted_ranks, axis=-1)
+
+    return np.moveaxis(ranks, -1, axis)
+
+
+def _pearson(x, y, axis=1):
+    """
+    Pearson correlation along an axis, ignoring positions where x or y is NaN.
+    """
+
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    x = np.where(valid, x, np.nan)
+    y = np.where(valid, y, np.nan)
+    n = valid.sum(axis=axis)
+
+    with np.errstate(all='ignore'):
+        dx = x - np.nansum(x, axis=axis, keepdims=True) / np.expand_dims(n, axis)
+        dy = y - np.nansum(y, axis=axis, keepdims=True) / np.expand_dims(n, axis)
+        divisor = np.sqrt(np.nansum(dx * dx, axis=axis) * np.nansum(dy * dy, axis=axis))
+        corr = np.nansum(dx * dy, axis=axis) / divisor
+
+    corr[(n < 2) | (divisor == 0)] = np.nan
+
+    return corr
+
+
+def _kendall(x, y):
+    """
+    Kendall tau-b along axis 1 of (date x equity x feature) arrays, ignoring pairs with NaN values.
+    """
+
+    n_dates, _, n_features = x.shape
+    corr = np.full((n_dates, n_features), np.nan)
+
+    for k in range(n_features):
+        xk = x[:, :, k]
+        yk = y[:, :, k]
+        valid = ~np.isnan(xk) & ~np.isnan(yk)
+        pair_valid = valid[:, :, np.newaxis] & valid[:, np.newaxis, :]
+
+        with np.errstate(invalid='ignore'):
+            sign_x = np.sign(xk[:, :, np.newaxis] - xk[:, np.newaxis, :])
+            sign_y = np.sign(yk[:, :, np.newaxis] - yk[:, np.newaxis, :])
+
+        # each unordered pair appears twice in the full matrix, which cancels in the ratio
+        n_pairs = pair_valid.sum(axis=(1, 2)) - valid.sum(axis=1)
+        untied_x = n_pairs - ((sign_x == 0) & pair_valid).sum(axis=(1, 2)) + valid.sum(axis=1)
+        untied_y = n_pairs - ((sign_y == 0) & pair_valid).sum(axis=(1, 2)) + valid.sum(axis=1)
+        concordance = np.where(pair_valid, sign_x * sign_y, 0.0).sum(axis=(1, 2))
+
+        with np.errstate(all='ignore'):
+            tau = concordance / np.sqrt(untied_x.astype(float) * untied_y)
+
+        tau[(valid.sum(axis=1) < 2) | (untied_x == 0) | (untied_y == 0)] = np.nan
+        corr[:, k] = tau
+
+    return corr
+
+
+def cross_sectional_corr(returns, values, corr_method='spearman'):
+    """
+    Description: This function computes the cross sectional correlation between returns and each feature,
+                 for every date, using pairwise complete observations (as pandas corr does).
+
+    :param returns:Type numpy array. (date x equity) returns.
+    :param values:Type numpy array. (date x equity x feature) feature values.
+    :param corr_method:Type string. correlation method being used: 'pearson', 'spearman' or 'kendall'.
+    :return:Type numpy array. (date x feature) correlations.
+    """
+    assert corr_method in ['pearson', 'spearman', 'kendall'], 'not implemented'
+
+    valid = ~np.isnan(values) & ~np.isnan(returns)[:, :, np.newaxis]
+    x = np.where(valid, values, np.nan)
+    y = np.where(valid, returns[:, :, np.newaxis], np.nan)
+
+    if corr_method == 'kendall':
+        return np.clip(_kendall(x, y), -1.0, 1.0)
+
+    if corr_method == 'spearman':
+        x = tie_ranks(x, method='average', axis=1)
+        y = tie_ranks(y, method='average', axis=1)
+
+    # rounding can push perfect correlations marginally outside [-1, 1]
+    return np.clip(_pearson(x, y, axis=1), -1.0, 1.0)
+
+
+def cross_sectional_ic(dates, returns, values, features, methods=('pearson', 'spearman')):
+    """
+    Description: This function computes the date level ICs for every feature and correlation method.
+
+    :param dates:Type pandas DatetimeIndex. dates of the panel.
+    :param returns:Type numpy array. (date x equity) returns.
+    :param values:Type numpy array. (date x equity x feature) feature values.
+    :param features:Type list. feature names, in the order of the feature axis.
+    :param methods:Type list. correlation methods, any of 'pearson', 'spearman' and 'kendall'.
+    :return:Type dict. method -> pandas dataframe of ICs (date x feature).
+    """
+
+    return {method: pd.DataFrame(cross_sectional_corr(returns, values, method), index=dates, columns=list(features))
+            for method in methods}
+
+
+def long_cross_sectional_ic(df_long,
+                            features,
+                            return_col_name='returns',
+                            equity_identifier='Equity Parent',
+                            date_col_name='date',
+                            methods=('pearson', 'spearman')):
+    """
+    Description: This function computes the date level ICs from a long dataframe, see cross_sectional_ic.
+
+    :param df_long:Type pandas dataframe. long format dataframe with date and equity identifier columns.
+    :param features:Type list. list of features.
+    :param return_col_name:Type str. Name of the return column.
+    :param equity_identifier:Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :param methods:Type list. correlation methods, any of 'pearson', 'spearman' and 'kendall'.
+    :return:Type dict. method -> pandas dataframe of ICs (date x feature).
+    """
+
+    # imported here, panel_backtesting itself imports this module
+    from .panel_backtesting import long_to_panel
+
+    dates, _, _, returns, values = long_to_panel(df_long, list(features), return_col_name,
+                                                 equity_identifier, date_col_name)
+
+    return cross_sectional_ic(dates, returns, values, features, methods)
+
+
+def rolling_ic(df_ic, window, min_periods=None):
+    """
+    Description: This function computes the rolling mean IC over a window of dates, ignoring missing dates.
+
+    :param df_ic:Type pandas dataframe. date level ICs (date x feature).
+    :param window:Type int. number of dates in the window.
+    :param min_periods:Type int. minimum number of available ICs in the window, defaults to window.
+    :return:Type pandas dataframe. rolling mean ICs (date x feature).
+    """
+
+    if min_periods is None:
+        min_periods = window
+
+    available = df_ic.notna().astype(float)
+    counts = available.rolling(window, min_periods=1).sum()
+    sums = df_ic.fillna(0.0).rolling(window, min_periods=1).sum()
+
+    return (sums / counts).where(counts >= min_periods)
+
+
+def decayed_ic(df_ic, halflife):
+    """
+    Description: This function computes the exponentially decayed mean IC, with weights halving every halflife dates.
+                 Missing ICs are skipped.
+
+    :param df_ic:Type pandas dataframe. date level ICs (date x feature).
+    :param halflife:Type float. half life in number of dates.
+    :return:Type pandas dataframe. decayed mean ICs (date x feature).
+    """
+
+    return df_ic.ewm(halflife=halflife, ignore_na=True).mean()
@@ -0,0 +1,145 @@
+"""
+Instrumentation hooks for the back testing pipeline
+
+BacktestInstrumentation collects per stage timings (ranking, bin checks, threshold checks, bin statistics,
+correlation, ...) and per feature counters (rows in, rows dropped, dates dropped), and forwards every
+record as a dict to an optional callback, eg. a structured logger:
+
+    instrumentation = BacktestInstrumentation(callback=lambda record: logger.info(json.dumps(record)))
+    get_detail_backtest_results(df, features, instrumentation=instrumentation)
+    instrumentation.stage_summary()
+
+profile='cprofile' or profile='tracemalloc' additionally captures, per stage, the top functions by cumulative time
+or the peak traced memory. When no instrumentation is passed, the pipeline uses NULL_INSTRUMENTATION whose hooks
+do nothing.
+
+"""
+
+import contextlib
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+class NullInstrumentation(object):
+    """
+    instrumentation that records nothing
+    """
+
+    enabled = False
+
+    _null_context = contextlib.nullcontext()
+
+    def stage(self, name, n_features=None):
+        return self._null_context
+
+    def event(self, name, **fields):
+        pass
+
+    def merge(self, records):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+class BacktestInstrumentation(object):
+    """
+    per stage timers, per feature counters and optional profiling
+
+    :param callback: function called with every record (dict), eg. for structured logging
+    :param profile: None, 'cprofile' or 'tracemalloc'
+    """
+
+    enabled = True
+
+    def __init__(self, callback=None, profile=None):
+        assert profile in [None, 'cprofile', 'tracemalloc'], 'not implemented'
+        self.callback = callback
+        self.profile = profile
+        self.records = []
+        self.profiles = {}
+
+    def _emit(self, record):
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    @contextlib.contextmanager
+    def stage(self, name, n_features=None):
+        record = {'event': 'stage', 'stage': name, 'n_features': n_features}
+
+        if self.profile == 'cprofile':
+            profiler = self.profiles.setdefault(name, cProfile.Profile())
+            profiler.enable()
+        elif self.profile == 'tracemalloc':
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['elapsed_s'] = time.perf_counter() - start
+
+            if self.profile == 'cprofile':
+                profiler.disable()
+            elif self.profile == 'tracemalloc':
+                record['peak_mb'] = (tracemalloc.get_traced_memory()[1] - memory_start) / 2 ** 20
+                if started_tracing:
+                    tracemalloc.stop()
+
+            self._emit(record)
+
+    def event(self, name, **fields):
+        record = {'event': name}
+        record.update(fields)
+        self._emit(record)
+
+    def merge(self, records):
+        """
+        add records collected elsewhere, eg. in a worker process
+        """
+        for record in records:
+            self._emit(record)
+
+    def stage_summary(self):
+        """
+        total and mean time (and max peak memory if traced) per stage
+        """
+        df = pd.DataFrame([record for record in self.records if record['event'] == 'stage'])
+        if df.empty:
+            return df
+        agg = {'elapsed_s': ['count', 'sum', 'mean']}
+        if 'peak_mb' in df.columns:
+            agg['peak_mb'] = ['max']
+        df_out = df.groupby('stage').agg(agg)
+        df_out.columns = ['calls', 'total_s', 'mean_s'] + (['peak_mb'] if 'peak_mb' in df.columns else [])
+        return df_out.sort_values('total_s', ascending=False)
+
+    def feature_counters(self):
+        """
+        one row per feature with the rows in, rows dropped and dates dropped counters
+        """
+        df = pd.DataFrame([record for record in self.records if record['event'] == 'feature'])
+        if df.empty:
+            return df
+        return df.drop(columns='event').set_index('feature')
+
+    def profile_summary(self, top=10, sort='cumulative'):
+        """
+        dict of stage -> text of the top functions of the cProfile capture
+        """
+        out = {}
+        for name, profiler in self.profiles.items():
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(top)
+            out[name] = stream.getvalue()
+        return out
@@ -0,0 +1,230 @@
+"""
+Batch pipeline over the bundled index histories (dax.csv, nikkei_225.csv, dow_jones.csv, s_and_p_index.csv).
+
+The files differ in schema: dow_jones.csv and s_and_p_index.csv have no 'Adj Close' and leave 'Volume' empty on
+many rows, dax.csv and nikkei_225.csv have empty placeholder rows on non-trading days. Every file is read
+through the columnar cache of data_store and normalized to STANDARD_COLUMNS:
+    missing 'Adj Close' is taken from 'Close', missing columns are NaN, rows without a close are dropped
+
+The normalized histories are aligned into one (date x market) panel and returns, levels and performance metrics
+are computed for all markets at once:
+    'daily':   union of the trading dates; a market's price is carried forward over the dates it does not trade
+               (zero returns), within its own history only. Observations before a market's daily history
+               starts (the monthly S&P data before 1885) are left out.
+    'monthly': the last available price of every calendar month, over the full history of every market;
+               months without trading (eg. the 1914 exchange closure) get zero returns.
+With calendar='common' only the dates on which every market trades are kept.
+
+Typical use:
+    results = run_market_pipeline('data', frequency='monthly', start_date=datetime(2000, 1, 1))
+    results['metrics']
+
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .data_store import load_index_history
+from .finance_functions import multiple_returns_from_levels_vec, period_returns, levels_from_returns, \
+    df_restrict_dates
+from .financial_metrics import performance_metrics
+
+
+MARKET_FILES = {'dax': 'dax.csv',
+                'dow_jones': 'dow_jones.csv',
+                'nikkei_225': 'nikkei_225.csv',
+                's_and_p_index': 's_and_p_index.csv'}
+
+STANDARD_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+def normalize_market_schema(df_in):
+    """
+    Description: This function brings an index history to the standard schema: STANDARD_COLUMNS in this order,
+                 'Adj Close' from 'Close' where it is missing, rows without a close dropped, dates sorted and unique.
+
+    :param df_in:Type pandas dataframe. date indexed index history, eg. data_store.load_index_history(csv_path).
+    :return:Type pandas dataframe. normalized history.
+    """
+
+    df_out = df_in.reindex(columns=STANDARD_COLUMNS).astype(float)
+    df_out['Adj Close'] = df_out['Adj Close'].fillna(df_out['Close'])
+    df_out = df_out[df_out['Close'].notna()]
+    df_out = df_out[~df_out.index.duplicated(keep='last')].sort_index()
+    df_out.index.name = 'Date'
+
+    return df_out
+
+
+def load_market(csv_path, date_col='Date'):
+    """
+    normalized history of one index file, read through the columnar cache
+    """
+    return normalize_market_schema(load_index_history(csv_path, date_col=date_col))
+
+
+def load_markets(data_dir='data', markets=None, n_jobs=1, executor=None):
+    """
+    Description: This function loads and normalizes the index histories, optionally in a process pool.
+
+    :param data_dir:Type str. directory of the csv files.
+    :param markets:Type list or dict. market names of MARKET_FILES, or a dict name -> file name; all bundled
+                   markets by default.
+    :param n_jobs:Type int. number of worker processes; 1 loads in this process, None uses all cpus.
+    :param executor:Type concurrent.futures.Executor. optional executor to submit the loads to.
+    :return:Type dict. market name -> normalized history, in sorted market order.
+    """
+
+    if markets is None:
+        markets = MARKET_FILES
+    if not isinstance(markets, dict):
+        markets = {name: MARKET_FILES[name] for name in markets}
+
+    names = sorted(markets.keys())
+    paths = [os.path.join(data_dir, markets[name]) for name in names]
+
+    if executor is None and n_jobs == 1:
+        return {name: load_market(path) for name, path in zip(names, paths)}
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=n_jobs if n_jobs is not None else os.cpu_count())
+    try:
+        futures = [executor.submit(load_market, path) for path in paths]
+        return {name: future.result() for name, future in zip(names, futures)}
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def daily_start(dates, max_gap_days=7, min_run=250):
+    """
+    first date of the first run of at least min_run observations spaced at most max_gap_days apart,
+    ie. where the history becomes daily (the first date if it never does)
+    """
+    dates = pd.DatetimeIndex(dates)
+    daily = np.zeros(len(dates), dtype=bool)
+    daily[1:] = np.diff(dates.values).astype('timedelta64[D]').astype(np.int64) <= max_gap_days
+
+    # length of the run of daily gaps ending at every position
+    run_start = np.maximum.accumulate(np.where(daily, 0, np.arange(len(dates))))
+    run_length = np.arange(len(dates)) - run_start
+    long_runs = np.flatnonzero(run_length >= min_run)
+    if len(long_runs) == 0:
+        return dates[0]
+
+    return dates[run_start[long_runs[0]]]
+
+
+def market_panel(d_markets, field='Adj Close', frequency='daily', calendar='union'):
+    """
+    Description: This function aligns one field of all markets into a (date x market) panel of prices.
+
+    :param d_markets:Type dict. market name -> normalized history, eg. load_markets().
+    :param field:Type str. price column of STANDARD_COLUMNS.
+    :param frequency:Type str. 'daily' or 'monthly'.
+    :param calendar:Type str. 'union' of the dates of all markets or the 'common' dates of all markets.
+    :return:Type pandas dataframe. (date x market) prices, NaN outside the history of a market. Monthly panels
+                                   are indexed by the first calendar day of the month.
+    """
+    assert frequency in ['daily', 'monthly'], 'not implemented'
+    assert calendar in ['union', 'common'], 'not implemented'
+
+    names = sorted(d_markets.keys())
+    series = {}
+    for name in names:
+        prices = d_markets[name][field].dropna()
+        if frequency == 'daily':
+            prices = prices[prices.index >= daily_start(prices.index)]
+        series[name] = prices
+
+    df_prices = pd.concat(series, axis=1, join='outer' if calendar == 'union' else 'inner', sort=True)
+
+    # carry prices forward over non-trading dates, within the history of every market only
+    df_prices = df_prices.ffill().where(df_prices.bfill().notna())
+
+    if frequency == 'monthly':
+        periods = df_prices.index.to_period('M')
+        df_prices = df_prices.groupby(periods).last()
+        df_prices = df_prices.reindex(pd.period_range(periods[0], periods[-1], freq='M'))
+        df_prices.index = df_prices.index.start_time
+        df_prices = df_prices.ffill().where(df_prices.bfill().notna())
+
+    df_prices.index.name = 'Date'
+    df_prices.columns.name = None
+
+    return df_prices
+
+
+def market_levels(df_returns, starting_level=100, frequency='daily'):
+    """
+    Description: This function computes the levels of all markets in one pass, each market starting at
+                 starting_level one period before its first return and ending with its last return.
+
+    :param df_returns:Type pandas dataframe. (date x market) returns.
+    :param starting_level:Type float. starting level of every market.
+    :param frequency:Type str. 'daily' or 'monthly'.
+    :return:Type pandas dataframe. (date x market) levels, with one more row than df_returns.
+    """
+
+    df_levels = levels_from_returns(df_returns, infield=list(df_returns.columns), starting_level=starting_level,
+                                    frequency=frequency, nan_policy='zero')
+
+    # level row k + 1 follows return row k: keep the rows from the starting level to the last return
+    valid = df_returns.notna().to_numpy()
+    started = np.logical_or.accumulate(valid, axis=0)
+    not_ended = np.logical_or.accumulate(valid[::-1], axis=0)[::-1]
+    in_span = np.zeros(df_levels.shape, dtype=bool)
+    in_span[1:] = started & not_ended
+    in_span[:-1] |= in_span[1:] & ~np.vstack([np.zeros((1, valid.shape[1]), dtype=bool), started[:-1]])
+
+    return df_levels.where(in_span)
+
+
+def run_market_pipeline(data_dir='data',
+                        markets=None,
+                        field='Adj Close',
+                        frequency='monthly',
+                        calendar='union',
+                        start_date=None,
+                        end_date=None,
+                        starting_level=100,
+                        n_jobs=1,
+                        executor=None):
+    """
+    Description: This function loads all index histories and computes prices, returns, levels and performance
+                 metrics for every market in one run.
+
+    :param data_dir:Type str. directory of the csv files.
+    :param markets:Type list or dict. markets to include, see load_markets.
+    :param field:Type str. price column of STANDARD_COLUMNS.
+    :param frequency:Type str. 'daily' or 'monthly'.
+    :param calendar:Type str. 'union' or 'common', see market_panel.
+    :param start_date:Type datetime. optional first date (inclusive), defaults to the first date of the panel.
+    :param end_date:Type datetime. optional last date (inclusive), defaults to the last date of the panel.
+    :param starting_level:Type float. starting level of every market.
+    :param n_jobs:Type int. number of worker processes for loading; 1 loads in this process.
+    :param executor:Type concurrent.futures.Executor. optional executor for loading.
+    :return:Type dict. 'prices', 'returns' and 'levels' (date x market) dataframes and 'metrics', the
+                       performance metrics with one column per market.
+    """
+
+    d_markets = load_markets(data_dir, markets, n_jobs, executor)
+    df_prices = market_panel(d_markets, field, frequency, calendar)
+    if start_date is not None or end_date is not None:
+        df_prices = df_restrict_dates(df_prices,
+                                      df_prices.index.min() if start_date is None else start_date,
+                                      df_prices.index.max() if end_date is None else end_date)
+
+    if frequency == 'monthly':
+        df_returns = period_returns(df_prices, field=None, day_of_period='last', period='monthly')
+    else:
+        df_returns = multiple_returns_from_levels_vec(df_prices).iloc[1:]
+
+    return {'prices': df_prices,
+            'returns': df_returns,
+            'levels': market_levels(df_returns, starting_level, frequency),
+            'metrics': performance_metrics(df_returns)}
@@ -2,39 +2,166 @@
 
 Helper functions for modelling
 
+Missing value imputation is NumPy native (no machine learning library is imported): fills and statistics are
+computed on whole arrays, grouped by integer codes of the dates or equities.
+
 """
 
 import numpy as np
 import pandas as pd
 
 
-# statistics and machine learning
+# settings
+np.random.seed(1234)
 
-from sklearn.preprocessing import Imputer
 
+MISSING_VALUE_STRATEGIES = ['ffill', 'bfill', 'drop', 'mean', 'median', 'cs_mean', 'cs_median']
 
-# settings
-np.random.seed(1234)
 
+def _group_codes(keys, n_rows):
+    """
+    int codes (sorted by key) of the group keys of the rows, all rows in one group if keys is None
+    """
+    if keys is None:
+        return np.zeros(n_rows, dtype=np.int64), 1
+    codes, uniques = pd.factorize(np.asarray(keys), sort=True)
+    return codes, len(uniques)
 
-# fill missing values
 
-def df_fill_missing(df_in, missing_val_strategy='drop'):
-    miss_strategies = ['ffill', 'bfill', 'drop', 'mean', 'median']
-    assert missing_val_strategy in miss_strategies, 'not implemented'
+def fill_positions(missing, group_codes, limit=None, backward=False):
+    """
+    Description: This function computes, for every missing cell, the row of the value it is filled from by a
+                 forward (or backward) fill within its group, as pandas groupby().ffill(limit=limit).
 
-    df_out = df_in.copy()
-    if missing_val_strategy == 'bfill':
-        df_out.bfill(inplace=True)
-    if missing_val_strategy == 'ffill':
-        df_out.ffill(inplace=True)
+    :param missing:Type numpy array. boolean (row x column) array of the missing cells.
+    :param group_codes:Type numpy array. group code of every row, eg. the equity of a long panel row.
+    :param limit:Type int. maximum number of consecutive missing cells filled, None for no limit.
+    :param backward:Type boolean. fill from the next instead of the previous value.
+    :return:Type numpy array. (row x column) source rows, the row itself for present cells and -1 for cells
+                              that stay missing.
+    """
 
-    if missing_val_strategy == 'drop':
-        df_out.dropna(inplace=True)
+    n_rows = missing.shape[0]
+
+    # rows of a group contiguous and in their original order (reversed for backward fills)
+    order = np.argsort(group_codes, kind='stable')
+    if backward:
+        order = np.argsort(group_codes[::-1], kind='stable')
+        order = n_rows - 1 - order
+    codes_sorted = group_codes[order]
+    missing_sorted = missing[order]
+
+    pos = np.arange(n_rows)
+    is_start = np.ones(n_rows, dtype=bool)
+    is_start[1:] = codes_sorted[1:] != codes_sorted[:-1]
+    group_start = np.maximum.accumulate(np.where(is_start, pos, 0))
+
+    last_valid = np.maximum.accumulate(np.where(missing_sorted, -1, pos[:, np.newaxis]), axis=0)
+    filled = last_valid >= group_start[:, np.newaxis]
+    if limit is not None:
+        filled &= pos[:, np.newaxis] - last_valid <= limit
+
+    source = np.full(missing.shape, -1, dtype=np.int64)
+    source[order] = np.where(filled, order[np.maximum(last_valid, 0)], -1)
 
-    if missing_val_strategy in ['mean', 'median']:
-        imputer = Imputer(strategy=missing_val_strategy)
-        df_out = pd.DataFrame(imputer.fit_transform(df_out), columns=df_out.columns, index=df_out.index)
+    return source
 
-    return df_out
 
+def group_statistic(values, group_codes, n_groups, statistic='mean'):
+    """
+    Description: This function computes the mean or median of every column within every group, ignoring NaN,
+                 in one pass over the flattened (group, column) cells.
+
+    :param values:Type numpy array. (row x column) float values.
+    :param group_codes:Type numpy array. group code of every row, eg. the date of a long panel row.
+    :param n_groups:Type int. number of groups.
+    :param statistic:Type str. 'mean' or 'median'.
+    :return:Type numpy array. (group x column) statistics, NaN for groups without values.
+    """
+    assert statistic in ['mean', 'median'], 'not implemented'
+
+    n_rows, n_cols = values.shape
+    cells = (group_codes[:, np.newaxis] * n_cols + np.arange(n_cols)).ravel()
+    flat = values.ravel()
+    present = ~np.isnan(flat)
+
+    counts = np.bincount(cells, weights=present, minlength=n_groups * n_cols)
+
+    with np.errstate(all='ignore'):
+        if statistic == 'mean':
+            sums = np.bincount(cells, weights=np.where(present, flat, 0.0), minlength=n_groups * n_cols)
+            stat = sums / counts
+        else:
+            # values sorted within each cell, NaN last
+            order = np.lexsort((flat, cells))
+            sorted_values = flat[order]
+            starts = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=n_groups * n_cols))[:-1]])
+            counts_int = counts.astype(np.int64)
+            lower = sorted_values[np.minimum(starts + np.maximum(counts_int - 1, 0) // 2, len(flat) - 1)]
+            upper = sorted_values[np.minimum(starts + counts_int // 2, len(flat) - 1)]
+            stat = np.where(counts > 0, 0.5 * (lower + upper), np.nan)
+
+    return np.where(counts > 0, stat, np.nan).reshape(n_groups, n_cols)
+
+
+# fill missing values
+
+def df_fill_missing(df_in, missing_val_strategy='drop', dates=None, equities=None, limit=None, layout='long'):
+    """
+    Description: This function fills the missing values of a long (row x feature) or wide (date x equity)
+                 dataframe.
+
+                 'ffill', 'bfill':       fill from the previous / next value, within each equity if equities is
+                                         given (long) or per column (wide), at most limit consecutive values
+                 'drop':                 drop the rows with missing values
+                 'mean', 'median':       column mean / median over all rows
+                 'cs_mean', 'cs_median': cross-sectional mean / median of the date, per feature (long, grouped by
+                                         dates) or across the equities of the row (wide)
+
+                 Columns without any value stay missing.
+
+    :param df_in:Type pandas dataframe. long dataframe of features, or wide (date x equity) dataframe.
+    :param missing_val_strategy:Type str. one of MISSING_VALUE_STRATEGIES.
+    :param dates:Type array. date of every row of a long dataframe, eg. df_in.index; needed for 'cs_mean' and
+                 'cs_median'.
+    :param equities:Type array. equity of every row of a long dataframe, eg. df_long['company'].
+    :param limit:Type int. maximum number of consecutive values filled by 'ffill' and 'bfill'.
+    :param layout:Type str. 'long' or 'wide'.
+    :return:Type pandas dataframe. dataframe with the missing values filled.
+    """
+    assert missing_val_strategy in MISSING_VALUE_STRATEGIES, 'not implemented'
+    assert layout in ['long', 'wide'], 'not implemented'
+
+    if missing_val_strategy == 'drop':
+        return df_in.dropna()
+
+    n_rows, n_cols = df_in.shape
+
+    if missing_val_strategy in ['ffill', 'bfill']:
+        # wide: every column is one equity
+        group_codes, _ = _group_codes(equities if layout == 'long' else None, n_rows)
+        source = fill_positions(df_in.isna().to_numpy(), group_codes, limit,
+                                backward=missing_val_strategy == 'bfill')
+        df_out = df_in.copy()
+        for k in range(n_cols):
+            col_values = df_in.iloc[:, k].to_numpy()
+            df_out.iloc[:, k] = np.where(source[:, k] >= 0, col_values[np.maximum(source[:, k], 0)], col_values)
+        return df_out
+
+    values = df_in.to_numpy(dtype=float, na_value=np.nan)
+    statistic = missing_val_strategy.replace('cs_', '')
+
+    with np.errstate(all='ignore'):
+        if missing_val_strategy in ['mean', 'median']:
+            fill = group_statistic(values, np.zeros(n_rows, dtype=np.int64), 1, statistic)
+        elif layout == 'wide':
+            fill = group_statistic(values.reshape(-1, 1), np.repeat(np.arange(n_rows), n_cols), n_rows, statistic)
+        else:
+            assert dates is not None, 'dates needed for cross-sectional imputation of a long dataframe'
+            date_codes, n_dates = _group_codes(dates, n_rows)
+            fill = group_statistic(values, date_codes, n_dates, statistic)[date_codes]
+
+    fill = np.broadcast_to(fill, values.shape)
+    values = np.where(np.isnan(values), fill, values)
+
+    return pd.DataFrame(values, columns=df_in.columns, index=df_in.index)
@@ -0,0 +1,160 @@
+"""
+Out-of-core back testing for feature sets larger than memory.
+
+The features are read in column chunks from the columnar cache of data_store (memory-mapped (date x equity)
+panels, one .npy file per feature), back tested chunk by chunk with the panel engine and the detail results of
+every chunk are written to disk (one pickle per chunk) before the next chunk is read. Peak memory is bounded
+by feature_chunk_size, not by the number of features.
+
+The spilled results are aggregated across time one part at a time with the running moments of
+incremental_backtesting, which gives the layout of perform_aggregation_across_time.
+
+Typical use:
+    source = load_equity_panels(csv_path)
+    parts = backtest_to_disk(source, features, 'results/detail', returns=df_forward_returns)
+    df_agg_results = aggregate_spilled_results('results/detail', df_extra=df_index_returns)
+
+"""
+
+import glob
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .feature_backtesting_routines import custom_formatwarning, warn_backtest_feature
+from .incremental_backtesting import update_aggregation_state, aggregation_from_state
+from .instrumentation import NULL_INSTRUMENTATION
+from .panel_backtesting import panel_backtest, panel_results_to_frame
+
+
+PART_PATTERN = 'detail_%05d.pkl'
+
+
+def backtest_to_disk(source,
+                     features,
+                     out_dir,
+                     returns='returns',
+                     n_bins=5,
+                     bin_labels=None,
+                     corr_method='spearman',
+                     items_per_bin_deviation_threshold=1,
+                     drop_months_outside_of_threshold=False,
+                     feature_chunk_size=50,
+                     instrumentation=None):
+    """
+    Description: This function back tests the features of a columnar source chunk by chunk and writes the
+                 detail results of every chunk to out_dir. Existing parts in out_dir are removed first.
+                 The results of all parts together equal get_detail_backtest_results on the long dataframe.
+
+    :param source:Type dict. columnar source as returned by data_store.load_equity_panels: 'dates', 'equities',
+                  'present' and 'panels', a dict of (date x equity) dataframes backed by memory maps.
+    :param features:Type list. list of features (panel names) to back test.
+    :param out_dir:Type str. directory for the detail results parts.
+    :param returns:Type str or pandas dataframe. name of the returns panel in the source, or a (date x equity)
+                   dataframe of returns, aligned to the dates and equities of the source.
+    :param n_bins:Type int. number of bins to split the equities into.
+    :param bin_labels:Type list. list of bin labels, in descending order.
+    :param corr_method:Type string. correlation method being used.
+    :param items_per_bin_deviation_threshold:Type int. Permissible deviation from the expected number of items per bin.
+    :param drop_months_outside_of_threshold:Type boolean. Decision to drop months that deviate beyond the acceptable
+                                                          items_per_bin_deviation_threshold.
+    :param feature_chunk_size:Type int. number of features read and back tested at once.
+    :param instrumentation:Type BacktestInstrumentation. optional stage timers.
+    :return:Type list. paths of the written parts, in feature order.
+    """
+
+    if bin_labels is None:
+        bin_labels = ['Q' + str(i + 1) for i in range(n_bins)]
+    if instrumentation is None:
+        instrumentation = NULL_INSTRUMENTATION
+
+    dates = source['dates']
+    equities = source['equities']
+    present = np.asarray(source['present'], dtype=bool)
+
+    return_name = None
+    if isinstance(returns, str):
+        return_name = returns
+        returns = source['panels'][returns]
+    returns = returns.reindex(index=dates, columns=equities).to_numpy(dtype=float, na_value=np.nan)
+
+    features = sorted(feature for feature in features if feature != return_name)
+
+    os.makedirs(out_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(out_dir, 'detail_*.pkl')):
+        os.remove(path)
+
+    warnings.formatwarning = custom_formatwarning
+
+    parts = []
+    for part_no, chunk_start in enumerate(range(0, len(features), feature_chunk_size)):
+        chunk_features = features[chunk_start:chunk_start + feature_chunk_size]
+
+        with instrumentation.stage('read', len(chunk_features)):
+            values = np.empty((len(dates), len(equities), len(chunk_features)))
+            for k, feature in enumerate(chunk_features):
+                values[:, :, k] = source['panels'][feature].to_numpy(dtype=float, na_value=np.nan)
+
+        results = panel_backtest(dates, present, returns, values, n_bins, corr_method,
+                                 items_per_bin_deviation_threshold, drop_months_outside_of_threshold,
+                                 instrumentation=instrumentation)
+
+        for k, feature in enumerate(chunk_features):
+            warn_backtest_feature(feature,
+                                  results['insufficient_bins_dates'][k],
+                                  results['bin_lowest_bad_dates'][k],
+                                  results['bin_highest_bad_dates'][k],
+                                  drop_months_outside_of_threshold)
+
+        with instrumentation.stage('write', len(chunk_features)):
+            path = os.path.join(out_dir, PART_PATTERN % part_no)
+            pd.to_pickle(panel_results_to_frame(dates, chunk_features, results, bin_labels), path)
+            parts.append(path)
+
+        del values, results
+
+    return parts
+
+
+def iter_spilled_results(out_dir, features=None):
+    """
+    Description: This function reads the spilled detail results one part at a time.
+
+    :param out_dir:Type str. directory of the detail results parts.
+    :param features:Type list. optional list of features to keep.
+    :return:Type generator. detail results dataframes, one per part.
+    """
+
+    for path in sorted(glob.glob(os.path.join(out_dir, 'detail_*.pkl'))):
+        df_part = pd.read_pickle(path)
+        if features is not None:
+            df_part = df_part[df_part['feature'].isin(features)]
+        yield df_part
+
+
+def aggregate_spilled_results(out_dir, df_extra=None, features=None):
+    """
+    Description: This function aggregates the spilled detail results across time, one part at a time, with the
+                 layout of perform_aggregation_across_time. Only one part is held in memory.
+
+    :param out_dir:Type str. directory of the detail results parts.
+    :param df_extra:Type pandas dataframe. optional date indexed columns merged onto every part before it is
+                    aggregated, eg. the Qe and mc_return index returns.
+    :param features:Type list. optional list of features to aggregate.
+    :return:Type pandas dataframe. Aggregated dataframe, empty if there are no detail results rows.
+    """
+
+    state = {}
+    for df_part in iter_spilled_results(out_dir, features):
+        if df_extra is not None:
+            df_part = df_part.merge(df_extra, left_index=True, right_index=True)
+        if df_part.empty:
+            continue
+        state = update_aggregation_state(state, df_part)
+
+    if 'n' not in state:
+        return pd.DataFrame()
+
+    return aggregation_from_state(state)
@@ -0,0 +1,316 @@
+"""
+Vectorized back testing on a date x equity x feature numpy panel.
+
+All features of a chunk are ranked, binned and aggregated at once, instead of
+one pandas groupby pass per feature.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from .information_coefficient import tie_ranks, cross_sectional_corr
+from .instrumentation import NULL_INSTRUMENTATION
+
+
+def panel_codes(df_long,
+                equity_identifier='Equity Parent',
+                date_col_name='date'):
+    """
+    Description: This function int-codes the date and equity columns of a long dataframe.
+
+    :param df_long:Type pandas dataframe. long format dataframe with date and equity identifier columns.
+    :param equity_identifier:Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :return:Type tuple. (date_codes, equity_codes, dates, equities); codes are int64 arrays with one entry per row,
+                        dates a sorted pandas DatetimeIndex and equities the sorted unique equity identifiers.
+    """
+
+    date_codes, dates = pd.factorize(df_long[date_col_name], sort=True)
+    equity_codes, equities = pd.factorize(df_long[equity_identifier], sort=True)
+
+    flat_codes = date_codes.astype(np.int64) * len(equities) + equity_codes
+    assert np.unique(flat_codes).shape[0] == flat_codes.shape[0], 'duplicate date/equity rows not supported'
+
+    dates = pd.DatetimeIndex(dates, name=date_col_name)
+
+    return date_codes.astype(np.int64), equity_codes.astype(np.int64), dates, equities
+
+
+def scatter_to_panel(date_codes, equity_codes, n_dates, n_equities, column_values):
+    """
+    Description: This function places row level values into a (date x equity) or (date x equity x column) array,
+                 with NaN for (date, equity) pairs without a row.
+
+    :param date_codes:Type numpy array. int date code per row.
+    :param equity_codes:Type numpy array. int equity code per row.
+    :param n_dates:Type int. number of dates.
+    :param n_equities:Type int. number of equities.
+    :param column_values:Type numpy array. 1d array of values per row, or 2d (row x column) array.
+    :return:Type numpy array. float panel.
+    """
+
+    panel = np.full((n_dates, n_equities) + column_values.shape[1:], np.nan)
+    panel[date_codes, equity_codes] = column_values
+
+    return panel
+
+
+def long_to_panel(df_long,
+                  features,
+                  return_col_name='returns',
+                  equity_identifier='Equity Parent',
+                  date_col_name='date'):
+    """
+    Description: This function pivots a long dataframe into numpy arrays indexed by date and equity.
+                 Missing (date, equity) rows become NaN and are flagged in the presence mask.
+
+    :param df_long:Type pandas dataframe. long format dataframe with date and equity identifier columns.
+    :param features:Type list. list of feature columns to pivot.
+    :param return_col_name:Type str. Name of the return column.
+    :param equity_identifier:Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :return:Type tuple. (dates, equities, present, returns, values) where present is a boolean (date x equity) array,
+                        returns a float (date x equity) array and values a float (date x equity x feature) array.
+    """
+
+    date_codes, equity_codes, dates, equities = panel_codes(df_long, equity_identifier, date_col_name)
+
+    n_dates = len(dates)
+    n_equities = len(equities)
+
+    present = np.zeros((n_dates, n_equities), dtype=bool)
+    present[date_codes, equity_codes] = True
+
+    returns = scatter_to_panel(date_codes, equity_codes, n_dates, n_equities,
+                               df_long[return_col_name].to_numpy(dtype=float, na_value=np.nan))
+
+    values = scatter_to_panel(date_codes, equity_codes, n_dates, n_equities,
+                              df_long[features].to_numpy(dtype=float, na_value=np.nan))
+
+    return dates, equities, present, returns, values
+
+
+def bins_from_ranks(equity_rank, n_bins):
+    """
+    Description: This function assigns bin numbers from descending (min method) ranks within each date,
+                 as add_bins_col_to_rank_df does. The ranks do not depend on n_bins and can be reused.
+
+    :param equity_rank:Type numpy array. (date x equity x feature) ranks, NaN where the feature is missing.
+    :param n_bins:Type int. number of bins to split the equities into.
+    :return:Type numpy array. int8 (int16 above 127 bins) (date x equity x feature) bin numbers,
+                              0 where the feature is missing.
+    """
+
+    with np.errstate(all='ignore'):
+        max_rank = np.fmax.reduce(equity_rank, axis=1, keepdims=True)
+        bin_no = 1 + (n_bins * (equity_rank - 1) // max_rank)
+
+    return np.nan_to_num(bin_no, nan=0.0).astype(np.int8 if n_bins <= 127 else np.int16)
+
+
+def bins_from_values(values, n_bins):
+    """
+    Description: This function ranks the feature values within each date (descending, min method) and
+                 assigns bin numbers exactly like get_ranks followed by add_bins_col_to_rank_df.
+
+    :param values:Type numpy array. (date x equity x feature) feature values.
+    :param n_bins:Type int. number of bins to split the equities into.
+    :return:Type numpy array. int8 (date x equity x feature) bin numbers, 0 where the feature is missing.
+    """
+
+    return bins_from_ranks(tie_ranks(values, method='min', ascending=False, axis=1), n_bins)
+
+
+def bin_counts(bin_no, bin_idx):
+    """
+    Description: Number of items per date and feature that fall into bin bin_idx.
+
+    :param bin_no:Type numpy array. (date x equity x feature) bin numbers.
+    :param bin_idx:Type int. bin number.
+    :return:Type numpy array. (date x feature) item counts.
+    """
+
+    return (bin_no == bin_idx).sum(axis=1)
+
+
+def bin_return_statistics(returns, bin_no, n_bins):
+    """
+    Description: This function computes the mean and standard deviation (ddof=1) of the returns
+                 per date, feature and bin in a single pass over the panel.
+
+    :param returns:Type numpy array. (date x equity) returns.
+    :param bin_no:Type numpy array. (date x equity x feature) bin numbers, 0 (or NaN) for items outside any bin.
+    :param n_bins:Type int. number of bins.
+    :return:Type tuple. (bin_avg, bin_std), both float (date x feature x bin) arrays.
+    """
+
+    n_dates, _, n_features = bin_no.shape
+
+    valid = (bin_no > 0) & ~np.isnan(returns)[:, :, np.newaxis]
+    date_idx, _, feature_idx = np.nonzero(valid)
+    rets = np.broadcast_to(returns[:, :, np.newaxis], bin_no.shape)[valid]
+    bin_idx = bin_no[valid].astype(np.int64) - 1
+
+    group = (date_idx * n_features + feature_idx) * n_bins + bin_idx
+    n_groups = n_dates * n_features * n_bins
+
+    counts = np.bincount(group, minlength=n_groups)
+    sums = np.bincount(group, weights=rets, minlength=n_groups)
+
+    with np.errstate(all='ignore'):
+        bin_avg = sums / counts
+        sq_dev = np.bincount(group, weights=(rets - bin_avg[group]) ** 2, minlength=n_groups)
+        bin_std = np.sqrt(sq_dev / (counts - 1))
+
+    bin_std[counts < 2] = np.nan
+
+    shape = (n_dates, n_features, n_bins)
+
+    return bin_avg.reshape(shape), bin_std.reshape(shape)
+
+
+def threshold_checks(present, keep, cnt_lowest, cnt_highest, n_bins, items_per_bin_deviation_threshold,
+                     prior_items=None):
+    """
+    Description: This function flags the dates on which the number of items in the lowest or highest bin deviates
+                 from the expected number of items per bin by more than the threshold. The expected number is based
+                 on all equities present on any retained date.
+
+    :param present:Type numpy array. boolean (date x equity) array, True where a row exists in the long dataframe.
+    :param keep:Type numpy array. boolean (date x feature) array of retained dates.
+    :param cnt_lowest:Type numpy array. (date x feature) number of items in bin 1.
+    :param cnt_highest:Type numpy array. (date x feature) number of items in bin n_bins.
+    :param n_bins:Type int. number of bins.
+    :param items_per_bin_deviation_threshold:Type int. Permissible deviation from the expected number of items per bin.
+    :param prior_items:Type numpy array. optional boolean (equity x feature) array of items seen on earlier dates.
+    :return:Type tuple. (items, lowest_bad, highest_bad); items is the boolean (equity x feature) array of
+                        counted items, lowest_bad and highest_bad boolean (date x feature) arrays.
+    """
+
+    # items present on any retained date, per feature
+    items = (present[:, :, np.newaxis] & keep[:, np.newaxis, :]).any(axis=0)
+    if prior_items is not None:
+        items = items | prior_items
+    expected_no_of_items_per_bin = items.sum(axis=0) / n_bins
+
+    lowest_bad = keep & (cnt_lowest > 0) & \
+        (abs(cnt_lowest - expected_no_of_items_per_bin) > items_per_bin_deviation_threshold)
+    highest_bad = keep & (cnt_highest > 0) & \
+        (abs(cnt_highest - expected_no_of_items_per_bin) > items_per_bin_deviation_threshold)
+
+    return items, lowest_bad, highest_bad
+
+
+def panel_backtest(dates,
+                   present,
+                   returns,
+                   values,
+                   n_bins=5,
+                   corr_method='spearman',
+                   items_per_bin_deviation_threshold=1,
+                   drop_months_outside_of_threshold=False,
+                   prior_items=None,
+                   instrumentation=None):
+    """
+    Description: This function runs the back test for all features of a panel at once.
+                 The logic mirrors the per-feature steps of get_detail_backtest_results:
+                 ranks and bins, removal of dates with insufficient bins, threshold checks on the
+                 top and bottom bins, and the date level bin statistics, spread and cross sectional correlation.
+
+    :param dates:Type pandas DatetimeIndex. dates of the panel.
+    :param present:Type numpy array. boolean (date x equity) array, True where a row exists in the long dataframe.
+    :param returns:Type numpy array. (date x equity) returns.
+    :param values:Type numpy array. (date x equity x feature) feature values.
+    :param n_bins:Type int. number of bins to split the equities into.
+    :param corr_method:Type string. correlation method being used.
+    :param items_per_bin_deviation_threshold:Type int. Permissible deviation from the expected number of items per bin.
+    :param drop_months_outside_of_threshold:Type boolean. Decision to drop months that deviate beyond the acceptable
+                                                          items_per_bin_deviation_threshold.
+    :param prior_items:Type numpy array. optional boolean (equity x feature) array of items already seen on earlier
+                       dates, which count towards the expected number of items per bin (incremental back testing).
+    :param instrumentation:Type BacktestInstrumentation. optional, times the ranking, bin_check, threshold_check,
+                           bin_statistics and correlation stages.
+    :return:Type dict. arrays 'keep' (date x feature), 'items' (equity x feature) the items on retained dates,
+                       'bin_avg' and 'bin_std' (date x feature x bin), 'spread' and 'ic_cs' (date x feature),
+                       per feature lists of formatted dates 'insufficient_bins_dates', 'bin_lowest_bad_dates',
+                       'bin_highest_bad_dates', and per feature counters 'rows_in', 'rows_dropped', 'dates_dropped'.
+    """
+
+    n_features = values.shape[2]
+
+    if instrumentation is None:
+        instrumentation = NULL_INSTRUMENTATION
+
+    with instrumentation.stage('ranking', n_features):
+        bin_no = bins_from_values(values, n_bins)
+
+    with instrumentation.stage('bin_check', n_features):
+        keep = bin_no.max(axis=1, initial=0) == n_bins
+        insufficient_bins = ~keep
+
+    with instrumentation.stage('threshold_check', n_features):
+        items, lowest_bad, highest_bad = threshold_checks(present, keep, bin_counts(bin_no, 1),
+                                                          bin_counts(bin_no, n_bins), n_bins,
+                                                          items_per_bin_deviation_threshold, prior_items)
+
+        if drop_months_outside_of_threshold:
+            keep = keep & ~lowest_bad & ~highest_bad
+
+    with instrumentation.stage('bin_statistics', n_features):
+        bin_no = np.where(keep[:, np.newaxis, :], bin_no, 0)
+        bin_avg, bin_std = bin_return_statistics(returns, bin_no, n_bins)
+
+        spread = (bin_avg[:, :, 0] - bin_avg[:, :, n_bins - 1]) * 100
+
+    with instrumentation.stage('correlation', n_features):
+        ic_cs = cross_sectional_corr(returns, np.where(keep[:, np.newaxis, :], values, np.nan), corr_method)
+
+    rows_per_date = present.sum(axis=1)
+    date_strings = np.array([item.strftime("%Y-%m-%d") for item in dates])
+
+    return {'keep': keep,
+            'items': items,
+            'bin_avg': bin_avg,
+            'bin_std': bin_std,
+            'spread': spread,
+            'ic_cs': ic_cs,
+            'rows_in': np.full(n_features, rows_per_date.sum()),
+            'rows_dropped': rows_per_date @ ~keep,
+            'dates_dropped': (~keep).sum(axis=0),
+            'insufficient_bins_dates': [date_strings[insufficient_bins[:, k]].tolist() for k in range(n_features)],
+            'bin_lowest_bad_dates': [date_strings[lowest_bad[:, k]].tolist() for k in range(n_features)],
+            'bin_highest_bad_dates': [date_strings[highest_bad[:, k]].tolist() for k in range(n_features)]}
+
+
+def panel_results_to_frame(dates, features, results, bin_labels):
+    """
+    Description: This function converts the panel back testing arrays into the long detail results dataframe,
+                 with one row per retained date and feature, sorted by feature and date.
+
+    :param dates:Type pandas DatetimeIndex. dates of the panel.
+    :param features:Type list. list of features, in the order of the panel feature axis.
+    :param results:Type dict. output of panel_backtest.
+    :param bin_labels:Type list. list of bin labels, in descending order.
+    :return:Type pandas dataframe. detail back testing results, indexed by date.
+    """
+
+    n_dates = len(dates)
+    keep = results['keep'].T.ravel()
+
+    df_out = pd.DataFrame(index=np.tile(dates, len(features))[keep])
+    df_out.index.name = dates.name
+
+    for index, bin_lbl in enumerate(bin_labels):
+        df_out[bin_lbl + '_avg'] = results['bin_avg'][:, :, index].T.ravel()[keep]
+        df_out[bin_lbl + '_std'] = results['bin_std'][:, :, index].T.ravel()[keep]
+
+    df_out['spread'] = results['spread'].T.ravel()[keep]
+    df_out['ic_cs'] = results['ic_cs'].T.ravel()[keep]
+
+    features = np.asarray(features, dtype=object)
+    categories = np.array([feature.split('_bshift')[0] for feature in features], dtype=object)
+    df_out['feature'] = np.repeat(features, n_dates)[keep]
+    df_out['category'] = np.repeat(categories, n_dates)[keep]
+
+    return df_out
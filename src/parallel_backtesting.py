@@ -0,0 +1,184 @@
+"""
+Process pool execution of the panel back test.
+
+The columns of the long dataframe that the back test needs (date and equity codes,
+returns and feature values) are copied once into shared memory. Workers attach to
+the shared blocks and back test a shard of features each, so the dataframe is never
+pickled per task.
+
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .instrumentation import BacktestInstrumentation, NULL_INSTRUMENTATION
+from .panel_backtesting import panel_codes, scatter_to_panel, panel_backtest
+
+
+def _create_shared_array(shape, dtype, order='C'):
+    """
+    Allocate a numpy array backed by a new shared memory block.
+    """
+
+    n_bytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=n_bytes)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, order=order)
+
+    return shm, array
+
+
+def _attach_shared_array(spec):
+    """
+    Attach to a shared memory block described by spec = (name, shape, dtype, order).
+    """
+
+    name, shape, dtype, order = spec
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, order=order)
+
+    return shm, array
+
+
+def _backtest_shard(array_specs, feature_slice, dates, n_equities, backtest_kwargs, instrument=False):
+    """
+    Worker task: build the panel for the features in feature_slice from shared memory and back test it.
+    With instrument=True the stage timings are returned under 'instrumentation_records'.
+    """
+
+    instrumentation = BacktestInstrumentation() if instrument else NULL_INSTRUMENTATION
+
+    n_dates = len(dates)
+
+    blocks = []
+    arrays = {}
+
+    try:
+        for key, spec in array_specs.items():
+            shm, arrays[key] = _attach_shared_array(spec)
+            blocks.append(shm)
+
+        date_codes = arrays['date_codes']
+        equity_codes = arrays['equity_codes']
+        present = np.zeros((n_dates, n_equities), dtype=bool)
+        present[date_codes, equity_codes] = True
+
+        with instrumentation.stage('panel', feature_slice[1] - feature_slice[0]):
+            returns = scatter_to_panel(date_codes, equity_codes, n_dates, n_equities, arrays['returns'])
+            values = scatter_to_panel(date_codes, equity_codes, n_dates, n_equities,
+                                      arrays['values'][:, feature_slice[0]:feature_slice[1]])
+
+        shard_results = panel_backtest(dates, present, returns, values,
+                                       instrumentation=instrumentation, **backtest_kwargs)
+        if instrument:
+            shard_results['instrumentation_records'] = instrumentation.records
+
+    finally:
+        # views on the shared buffers have to be released before the blocks can be closed
+        arrays.clear()
+        date_codes = equity_codes = None
+        for shm in blocks:
+            shm.close()
+
+    return shard_results
+
+
+def parallel_panel_backtest(df_long,
+                            features,
+                            return_col_name='returns',
+                            equity_identifier='Equity Parent',
+                            date_col_name='date',
+                            n_jobs=None,
+                            executor=None,
+                            feature_chunk_size=250,
+                            instrumentation=None,
+                            **backtest_kwargs):
+    """
+    Description: This function shards the features across worker processes and back tests every shard
+                 with panel_backtest. The needed columns of df_long are passed through shared memory.
+
+                 Results are returned in the order of features, independent of the order in which workers finish.
+                 Warnings are not issued by the workers; the per feature date lists are returned for the caller.
+
+    :param df_long:Type pandas dataframe. long format dataframe.
+    :param features:Type list. list of features, already sorted.
+    :param return_col_name:Type str. Name of the return column.
+    :param equity_identifier:Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :param n_jobs:Type int. number of worker processes, defaults to the number of cpus. Used to size the shards,
+                   and the pool if no executor is given.
+    :param executor:Type concurrent.futures.Executor. optional executor to submit the shards to.
+    :param feature_chunk_size:Type int. maximum number of features per shard.
+    :param instrumentation:Type BacktestInstrumentation. optional; the stage timings of the workers are merged into it
+                           (profiling is not captured in the workers).
+    :param backtest_kwargs: keyword arguments passed on to panel_backtest.
+    :return:Type list. list of (shard_features, dates, shard_results) tuples, in feature order.
+    """
+
+    if instrumentation is None:
+        instrumentation = NULL_INSTRUMENTATION
+
+    date_codes, equity_codes, dates, equities = panel_codes(df_long, equity_identifier, date_col_name)
+    n_rows = len(date_codes)
+    n_features = len(features)
+
+    n_workers = n_jobs if n_jobs is not None and n_jobs > 0 else os.cpu_count()
+
+    shard_size = max(1, min(feature_chunk_size, math.ceil(n_features / n_workers)))
+    shards = [(start, min(start + shard_size, n_features)) for start in range(0, n_features, shard_size)]
+
+    blocks = []
+    array_specs = {}
+
+    try:
+        for key, shape, dtype, order in [('date_codes', (n_rows,), np.int64, 'C'),
+                                         ('equity_codes', (n_rows,), np.int64, 'C'),
+                                         ('returns', (n_rows,), np.float64, 'C'),
+                                         ('values', (n_rows, n_features), np.float64, 'F')]:
+            shm, array = _create_shared_array(shape, dtype, order)
+            blocks.append(shm)
+            array_specs[key] = (shm.name, shape, dtype, order)
+
+            if key == 'date_codes':
+                array[:] = date_codes
+            elif key == 'equity_codes':
+                array[:] = equity_codes
+            elif key == 'returns':
+                array[:] = df_long[return_col_name].to_numpy(dtype=float, na_value=np.nan)
+            else:
+                # column by column, to avoid an intermediate copy of all features
+                for k, feature in enumerate(features):
+                    array[:, k] = df_long[feature].to_numpy(dtype=float, na_value=np.nan)
+            del array
+
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=n_workers)
+
+        try:
+            futures = [executor.submit(_backtest_shard,
+                                       array_specs,
+                                       shard,
+                                       dates,
+                                       len(equities),
+                                       backtest_kwargs,
+                                       instrumentation.enabled)
+                       for shard in shards]
+            shard_results = [future.result() for future in futures]
+        finally:
+            if own_executor:
+                executor.shutdown()
+
+    finally:
+        array = None
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    for results in shard_results:
+        instrumentation.merge(results.pop('instrumentation_records', []))
+
+    return [(features[start:end], dates, results) for (start, end), results in zip(shards, shard_results)]
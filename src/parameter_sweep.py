@@ -0,0 +1,142 @@
+"""
+Parameter sweeps of the back test that reuse the ranks.
+
+The within date ranks of the feature values, the cross sectional correlations and, per number of bins, the bin
+statistics do not depend on the date window or the threshold settings: a date window or a dropped date only
+removes whole dates. They are computed once on the full panel; every configuration of the grid then only
+re-runs the threshold checks (the expected number of items per bin depends on the equities of the window)
+and masks the retained dates. The results are the same as running get_detail_backtest_results on the input
+restricted with df_restrict_dates for every configuration.
+
+Typical use:
+    df_sweep = parameter_sweep(input_df, features, n_bins_list=[3, 5, 10],
+                               date_windows=[None, (datetime(2010, 1, 1), datetime(2014, 12, 31))],
+                               thresholds=[1, 2], equity_identifier=eq_name)
+    df_summary = sweep_aggregation(df_sweep)
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from .information_coefficient import tie_ranks, cross_sectional_corr
+from .panel_backtesting import long_to_panel, bins_from_ranks, bin_counts, bin_return_statistics, \
+    threshold_checks, panel_results_to_frame
+
+
+SWEEP_LEVELS = ['n_bins', 'start_date', 'end_date', 'items_per_bin_deviation_threshold',
+                'drop_months_outside_of_threshold']
+
+
+def parameter_sweep(input_df,
+                    features,
+                    n_bins_list=(5,),
+                    date_windows=(None,),
+                    thresholds=(1,),
+                    drop_months_options=(False,),
+                    return_col_name='returns',
+                    equity_identifier='Equity Parent',
+                    date_col_name='date',
+                    corr_method='spearman'):
+    """
+    Description: This function back tests a grid of configurations from ranks computed once per feature and date.
+                 Warnings are not issued for the individual configurations.
+
+    :param input_df:Type pandas dataframe. long format dataframe, as for get_detail_backtest_results.
+    :param features:Type list. list of features for which backtesting needs to be performed.
+    :param n_bins_list:Type list. numbers of bins, eg. [3, 5, 10].
+    :param date_windows:Type list. (start_date, end_date) tuples, boundaries inclusive as in df_restrict_dates,
+                        None for all dates.
+    :param thresholds:Type list. values of items_per_bin_deviation_threshold.
+    :param drop_months_options:Type list. values of drop_months_outside_of_threshold.
+    :param return_col_name: Type str. Name of the return column.
+    :param equity_identifier : Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :param corr_method:Type string. correlation method being used.
+    :return:Type pandas dataframe. detail back testing results of all configurations, indexed by n_bins,
+                                   start_date, end_date, items_per_bin_deviation_threshold,
+                                   drop_months_outside_of_threshold and date. Bin columns run up to the largest
+                                   number of bins (NaN for configurations with fewer bins).
+    """
+
+    df_long = input_df
+    if date_col_name not in list(df_long.columns):
+        df_long = df_long.reset_index()
+        df_long.rename(columns={'index': 'date'}, inplace=True)
+
+    features = sorted(feature for feature in features if feature != return_col_name)
+
+    dates, _, present, returns, values = long_to_panel(df_long, features, return_col_name,
+                                                       equity_identifier, date_col_name)
+
+    # independent of the configuration
+    equity_rank = tie_ranks(values, method='min', ascending=False, axis=1)
+    ic_cs = cross_sectional_corr(returns, values, corr_method)
+
+    windows = []
+    for window in date_windows:
+        if window is None:
+            windows.append((dates.min(), dates.max(), np.ones(len(dates), dtype=bool)))
+        else:
+            start_date, end_date = pd.Timestamp(window[0]), pd.Timestamp(window[1])
+            windows.append((start_date, end_date, np.asarray((dates >= start_date) & (dates <= end_date))))
+
+    df_list = []
+    keys = []
+
+    for n_bins in n_bins_list:
+        bin_labels = ['Q' + str(i + 1) for i in range(n_bins)]
+
+        bin_no = bins_from_ranks(equity_rank, n_bins)
+        sufficient_bins = bin_no.max(axis=1, initial=0) == n_bins
+        cnt_lowest = bin_counts(bin_no, 1)
+        cnt_highest = bin_counts(bin_no, n_bins)
+        bin_avg, bin_std = bin_return_statistics(returns, bin_no, n_bins)
+        spread = (bin_avg[:, :, 0] - bin_avg[:, :, n_bins - 1]) * 100
+
+        for start_date, end_date, in_window in windows:
+            keep_window = sufficient_bins & in_window[:, np.newaxis]
+
+            for threshold in thresholds:
+                _, lowest_bad, highest_bad = threshold_checks(present, keep_window, cnt_lowest, cnt_highest,
+                                                              n_bins, threshold)
+
+                for drop_months in drop_months_options:
+                    keep = keep_window
+                    if drop_months:
+                        keep = keep & ~lowest_bad & ~highest_bad
+
+                    results = {'keep': keep, 'bin_avg': bin_avg, 'bin_std': bin_std,
+                               'spread': spread, 'ic_cs': ic_cs}
+                    df_list.append(panel_results_to_frame(dates, features, results, bin_labels))
+                    keys.append((n_bins, start_date, end_date, threshold, drop_months))
+
+    df_out = pd.concat(df_list, keys=keys, names=SWEEP_LEVELS)
+
+    # bin columns in bin order, then the remaining columns
+    max_bins = max(n_bins_list)
+    bin_cols = [lbl + stat for lbl in ['Q' + str(i + 1) for i in range(max_bins)] for stat in ['_avg', '_std']]
+
+    return df_out[bin_cols + ['spread', 'ic_cs', 'feature', 'category']]
+
+
+def sweep_aggregation(df_sweep, cols=('spread', 'ic_cs')):
+    """
+    Description: This function aggregates the sweep results across time, per configuration and feature.
+
+    :param df_sweep:Type pandas dataframe. output of parameter_sweep.
+    :param cols:Type list. columns to aggregate.
+    :return:Type pandas dataframe. indexed by the configuration levels, feature and category, with the number of
+                                   dates and <col>_avg, <col>_std for every column.
+    """
+
+    grouped = df_sweep.groupby(SWEEP_LEVELS + ['feature', 'category'])[list(cols)]
+
+    df_out = pd.DataFrame({'n_dates': grouped.size()})
+    df_mean = grouped.mean()
+    df_std = grouped.std()
+    for col in cols:
+        df_out[col + '_avg'] = df_mean[col]
+        df_out[col + '_std'] = df_std[col]
+
+    return df_out
@@ -0,0 +1,345 @@
+"""
+Mean-variance portfolio optimization (efficient frontier) on precomputed moments.
+
+The mean vector and covariance matrix of the returns are computed once (portfolio_moments) and passed to the
+optimizers; objectives and constraints come with analytic gradients for SLSQP:
+    variance w' C w                 gradient 2 C w
+    Sharpe ratio (w' m - rf) / vol  gradient m / vol - (w' m - rf) C w / vol^3
+    target return w' m = r          gradient m
+    budget sum(w) = 1               gradient 1
+
+The frontier is solved in sweeps over chunks of the sorted target returns, each solve warm-started from the
+previous weights and every chunk from the minimum variance portfolio; the chunks can be spread over a process pool.
+With long-only bounds the tangency portfolio of the capital market line is the maximum Sharpe ratio portfolio for
+the risk free rate, which replaces the spline and fsolve construction of the portfolio theory notebook.
+
+Returns are annualized with periods_per_year (252 trading days as in the notebook).
+
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.optimize as sco
+
+from .risk_model import rolling_covariance
+from .rolling_metrics import window_moments
+
+
+def portfolio_moments(df_returns, periods_per_year=252):
+    """
+    Description: This function computes the annualized mean returns and covariance matrix once.
+
+    :param df_returns:Type pandas dataframe. (date x asset) period returns.
+    :param periods_per_year:Type int. number of periods per year used for annualization.
+    :return:Type tuple. (mean, cov) numpy arrays.
+    """
+
+    return df_returns.mean().to_numpy() * periods_per_year, df_returns.cov().to_numpy() * periods_per_year
+
+
+def portfolio_statistics(weights, mean, cov, rf=0.0):
+    """
+    Description: This function computes the expected return, volatility and Sharpe ratio of one or many portfolios.
+
+    :param weights:Type numpy array. (asset) or (portfolio x asset) weights.
+    :param mean:Type numpy array. annualized mean returns.
+    :param cov:Type numpy array. annualized covariance matrix.
+    :param rf:Type float. risk free rate.
+    :return:Type numpy array. [return, volatility, Sharpe ratio], with a leading portfolio axis for 2d weights.
+    """
+
+    weights = np.asarray(weights, dtype=float)
+    ret = weights @ mean
+    vol = np.sqrt(np.einsum('...i,ij,...j->...', weights, cov, weights))
+
+    return np.stack([ret, vol, (ret - rf) / vol], axis=-1)
+
+
+def _variance(weights, cov):
+    cov_w = cov @ weights
+    return weights @ cov_w, 2.0 * cov_w
+
+
+def _negative_sharpe(weights, mean, cov, rf):
+    cov_w = cov @ weights
+    vol = math.sqrt(weights @ cov_w)
+    excess = weights @ mean - rf
+    return -excess / vol, -(mean / vol - excess * cov_w / vol ** 3)
+
+
+def _budget_constraint(n_assets):
+    ones = np.ones(n_assets)
+    return {'type': 'eq', 'fun': lambda w: w.sum() - 1.0, 'jac': lambda w: ones}
+
+
+def _bounds(n_assets, bounds):
+    return [bounds] * n_assets if isinstance(bounds, tuple) else list(bounds)
+
+
+def min_variance_portfolio(mean, cov, bounds=(0.0, 1.0), x0=None):
+    """
+    Description: This function computes the minimum variance portfolio.
+
+    :param mean:Type numpy array. annualized mean returns.
+    :param cov:Type numpy array. annualized covariance matrix.
+    :param bounds:Type tuple. (lower, upper) bounds for every weight, or a list of bounds per asset.
+    :param x0:Type numpy array. optional starting weights, defaults to equal weights.
+    :return:Type numpy array. weights.
+    """
+
+    n_assets = len(mean)
+    x0 = np.full(n_assets, 1.0 / n_assets) if x0 is None else x0
+    res = sco.minimize(_variance, x0, args=(cov,), jac=True, method='SLSQP',
+                       bounds=_bounds(n_assets, bounds), constraints=[_budget_constraint(n_assets)])
+
+    return res['x']
+
+
+def max_sharpe_portfolio(mean, cov, rf=0.0, bounds=(0.0, 1.0), x0=None):
+    """
+    Description: This function computes the maximum Sharpe ratio portfolio for a risk free rate, ie. the tangency
+                 portfolio of the capital market line.
+
+    :param mean:Type numpy array. annualized mean returns.
+    :param cov:Type numpy array. annualized covariance matrix.
+    :param rf:Type float. risk free rate.
+    :param bounds:Type tuple. (lower, upper) bounds for every weight, or a list of bounds per asset.
+    :param x0:Type numpy array. optional starting weights, defaults to equal weights.
+    :return:Type numpy array. weights.
+    """
+
+    n_assets = len(mean)
+    x0 = np.full(n_assets, 1.0 / n_assets) if x0 is None else x0
+    res = sco.minimize(_negative_sharpe, x0, args=(mean, cov, rf), jac=True, method='SLSQP',
+                       bounds=_bounds(n_assets, bounds), constraints=[_budget_constraint(n_assets)])
+
+    return res['x']
+
+
+def capital_market_line(mean, cov, rf=0.01, bounds=(0.0, 1.0)):
+    """
+    Description: This function computes the capital market line r = rf + slope * vol through the tangency portfolio.
+
+    :param mean:Type numpy array. annualized mean returns.
+    :param cov:Type numpy array. annualized covariance matrix.
+    :param rf:Type float. risk free rate.
+    :param bounds:Type tuple. (lower, upper) bounds for every weight, or a list of bounds per asset.
+    :return:Type dict. 'intercept', 'slope' (Sharpe ratio of the tangency portfolio), 'vol_tangency',
+                       'return_tangency' and 'weights' of the tangency portfolio.
+    """
+
+    weights = max_sharpe_portfolio(mean, cov, rf, bounds)
+    ret, vol, sharpe = portfolio_statistics(weights, mean, cov, rf)
+
+    return {'intercept': rf, 'slope': sharpe, 'vol_tangency': vol, 'return_tangency': ret, 'weights': weights}
+
+
+def _frontier_sweep(mean, cov, target_returns, bounds, x0):
+    """
+    minimum variance weights for sorted target returns, each solve warm-started from the previous solution;
+    NaN weights where the solver fails (eg. target outside the feasible range)
+    """
+
+    n_assets = len(mean)
+    bounds = _bounds(n_assets, bounds)
+    budget = _budget_constraint(n_assets)
+
+    weights = np.full((len(target_returns), n_assets), np.nan)
+    for k, target in enumerate(target_returns):
+        target_constraint = {'type': 'eq', 'fun': lambda w, t=target: w @ mean - t, 'jac': lambda w: mean}
+        res = sco.minimize(_variance, x0, args=(cov,), jac=True, method='SLSQP',
+                           bounds=bounds, constraints=[target_constraint, budget])
+        if res['success']:
+            weights[k] = res['x']
+            x0 = res['x']
+
+    return weights
+
+
+def frontier_targets(mean, cov, n_points=40, bounds=(0.0, 1.0)):
+    """
+    target returns from the minimum variance portfolio return to the highest attainable return
+    (the highest mean return for long-only bounds)
+    """
+
+    ret_min = portfolio_statistics(min_variance_portfolio(mean, cov, bounds), mean, cov)[0]
+    return np.linspace(ret_min, np.max(mean), n_points)
+
+
+def efficient_frontier(mean, cov, target_returns=None, n_points=40, bounds=(0.0, 1.0), rf=0.0, asset_names=None,
+                       chunk_size=10, n_jobs=1, executor=None):
+    """
+    Description: This function computes the minimum variance portfolios for a grid of target returns. The sorted
+                 targets are split into chunks of chunk_size, each swept warm-started from the minimum variance
+                 portfolio; the chunks are the same for any n_jobs, so the result does not depend on n_jobs. With
+                 n_jobs > 1 (or an executor) the chunks are swept in worker processes.
+
+    :param mean:Type numpy array. annualized mean returns.
+    :param cov:Type numpy array. annualized covariance matrix.
+    :param target_returns:Type list. target returns, defaults to n_points returns from the minimum variance portfolio
+                          return to the highest mean return (as frontier_targets).
+    :param n_points:Type int. number of target returns if target_returns is None.
+    :param bounds:Type tuple. (lower, upper) bounds for every weight, or a list of bounds per asset.
+    :param rf:Type float. risk free rate for the Sharpe ratio.
+    :param asset_names:Type list. optional names of the weight columns.
+    :param chunk_size:Type int. number of targets per warm-started sweep.
+    :param n_jobs:Type int. number of worker processes; 1 runs in the calling process, None uses all cpus.
+    :param executor:Type concurrent.futures.Executor. optional executor to submit the chunks to.
+    :return:Type pandas dataframe. one row per target return with return, volatility, sharpe and the weights.
+    """
+
+    mean = np.asarray(mean, dtype=float)
+    cov = np.asarray(cov, dtype=float)
+    n_assets = len(mean)
+
+    # every chunk starts from the same anchor
+    x0 = min_variance_portfolio(mean, cov, bounds)
+    if target_returns is None:
+        target_returns = np.linspace(x0 @ mean, np.max(mean), n_points)
+    target_returns = np.sort(np.asarray(target_returns, dtype=float))
+    chunks = [target_returns[start:start + chunk_size] for start in range(0, len(target_returns), chunk_size)]
+
+    if executor is None and n_jobs == 1:
+        sweeps = [_frontier_sweep(mean, cov, chunk, bounds, x0) for chunk in chunks]
+    else:
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=n_jobs if n_jobs is not None else os.cpu_count())
+        try:
+            futures = [executor.submit(_frontier_sweep, mean, cov, chunk, bounds, x0) for chunk in chunks]
+            sweeps = [future.result() for future in futures]
+        finally:
+            if own_executor:
+                executor.shutdown()
+    weights = np.concatenate(sweeps) if sweeps else np.empty((0, n_assets))
+
+    stats = portfolio_statistics(weights, mean, cov, rf)
+    if asset_names is None:
+        asset_names = list(range(n_assets))
+
+    df_out = pd.DataFrame(weights, columns=asset_names)
+    df_out.insert(0, 'sharpe', stats[:, 2])
+    df_out.insert(0, 'volatility', stats[:, 1])
+    df_out.insert(0, 'return', stats[:, 0])
+    df_out.index = pd.Index(target_returns, name='target_return')
+
+    return df_out
+
+
+def _window_assets(mean, cov):
+    """
+    assets with a mean and a covariance with every other retained asset in the window: assets without a mean are
+    dropped, then the asset with the most missing covariances until none is missing
+    """
+    keep = ~np.isnan(mean) & ~np.isnan(np.diagonal(cov))
+    while True:
+        n_missing = np.isnan(cov[np.ix_(keep, keep)]).sum(axis=1)
+        if not n_missing.any():
+            return keep
+        keep[np.flatnonzero(keep)[np.argmax(n_missing)]] = False
+
+
+def _window_start(x0, keep):
+    """
+    previous weights restricted to the assets of the window and rescaled, equal weights if none remain
+    """
+    if x0 is not None:
+        x0 = np.nan_to_num(x0[keep])
+        if x0.sum() > 0:
+            return x0 / x0.sum()
+    return np.full(int(keep.sum()), 1.0 / keep.sum())
+
+
+def _full_weights(weights, keep):
+    """
+    weights of the assets of a window expanded to all assets, zero for the others
+    """
+    out = np.zeros(weights.shape[:-1] + keep.shape)
+    out[..., keep] = weights
+    return out
+
+
+def rolling_frontiers(df_returns, window=252, step=21, n_points=20, rf=0.0, bounds=(0.0, 1.0),
+                      periods_per_year=252, min_periods=None):
+    """
+    Description: This function computes the efficient frontier, minimum variance and maximum Sharpe ratio portfolios
+                 over rolling windows of dates. The window means come from running sums (rolling_metrics) and the
+                 pairwise covariances from rank-1 updates (risk_model.rolling_covariance), so missing returns only
+                 affect their own asset. Assets with fewer than min_periods returns (jointly with the other assets)
+                 in a window are left out of it and get zero weight. Every solve is warm-started from the solution
+                 of the previous window.
+
+    :param df_returns:Type pandas dataframe. (date x asset) period returns, eg. daily returns of data_sample_daily.csv.
+    :param window:Type int. number of dates per window.
+    :param step:Type int. number of dates between the ends of two windows.
+    :param n_points:Type int. number of frontier points per window.
+    :param rf:Type float. risk free rate.
+    :param bounds:Type tuple. (lower, upper) bounds for every weight, or a list of bounds per asset.
+    :param periods_per_year:Type int. number of periods per year used for annualization.
+    :param min_periods:Type int. minimum number of (joint) returns of an asset in a window, defaults to half the
+                        window (markets of different countries do not trade on the same dates).
+    :return:Type tuple. (frontier dataframe indexed by window end date and frontier point,
+                         dataframe of the 'min_variance' and 'max_sharpe' portfolios indexed by window end date
+                         and portfolio), both with return, volatility, sharpe and the weights.
+    """
+
+    if min_periods is None:
+        min_periods = window // 2
+
+    returns = df_returns.to_numpy(dtype=float, na_value=np.nan)
+    n_dates, n_assets = returns.shape
+    asset_names = list(df_returns.columns)
+    asset_bounds = np.array(_bounds(n_assets, bounds), dtype=object)
+
+    ends = np.arange(window - 1, n_dates, step)
+    means = window_moments(returns, window, min_periods)[1][ends] * periods_per_year
+    covs = rolling_covariance(returns, window, min_periods=min_periods, ends=ends) * periods_per_year
+
+    frontier_rows = []
+    special_rows = []
+    x0_min_var = x0_sharpe = x0_frontier = None
+
+    for end, mean_all, cov_all in zip(ends, means, covs):
+        keep = _window_assets(mean_all, cov_all)
+        end_date = df_returns.index[end]
+        if not keep.any():
+            continue
+
+        mean, cov = mean_all[keep], cov_all[np.ix_(keep, keep)]
+        window_bounds = list(asset_bounds[keep])
+
+        x0_min_var = _full_weights(min_variance_portfolio(mean, cov, window_bounds, _window_start(x0_min_var, keep)),
+                                   keep)
+        x0_sharpe = _full_weights(max_sharpe_portfolio(mean, cov, rf, window_bounds, _window_start(x0_sharpe, keep)),
+                                  keep)
+
+        target_returns = np.linspace(x0_min_var[keep] @ mean, np.max(mean), n_points)
+        weights = _frontier_sweep(mean, cov, target_returns, window_bounds,
+                                  _window_start(x0_min_var if x0_frontier is None else x0_frontier, keep))
+        weights = _full_weights(weights, keep)
+        if not np.isnan(weights[0]).any():
+            x0_frontier = weights[0]
+
+        # excluded assets have zero weight, their missing moments do not enter the statistics
+        mean_all, cov_all = np.nan_to_num(mean_all), np.nan_to_num(cov_all)
+        for point, w in enumerate(weights):
+            frontier_rows.append((end_date, point, w, mean_all, cov_all))
+        special_rows.append((end_date, 'min_variance', x0_min_var, mean_all, cov_all))
+        special_rows.append((end_date, 'max_sharpe', x0_sharpe, mean_all, cov_all))
+
+    def to_frame(rows, level_name):
+        weights = np.array([row[2] for row in rows]).reshape(len(rows), n_assets)
+        stats = np.array([portfolio_statistics(row[2], row[3], row[4], rf) for row in rows]).reshape(len(rows), 3)
+        df = pd.DataFrame(weights, columns=asset_names,
+                          index=pd.MultiIndex.from_tuples([(row[0], row[1]) for row in rows],
+                                                          names=[df_returns.index.name or 'date', level_name]))
+        df.insert(0, 'sharpe', stats[:, 2])
+        df.insert(0, 'volatility', stats[:, 1])
+        df.insert(0, 'return', stats[:, 0])
+        return df
+
+    return to_frame(frontier_rows, 'point'), to_frame(special_rows, 'portfolio')
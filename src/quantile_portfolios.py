@@ -0,0 +1,202 @@
+"""
+Quantile (bin) portfolio simulation with turnover and transaction costs.
+
+The back test bins of every date are turned into weight matrices, one portfolio per feature and bin,
+equal or market cap weighted, and run through the drift-and-rebalance engine of index_functionality
+(same bid-ask cost model as index_levels_from_returns: cost_percentage of the amount bought at each rebalancing).
+All features and bins of a chunk are simulated as one stack of weight schemes.
+
+The long-short portfolio is long the first bin (highest feature values) and short the last bin;
+its gross return is the difference of the two legs, its net return the gross return less the costs of both legs
+and its turnover the sum of the legs' turnover.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from .index_functionality import drift_and_rebalance
+from .panel_backtesting import scatter_to_panel, panel_codes, bins_from_values
+
+
+def bin_weights(bin_no, returns, n_bins, mcap=None):
+    """
+    Description: This function turns the bin numbers into portfolio weights, one portfolio per feature and bin.
+                 Only equities with a return on the date are held, so the gross equal weighted bin returns equal
+                 the bin averages of the back test.
+
+    :param bin_no:Type numpy array. (date x equity x feature) bin numbers, 0 outside any bin.
+    :param returns:Type numpy array. (date x equity) returns.
+    :param n_bins:Type int. number of bins.
+    :param mcap:Type numpy array. optional (date x equity) market caps for market cap weights, equal weights if None.
+                 The market caps must be known before the returns of the date, eg. lagged by one date.
+    :return:Type numpy array. (feature x bin x date x equity) weights, rows sum to one (or zero for empty bins).
+    """
+
+    investable = ~np.isnan(returns)
+    if mcap is None:
+        base = investable.astype(float)
+    else:
+        base = np.where(investable & (mcap > 0), mcap, 0.0)
+
+    # (feature x date x equity)
+    bin_no = np.moveaxis(bin_no, 2, 0)
+
+    # each bin is written into its slice of the weights in place, without a temporary of the same size
+    weights = np.empty((bin_no.shape[0], n_bins) + bin_no.shape[1:])
+    for index in range(n_bins):
+        bin_weight = weights[:, index]
+        np.multiply(bin_no == index + 1, base, out=bin_weight)
+        total = bin_weight.sum(axis=2, keepdims=True)
+        np.divide(bin_weight, total, out=bin_weight, where=total > 0)
+
+    return weights
+
+
+def simulate_quantile_portfolios(returns,
+                                 values,
+                                 n_bins=5,
+                                 mcap=None,
+                                 cost_percentage=0.005,
+                                 keep=None):
+    """
+    Description: This function simulates the bin portfolios of all features of a panel at once.
+
+    :param returns:Type numpy array. (date x equity) returns of the holding period of each date.
+    :param values:Type numpy array. (date x equity x feature) feature values.
+    :param n_bins:Type int. number of bins to split the equities into.
+    :param mcap:Type numpy array. optional (date x equity) market caps for market cap weights, known before the
+                 returns of the date (see bin_weights).
+    :param cost_percentage:Type float. transaction costs as fraction of the bought amount.
+    :param keep:Type numpy array. optional boolean (date x feature) array of dates to invest on, eg. 'keep' of
+                 panel_backtest; defaults to the dates on which all bins are populated. Other dates are held in cash.
+    :return:Type dict. (feature x bin x date) arrays 'gross', 'net' and 'turnover',
+                       (feature x date) arrays 'ls_gross', 'ls_net' and 'ls_turnover' for the long-short portfolio
+                       and the (date x feature) 'keep' array of dates invested on.
+    """
+
+    bin_no = bins_from_values(values, n_bins)
+
+    if keep is None:
+        keep = bin_no.max(axis=1, initial=0) == n_bins
+    bin_no = np.where(keep[:, np.newaxis, :], bin_no, 0)
+
+    weights = bin_weights(bin_no, returns, n_bins, mcap)
+    n_features, _, n_dates, n_equities = weights.shape
+
+    result = drift_and_rebalance(weights.reshape(n_features * n_bins, n_dates, n_equities),
+                                 returns,
+                                 cost_percentage=cost_percentage)
+
+    shape = (n_features, n_bins, n_dates)
+    gross = result['index_returns'].reshape(shape)
+    net = result['net_returns'].reshape(shape)
+    turnover = result['turnover'].reshape(shape)
+    ls_gross = gross[:, 0] - gross[:, n_bins - 1]
+
+    # both legs are traded: the costs of the short leg are charged too
+    costs = gross - net
+
+    return {'keep': keep,
+            'gross': gross,
+            'net': net,
+            'turnover': turnover,
+            'ls_gross': ls_gross,
+            'ls_net': ls_gross - costs[:, 0] - costs[:, n_bins - 1],
+            'ls_turnover': turnover[:, 0] + turnover[:, n_bins - 1]}
+
+
+def quantile_portfolio_results(input_df,
+                               features,
+                               return_col_name='returns',
+                               equity_identifier='Equity Parent',
+                               date_col_name='date',
+                               n_bins=5,
+                               bin_labels=None,
+                               weighting='equal',
+                               mcap_col_name='MarketCap_Mlns',
+                               cost_percentage=0.005,
+                               feature_chunk_size=None,
+                               max_bytes=256 * 1024 ** 2):
+    """
+    Description: This function simulates the bin and long-short portfolios of every feature, with the binning
+                 of get_detail_backtest_results, and returns them in the layout of the detail back testing results.
+
+                 Market cap weights of a date are taken from the market caps of the previous date of the panel:
+                 the returns are trailing, so the market cap of the same date already contains its return.
+                 Equities without a market cap on the previous date are not held.
+
+                 The simulation holds a few (feature x bin x date x equity) float64 arrays per chunk of features;
+                 by default the chunk size is chosen so that one such array fits in max_bytes.
+
+    :param input_df:Type pandas dataframe. long format dataframe, as for get_detail_backtest_results.
+    :param features:Type list. list of features for which the portfolios are simulated.
+    :param return_col_name: Type str. Name of the return column.
+    :param equity_identifier : Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :param n_bins:Type int. number of bins to split the equities into.
+    :param bin_labels:Type list. list of bin labels, in descending order.
+    :param weighting:Type str. 'equal' or 'mcap'.
+    :param mcap_col_name:Type str. Name of the market cap column, used for weighting='mcap'.
+    :param cost_percentage:Type float. transaction costs as fraction of the bought amount.
+    :param feature_chunk_size:Type int. number of features simulated at once, derived from max_bytes if None.
+    :param max_bytes:Type int. bound on the size of one (feature x bin x date x equity) array of a chunk.
+    :return:Type pandas dataframe. one row per date on which all bins are populated and feature, indexed by date,
+                                   with <bin>_gross, <bin>_net and <bin>_turnover columns per bin,
+                                   ls_gross, ls_net, ls_turnover, feature and category.
+    """
+
+    assert weighting in ['equal', 'mcap'], 'not implemented'
+
+    if bin_labels is None:
+        bin_labels = ['Q' + str(i + 1) for i in range(n_bins)]
+
+    df_long = input_df
+    if date_col_name not in list(df_long.columns):
+        df_long = df_long.reset_index()
+        df_long.rename(columns={'index': 'date'}, inplace=True)
+
+    features = sorted(feature for feature in features if feature != return_col_name)
+
+    date_codes, equity_codes, dates, equities = panel_codes(df_long, equity_identifier, date_col_name)
+    n_dates = len(dates)
+    n_equities = len(equities)
+
+    returns = scatter_to_panel(date_codes, equity_codes, n_dates, n_equities,
+                               df_long[return_col_name].to_numpy(dtype=float, na_value=np.nan))
+
+    mcap = None
+    if weighting == 'mcap':
+        mcap = scatter_to_panel(date_codes, equity_codes, n_dates, n_equities,
+                                df_long[mcap_col_name].to_numpy(dtype=float, na_value=np.nan))
+        # weights from the previous date's market cap, the same date's market cap contains the return
+        mcap[1:] = mcap[:-1]
+        mcap[0] = np.nan
+
+    if feature_chunk_size is None:
+        feature_chunk_size = max(1, max_bytes // max(1, n_bins * n_dates * n_equities * 8))
+
+    df_list = []
+    for start in range(0, len(features), feature_chunk_size):
+        chunk = features[start:start + feature_chunk_size]
+        values = scatter_to_panel(date_codes, equity_codes, n_dates, n_equities,
+                                  df_long[chunk].to_numpy(dtype=float, na_value=np.nan))
+
+        results = simulate_quantile_portfolios(returns, values, n_bins, mcap, cost_percentage)
+        keep = results['keep']
+
+        for k, feature in enumerate(chunk):
+            df_feature = pd.DataFrame(index=dates[keep[:, k]])
+            for index, bin_lbl in enumerate(bin_labels):
+                for key in ['gross', 'net', 'turnover']:
+                    df_feature[bin_lbl + '_' + key] = results[key][k, index][keep[:, k]]
+            for key in ['gross', 'net', 'turnover']:
+                df_feature['ls_' + key] = results['ls_' + key][k][keep[:, k]]
+            df_feature['feature'] = feature
+            df_feature['category'] = feature.split('_bshift')[0]
+            df_list.append(df_feature)
+
+    if len(df_list) == 0:
+        return pd.DataFrame()
+
+    return pd.concat(df_list)
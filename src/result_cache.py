@@ -0,0 +1,295 @@
+"""
+Content-addressed on-disk cache of back test and index results.
+
+Results are stored as pickles named by a hash of their inputs: the content of the input arrays and every
+parameter that changes the result (n_bins, corr_method, thresholds, cost settings, ...). The date range is part
+of the hashed inputs (the dates of the restricted input), so no separate date key is needed. Identical calls in
+later sessions read the result back instead of recomputing it; any change of the inputs gives a new key, so
+entries never have to be invalidated.
+
+Back test results are cached per feature: the key of a feature combines the hash of the shared inputs (dates,
+equities, returns) with the hash of the feature's own values. Adding one feature to a list of 2,000 back tests only
+that feature and reads the others from the cache. Warnings are only issued for the features back tested.
+
+The cache is bounded by max_bytes: reads touch the file modification time and the least recently used entries are
+removed once the total size exceeds the bound.
+
+Typical use:
+    cache = ResultCache('results/.cache', max_bytes=2 * 1024 ** 3)
+    detail_results_df = cached_detail_backtest_results(cache, input_df, features, equity_identifier=eq_name)
+    df_levels = cached_index_levels_from_returns(cache, df_weights_mc, df_returns, out_field='mc_index')
+
+"""
+
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .compact_panel import CompactPanel
+from .feature_backtesting_routines import get_detail_backtest_results
+from .index_functionality import index_levels_from_returns
+
+
+CACHE_VERSION = 1
+
+# errors of unpickling a truncated or corrupt entry
+CORRUPT_ENTRY_ERRORS = (pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, ValueError)
+
+
+def _update_digest(digest, obj):
+    """
+    feed the content of arrays, pandas objects and plain parameters into a hashlib digest
+    """
+    if isinstance(obj, pd.DataFrame):
+        _update_digest(digest, ('frame', list(obj.columns), [str(dtype) for dtype in obj.dtypes]))
+        digest.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, (pd.Series, pd.Index)):
+        _update_digest(digest, ('series', obj.name, str(obj.dtype)))
+        digest.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            _update_digest(digest, pd.Series(obj.ravel()))
+        else:
+            digest.update(repr((str(obj.dtype), obj.shape)).encode())
+            digest.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b'(')
+        for item in obj:
+            _update_digest(digest, item)
+        digest.update(b')')
+    elif isinstance(obj, dict):
+        _update_digest(digest, sorted(obj.items(), key=lambda item: str(item[0])))
+    else:
+        digest.update(repr(obj).encode())
+        digest.update(b';')
+
+
+def content_hash(*objects):
+    """
+    Description: This function hashes the content of arrays, dataframes and parameters (blake2b, 128 bit).
+
+    :param objects: numpy arrays, pandas objects, lists, tuples, dicts and plain values.
+    :return:Type str. hex digest.
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    _update_digest(digest, (CACHE_VERSION,) + objects)
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    size bounded on-disk store of pickled results, keyed by content hashes
+
+    :param cache_dir: directory of the entries
+    :param max_bytes: bound on the total size of the entries; least recently used entries are evicted beyond it
+    """
+
+    def __init__(self, cache_dir, max_bytes=1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key, default=None):
+        """
+        cached result of key, or default; a hit marks the entry as recently used. Entries that cannot be read
+        (eg. truncated or corrupt files) count as misses and are removed.
+        """
+        path = self._path(key)
+        try:
+            result = pd.read_pickle(path)
+        except FileNotFoundError:
+            return default
+        except CORRUPT_ENTRY_ERRORS:
+            self._remove(key)
+            return default
+        os.utime(path)
+        return result
+
+    def _remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def put(self, key, result, evict=True):
+        """
+        store result under key (written to a temporary file and moved into place)
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            pd.to_pickle(result, tmp_path)
+            os.replace(tmp_path, self._path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if evict:
+            self.evict()
+
+    def entries(self):
+        """
+        dataframe of the entries with size and last use, least recently used first
+        """
+        rows = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*.pkl')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            rows.append((os.path.basename(path)[:-4], stat.st_size, stat.st_mtime))
+        return pd.DataFrame(rows, columns=['key', 'bytes', 'last_used']).sort_values('last_used', kind='stable')
+
+    @property
+    def nbytes(self):
+        return int(self.entries()['bytes'].sum())
+
+    def evict(self, max_bytes=None):
+        """
+        remove least recently used entries until the total size is within max_bytes
+
+        :return: list of the removed keys
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        df_entries = self.entries()
+        excess = df_entries['bytes'].sum() - max_bytes
+        if excess <= 0:
+            return []
+
+        n_remove = int(np.searchsorted(df_entries['bytes'].cumsum().to_numpy(), excess) + 1)
+        removed = list(df_entries['key'].iloc[:n_remove])
+        for key in removed:
+            self._remove(key)
+        return removed
+
+    def clear(self):
+        return self.evict(max_bytes=0)
+
+
+def _backtest_hashes(input_df, features, return_col_name, equity_identifier, date_col_name, params):
+    """
+    per feature keys: hash of the shared inputs and parameters combined with the hash of the feature values
+    """
+    if isinstance(input_df, CompactPanel):
+        base_key = content_hash('panel', input_df.dates, input_df.equities, input_df.present, input_df.returns,
+                                params)
+        return {feature: content_hash(base_key, feature, input_df.values[:, :, input_df.features.index(feature)])
+                for feature in features}
+
+    df_long = input_df
+    if date_col_name not in list(df_long.columns):
+        df_long = df_long.reset_index()
+        df_long.rename(columns={'index': 'date'}, inplace=True)
+
+    base_key = content_hash('long', df_long[[date_col_name, equity_identifier, return_col_name]].reset_index(drop=True),
+                            params)
+    return {feature: content_hash(base_key, feature, df_long[feature].to_numpy(dtype=float, na_value=np.nan))
+            for feature in features}
+
+
+def cached_detail_backtest_results(cache,
+                                   input_df,
+                                   features,
+                                   return_col_name='returns',
+                                   equity_identifier='Equity Parent',
+                                   date_col_name='date',
+                                   n_bins=5,
+                                   bin_labels=None,
+                                   corr_method='spearman',
+                                   items_per_bin_deviation_threshold=1,
+                                   drop_months_outside_of_threshold=False,
+                                   **kwargs):
+    """
+    Description: This function returns the results of get_detail_backtest_results, reading the features cached
+                 for the same inputs and parameters and back testing only the others. The result equals the
+                 uncached call.
+
+    :param cache:Type ResultCache. result cache.
+    :param input_df:Type pandas dataframe. long format dataframe, or a compact_panel.CompactPanel.
+    :param features:Type list. list of features for which backtesting needs to be performed.
+    :param return_col_name: Type str. Name of the return column.
+    :param equity_identifier : Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :param n_bins:Type int. number of bins to split the equities into.
+    :param bin_labels:Type list. list of bin labels, in descending order.
+    :param corr_method:Type string. correlation method being used.
+    :param items_per_bin_deviation_threshold:Type int. Permissible deviation from the expected number of items per bin.
+    :param drop_months_outside_of_threshold:Type boolean. Decision to drop months that deviate beyond the acceptable
+                                                          items_per_bin_deviation_threshold.
+    :param kwargs: further arguments of get_detail_backtest_results that do not change the result
+                   (feature_chunk_size, n_jobs, executor, instrumentation).
+    :return:Type pandas dataframe. detail backtesting results for each period, empty without features.
+    """
+
+    if bin_labels is None:
+        bin_labels = ['Q' + str(i + 1) for i in range(n_bins)]
+    if isinstance(input_df, CompactPanel):
+        return_col_name = input_df.return_col_name
+
+    features = sorted(feature for feature in features if feature != return_col_name)
+    if not features:
+        return pd.DataFrame()
+    params = {'n_bins': n_bins, 'bin_labels': list(bin_labels), 'corr_method': corr_method,
+              'items_per_bin_deviation_threshold': items_per_bin_deviation_threshold,
+              'drop_months_outside_of_threshold': drop_months_outside_of_threshold}
+    keys = _backtest_hashes(input_df, features, return_col_name, equity_identifier, date_col_name, params)
+
+    d_results = {}
+    for feature in features:
+        df_feature = cache.get(keys[feature])
+        if df_feature is not None:
+            d_results[feature] = df_feature
+
+    missing = [feature for feature in features if feature not in d_results]
+    if missing:
+        source = input_df.select_features(missing) if isinstance(input_df, CompactPanel) else input_df
+        df_new = get_detail_backtest_results(source, missing, return_col_name, equity_identifier, date_col_name,
+                                             n_bins, bin_labels, corr_method, items_per_bin_deviation_threshold,
+                                             drop_months_outside_of_threshold, **kwargs)
+        feature_col = df_new['feature'].to_numpy()
+        for feature in missing:
+            # features without any retained date are cached as empty frames
+            d_results[feature] = df_new[feature_col == feature]
+            cache.put(keys[feature], d_results[feature], evict=False)
+        cache.evict()
+
+    frames = [d_results[feature] for feature in features if len(d_results[feature])]
+
+    return pd.concat(frames) if frames else d_results[features[0]]
+
+
+def cached_index_levels_from_returns(cache, df_weights, df_returns, starting_level=100, out_field='index_name',
+                                     transaction_costs=True, cost_percentage=0.005, frequency='monthly'):
+    """
+    Description: This function returns the result of index_levels_from_returns, read from the cache for
+                 identical weights, returns and settings.
+
+    :param cache:Type ResultCache. result cache.
+    :param df_weights:Type pandas dataframe. (date x equity) weights.
+    :param df_returns:Type pandas dataframe. (date x equity) returns, or a CompactPanel.
+    :return:Type pandas dataframe. index levels.
+    """
+
+    returns = df_returns.wide() if isinstance(df_returns, CompactPanel) else df_returns
+    key = content_hash('index_levels', df_weights, returns, starting_level, out_field, transaction_costs,
+                       cost_percentage, frequency)
+
+    df_levels = cache.get(key)
+    if df_levels is None:
+        df_levels = index_levels_from_returns(df_weights, df_returns, starting_level, out_field, transaction_costs,
+                                              cost_percentage, frequency)
+        cache.put(key, df_levels)
+
+    return df_levels
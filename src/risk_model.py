@@ -0,0 +1,251 @@
+"""
+Risk model: covariance and correlation estimates of equity returns.
+
+Estimators on a (date x equity) returns array or dataframe:
+    sample_covariance       pairwise complete sample covariance, as DataFrame.cov()
+    spearman_correlation    rank correlation, as DataFrame.corr(method='spearman') for data without gaps
+    ledoit_wolf_covariance  shrinkage of the sample covariance towards a scaled identity (Ledoit and Wolf 2004)
+    ewma_covariance         exponentially weighted covariance, one matrix per date
+    rolling_covariance      rolling window covariance, one matrix per date
+
+The estimates over time are stacked (date x equity x equity) arrays. The rolling and EWMA estimates are
+updated with one rank-1 term per date (added for the new date, subtracted for the date leaving the window)
+instead of recomputing each matrix from the window. Missing returns are handled pairwise with counts that
+are updated the same way.
+
+Typical use:
+    cov_stack = rolling_covariance(df_returns, window=252)
+    df_vol = index_volatility(df_weights_mc, cov_stack, periods_per_year=252)
+    efficient_frontier(mean, cov_stack[-1] * 252)
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from .information_coefficient import tie_ranks
+
+
+def _returns_array(returns):
+    if isinstance(returns, pd.DataFrame):
+        return returns.to_numpy(dtype=float, na_value=np.nan)
+    return np.asarray(returns, dtype=float)
+
+
+def _pairwise_terms(returns):
+    """
+    returns with NaN as zero and the presence of the returns as float
+    """
+    present = ~np.isnan(returns)
+    values = np.where(present, returns, 0.0)
+    present = present.astype(float)
+    return values, present
+
+
+def _covariance_from_sums(count, sum_xy_x, sum_xy, ddof=1, min_periods=2):
+    """
+    covariance from pairwise counts, sums of x over the rows where y is present and sums of x * y
+    """
+    with np.errstate(all='ignore'):
+        sum_x = sum_xy_x
+        sum_y = np.swapaxes(sum_xy_x, -1, -2)
+        cov = (sum_xy - sum_x * sum_y / count) / (count - ddof)
+    return np.where(count >= max(min_periods, ddof + 1), cov, np.nan)
+
+
+def sample_covariance(returns, ddof=1, min_periods=2):
+    """
+    Description: This function computes the pairwise complete sample covariance matrix, as DataFrame.cov().
+
+    :param returns:Type pandas dataframe or numpy array. (date x equity) returns.
+    :param ddof:Type int. delta degrees of freedom.
+    :param min_periods:Type int. minimum number of joint observations of a pair.
+    :return:Type numpy array. (equity x equity) covariance matrix.
+    """
+
+    values, present = _pairwise_terms(_returns_array(returns))
+
+    return _covariance_from_sums(present.T @ present, values.T @ present, values.T @ values, ddof, min_periods)
+
+
+def correlation_from_covariance(cov):
+    """
+    correlation matrix (or stack of matrices) from a covariance matrix (or stack)
+    """
+    std = np.sqrt(np.diagonal(cov, axis1=-2, axis2=-1))
+    with np.errstate(all='ignore'):
+        return cov / (std[..., :, np.newaxis] * std[..., np.newaxis, :])
+
+
+def spearman_correlation(returns):
+    """
+    Description: This function computes the Spearman rank correlation matrix: the Pearson correlation of the
+                 ranks of every equity's returns. Equal to DataFrame.corr(method='spearman') for returns without
+                 gaps; with gaps the ranks are taken over all available returns of an equity, not per pair.
+
+    :param returns:Type pandas dataframe or numpy array. (date x equity) returns.
+    :return:Type numpy array. (equity x equity) correlation matrix.
+    """
+
+    ranks = tie_ranks(_returns_array(returns), method='average', axis=0)
+
+    return correlation_from_covariance(sample_covariance(ranks))
+
+
+def ledoit_wolf_covariance(returns):
+    """
+    Description: This function computes the Ledoit-Wolf shrinkage estimate (1 - s) * S + s * mu * I of the
+                 covariance matrix, with S the maximum likelihood covariance (ddof=0) of the demeaned returns,
+                 mu the average variance and the shrinkage s estimated from the data. Dates with missing
+                 returns are dropped.
+
+    :param returns:Type pandas dataframe or numpy array. (date x equity) returns.
+    :return:Type tuple. ((equity x equity) shrunk covariance matrix, shrinkage s).
+    """
+
+    values = _returns_array(returns)
+    values = values[~np.isnan(values).any(axis=1)]
+    n_dates, n_equities = values.shape
+
+    values = values - values.mean(axis=0)
+    cov = values.T @ values / n_dates
+    mu = np.trace(cov) / n_equities
+
+    # squared distance of S to the target and the estimated variance of S (beta)
+    squared = values ** 2
+    delta = ((cov - mu * np.eye(n_equities)) ** 2).sum() / n_equities
+    beta = ((squared.T @ squared).sum() / n_dates - (cov ** 2).sum()) / (n_equities * n_dates)
+    beta = min(beta, delta)
+    shrinkage = 0.0 if beta == 0 else beta / delta
+
+    return (1.0 - shrinkage) * cov + shrinkage * mu * np.eye(n_equities), shrinkage
+
+
+def ewma_covariance(returns, halflife=None, decay=0.94, demean=False):
+    """
+    Description: This function computes the exponentially weighted covariance matrix of every date with one
+                 rank-1 update per date. The weights are normalized, sum_i w_i r_i r_i' / sum_i w_i with
+                 w_i = decay ** (t - i) over the available returns of a pair, as ewm(adjust=True). By default the
+                 mean return is taken as zero (RiskMetrics); with demean the exponentially weighted means are
+                 subtracted.
+
+    :param returns:Type pandas dataframe or numpy array. (date x equity) returns.
+    :param halflife:Type float. half life in dates, overrides decay (decay = 0.5 ** (1 / halflife)).
+    :param decay:Type float. weight decay per date, 0.94 for daily RiskMetrics.
+    :param demean:Type boolean. subtract the exponentially weighted means.
+    :return:Type numpy array. (date x equity x equity) stacked covariance matrices.
+    """
+
+    if halflife is not None:
+        decay = 0.5 ** (1.0 / halflife)
+
+    values, present = _pairwise_terms(_returns_array(returns))
+    n_dates, n_equities = values.shape
+
+    weight = np.zeros((n_equities, n_equities))
+    sum_x = np.zeros((n_equities, n_equities))
+    sum_xy = np.zeros((n_equities, n_equities))
+    stack = np.empty((n_dates, n_equities, n_equities))
+
+    for t in range(n_dates):
+        x, m = values[t], present[t]
+        weight = decay * weight + np.outer(m, m)
+        sum_x = decay * sum_x + np.outer(x, m)
+        sum_xy = decay * sum_xy + np.outer(x, x)
+        with np.errstate(all='ignore'):
+            stack[t] = sum_xy / weight
+            if demean:
+                stack[t] -= (sum_x / weight) * (sum_x.T / weight)
+
+    return stack
+
+
+def rolling_covariance(returns, window, ddof=1, min_periods=None, refresh=1000, ends=None):
+    """
+    Description: This function computes the rolling window covariance matrix of every date with rank-1 updates
+                 of the pairwise counts, sums and cross products: the new date is added and the date leaving the
+                 window subtracted. The sums are recomputed from the window every refresh dates to bound the
+                 rounding error. Pairs are complete within the window, as DataFrame.rolling(window).cov().
+
+    :param returns:Type pandas dataframe or numpy array. (date x equity) returns.
+    :param window:Type int. number of dates in the window.
+    :param ddof:Type int. delta degrees of freedom.
+    :param min_periods:Type int. minimum number of joint observations of a pair, defaults to window.
+    :param refresh:Type int. number of updates between recomputations of the sums.
+    :param ends:Type list. optional positions of the dates whose matrices are returned (eg. every 21st date),
+                 all dates by default; the updates still run over every date.
+    :return:Type numpy array. (date x equity x equity) stacked covariance matrices, NaN while a pair has fewer than
+                              min_periods observations; one matrix per position of ends if given.
+    """
+
+    if min_periods is None:
+        min_periods = window
+
+    values, present = _pairwise_terms(_returns_array(returns))
+    n_dates, n_equities = values.shape
+
+    # position of every date in the output stack, -1 for dates not returned
+    ends = np.arange(n_dates) if ends is None else np.asarray(ends, dtype=np.int64)
+    out_pos = np.full(n_dates, -1)
+    out_pos[ends] = np.arange(len(ends))
+
+    count = np.zeros((n_equities, n_equities))
+    sum_x = np.zeros((n_equities, n_equities))
+    sum_xy = np.zeros((n_equities, n_equities))
+    stack = np.empty((len(ends), n_equities, n_equities))
+
+    for t in range(ends.max() + 1 if len(ends) else 0):
+        start = t + 1 - window
+        if t % refresh == 0 and t > 0:
+            first = max(start, 0)
+            count = present[first:t + 1].T @ present[first:t + 1]
+            sum_x = values[first:t + 1].T @ present[first:t + 1]
+            sum_xy = values[first:t + 1].T @ values[first:t + 1]
+        else:
+            x, m = values[t], present[t]
+            count += np.outer(m, m)
+            sum_x += np.outer(x, m)
+            sum_xy += np.outer(x, x)
+            if start > 0:
+                x, m = values[start - 1], present[start - 1]
+                count -= np.outer(m, m)
+                sum_x -= np.outer(x, m)
+                sum_xy -= np.outer(x, x)
+
+        if out_pos[t] >= 0:
+            stack[out_pos[t]] = _covariance_from_sums(count, sum_x, sum_xy, ddof, min_periods)
+
+    return stack
+
+
+def covariance_stack_to_frame(stack, dates, equities):
+    """
+    long dataframe of a covariance stack indexed by (date, equity), one column per equity, as rolling().cov()
+    """
+    n_dates, n_equities, _ = stack.shape
+    index = pd.MultiIndex.from_arrays([np.repeat(np.asarray(dates), n_equities),
+                                       np.tile(np.asarray(equities), n_dates)])
+    return pd.DataFrame(stack.reshape(n_dates * n_equities, n_equities), index=index, columns=equities)
+
+
+def index_volatility(df_weights, cov_stack, periods_per_year=252, out_field='volatility'):
+    """
+    Description: This function computes the ex-ante volatility sqrt(w' C w) of an index for every date from
+                 its weights and the covariance matrix estimated up to that date.
+
+    :param df_weights:Type pandas dataframe. (date x equity) weights, aligned with the covariance stack.
+    :param cov_stack:Type numpy array. (date x equity x equity) covariance matrices of period returns.
+    :param periods_per_year:Type int. number of periods per year used for annualization.
+    :param out_field:Type str. name of the output column.
+    :return:Type pandas dataframe. annualized volatility per date.
+    """
+
+    weights = np.nan_to_num(df_weights.to_numpy(dtype=float, na_value=np.nan))
+    variance = np.einsum('ti,tij,tj->t', weights, np.nan_to_num(cov_stack), weights)
+
+    # NaN where a covariance between two held equities is not available
+    held = (weights != 0).astype(float)
+    missing = np.einsum('ti,tij,tj->t', held, np.isnan(cov_stack).astype(float), held) > 0
+    variance[missing] = np.nan
+
+    return pd.DataFrame({out_field: np.sqrt(variance * periods_per_year)}, index=df_weights.index)
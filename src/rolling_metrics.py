@@ -0,0 +1,226 @@
+"""
+Rolling, expanding and exponentially decayed aggregation of the detail back testing results.
+
+The detail results columns (eg. spread and ic_cs) are pivoted into (date x feature) arrays and aggregated
+for all features at once:
+    rolling and expanding windows from running (prefix) sums of the count, the values and the squared values,
+    so every step adds the new date and removes the date leaving the window in O(1);
+    exponentially decayed windows with a weighted Welford update per date.
+
+The values are centered by their per feature mean before the sums are accumulated, which keeps the variance
+free of the cancellation of the naive sum of squares formula.
+
+Typical use:
+    df_rolling = rolling_aggregation(detail_results_df, windows=[12, 36, 60])
+    df_expanding = rolling_aggregation(detail_results_df, windows=[None])
+    df_decayed = decayed_aggregation(detail_results_df, halflife=12)
+
+"""
+
+import numpy as np
+import pandas as pd
+
+
+AGG_COLS = ['spread', 'ic_cs']
+
+
+def wide_detail_metric(detail_results, col, date_col_name='date'):
+    """
+    Description: This function pivots one column of the detail results into a (date x feature) dataframe,
+                 with NaN for dates that were dropped for a feature.
+
+    :param detail_results:Type pandas dataframe. detail results indexed by date, with a feature column.
+    :param col:Type str. column to pivot.
+    :param date_col_name:Type str. Name of the date index.
+    :return:Type pandas dataframe. (date x feature) values.
+    """
+
+    df = detail_results[['feature', col]].rename_axis(date_col_name).reset_index()
+
+    return df.pivot(index=date_col_name, columns='feature', values=col).sort_index()
+
+
+def window_moments(values, window=None, min_periods=1):
+    """
+    Description: This function computes the count, mean and standard deviation (ddof=1) over a trailing window
+                 of dates for every column, ignoring NaN values, from running sums.
+
+    :param values:Type numpy array. float (date x column) values.
+    :param window:Type int. number of dates in the window, None for an expanding window.
+    :param min_periods:Type int. minimum number of values in the window, fewer give NaN.
+    :return:Type tuple. (count, mean, std), (date x column) arrays.
+    """
+
+    valid = ~np.isnan(values)
+    n_total = valid.sum(axis=0)
+
+    with np.errstate(all='ignore'):
+        center = np.where(valid, values, 0.0).sum(axis=0) / n_total
+    center[n_total == 0] = 0.0
+    centered = np.where(valid, values - center, 0.0)
+
+    def running(x):
+        out = np.zeros((x.shape[0] + 1,) + x.shape[1:])
+        np.cumsum(x, axis=0, out=out[1:])
+        if window is not None:
+            out[window + 1:] = out[window + 1:] - out[1:-window]
+        return out[1:]
+
+    count = running(valid.astype(float))
+    sum_1 = running(centered)
+    sum_2 = running(centered ** 2)
+
+    with np.errstate(all='ignore'):
+        mean = center + sum_1 / count
+        sq_dev = np.maximum(sum_2 - sum_1 ** 2 / count, 0.0)
+        std = np.sqrt(sq_dev / (count - 1))
+
+    mean[count < max(min_periods, 1)] = np.nan
+    std[(count < max(min_periods, 2))] = np.nan
+
+    return count, mean, std
+
+
+def decayed_moments(values, halflife, min_periods=1):
+    """
+    Description: This function computes the exponentially weighted mean and standard deviation for every column,
+                 updating the weights, mean and sum of squared deviations once per date (weighted Welford).
+                 Weights halve every halflife dates, also across missing dates; the standard deviation is
+                 bias corrected for the weights. Matches pandas ewm(halflife=halflife).mean() / .std().
+
+    :param values:Type numpy array. float (date x column) values.
+    :param halflife:Type float. half life in number of dates.
+    :param min_periods:Type int. minimum number of values seen, fewer give NaN.
+    :return:Type tuple. (count, mean, std), (date x column) arrays.
+    """
+
+    decay = 0.5 ** (1.0 / halflife)
+    n_dates, n_cols = values.shape
+
+    count = np.zeros((n_dates, n_cols))
+    mean = np.full((n_dates, n_cols), np.nan)
+    std = np.full((n_dates, n_cols), np.nan)
+
+    n = np.zeros(n_cols)
+    weight = np.zeros(n_cols)
+    weight_sq = np.zeros(n_cols)
+    running_mean = np.zeros(n_cols)
+    sq_dev = np.zeros(n_cols)
+
+    for t in range(n_dates):
+        x = values[t]
+        valid = ~np.isnan(x)
+
+        weight *= decay
+        weight_sq *= decay ** 2
+        sq_dev *= decay
+
+        weight[valid] += 1.0
+        weight_sq[valid] += 1.0
+        n[valid] += 1
+        delta = np.where(valid, x - running_mean, 0.0)
+        with np.errstate(all='ignore'):
+            running_mean = running_mean + np.where(valid, delta / weight, 0.0)
+        sq_dev += np.where(valid, delta * (x - running_mean), 0.0)
+
+        count[t] = n
+        with np.errstate(all='ignore'):
+            mean[t] = np.where(n >= max(min_periods, 1), running_mean, np.nan)
+            std[t] = np.where(n >= max(min_periods, 2),
+                              np.sqrt(np.maximum(sq_dev, 0.0) / (weight - weight_sq / weight)), np.nan)
+
+    return count, mean, std
+
+
+def _aggregation_frame(detail_results, cols, moments, suffix, date_col_name):
+    """
+    avg, std and Sharpe ratio (avg / std) columns per detail column, one row per row of the detail results
+    """
+
+    df_out = None
+
+    for col in cols:
+        df_wide = wide_detail_metric(detail_results, col, date_col_name)
+        _, mean, std = moments(df_wide.to_numpy(dtype=float, na_value=np.nan))
+        with np.errstate(all='ignore'):
+            sharpe = mean / std
+
+        df_col = pd.DataFrame({col + '_avg' + suffix: mean.ravel(),
+                               col + '_std' + suffix: std.ravel(),
+                               col + '_sharpe' + suffix: sharpe.ravel()},
+                              index=pd.MultiIndex.from_product([df_wide.index, df_wide.columns]))
+        df_out = df_col if df_out is None else df_out.join(df_col)
+
+    # back to the rows and layout of the detail results
+    keys = pd.MultiIndex.from_arrays([detail_results.index, detail_results['feature']])
+    df_out = df_out.reindex(keys)
+    df_out.index = detail_results.index
+    df_out['feature'] = detail_results['feature'].values
+    df_out['category'] = detail_results['category'].values
+
+    return df_out
+
+
+def rolling_aggregation(detail_results, windows=(12, 36, 60), cols=None, min_periods=None, date_col_name='date'):
+    """
+    Description: This function aggregates the detail back testing results over trailing windows of dates,
+                 for all features at once. The window counts the dates of the detail results (eg. months),
+                 dates dropped for a feature count towards the window but not towards min_periods.
+
+    :param detail_results:Type pandas dataframe. detail results as returned by get_detail_backtest_results.
+    :param windows:Type list. window lengths in number of dates, None for an expanding window.
+    :param cols:Type list. columns to aggregate, defaults to spread and ic_cs.
+    :param min_periods:Type int. minimum number of values in the window, defaults to the window length
+                        (1 for expanding windows).
+    :param date_col_name:Type str. Name of the date index.
+    :return:Type pandas dataframe. one row per detail results row, with <col>_avg_<window>, <col>_std_<window>
+                                   and <col>_sharpe_<window> columns ('exp' for expanding windows).
+    """
+
+    if cols is None:
+        cols = [col for col in AGG_COLS if col in detail_results.columns]
+
+    df_out = None
+
+    for window in windows:
+        suffix = '_exp' if window is None else '_' + str(window)
+        window_min_periods = min_periods if min_periods is not None else (1 if window is None else window)
+
+        def moments(values):
+            return window_moments(values, window, window_min_periods)
+
+        df_window = _aggregation_frame(detail_results, cols, moments, suffix, date_col_name)
+        if df_out is None:
+            df_out = df_window.drop(columns=['feature', 'category'])
+        else:
+            # same rows in the same order for every window
+            for col in df_window.columns.drop(['feature', 'category']):
+                df_out[col] = df_window[col].values
+
+    df_out['feature'] = detail_results['feature'].values
+    df_out['category'] = detail_results['category'].values
+
+    return df_out
+
+
+def decayed_aggregation(detail_results, halflife=12, cols=None, min_periods=1, date_col_name='date'):
+    """
+    Description: This function aggregates the detail back testing results with exponentially decayed weights,
+                 for all features at once.
+
+    :param detail_results:Type pandas dataframe. detail results as returned by get_detail_backtest_results.
+    :param halflife:Type float. half life in number of dates.
+    :param cols:Type list. columns to aggregate, defaults to spread and ic_cs.
+    :param min_periods:Type int. minimum number of values seen.
+    :param date_col_name:Type str. Name of the date index.
+    :return:Type pandas dataframe. one row per detail results row, with <col>_avg_hl<halflife>,
+                                   <col>_std_hl<halflife> and <col>_sharpe_hl<halflife> columns.
+    """
+
+    if cols is None:
+        cols = [col for col in AGG_COLS if col in detail_results.columns]
+
+    def moments(values):
+        return decayed_moments(values, halflife, min_periods)
+
+    return _aggregation_frame(detail_results, cols, moments, '_hl' + str(halflife), date_col_name)
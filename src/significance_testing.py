@@ -0,0 +1,325 @@
+"""
+Resampling significance tests for the back testing results, for all features at once.
+
+    block_bootstrap_pvalues: moving block bootstrap over dates of the detail results (eg. spread and ic_cs),
+                             testing a zero mean. The resamples are drawn as one index array and reduced to
+                             a (resample x date) count matrix, so all features are resampled with one matrix product.
+    permutation_pvalues:     cross sectional permutation test. The returns are shuffled across the equities of each
+                             date, which breaks the link with every feature at once; the bins and feature values are
+                             kept, and the mean spread and IC are recomputed with the panel back testing engine,
+                             for a whole chunk of permutations in one pass. Chunks can be spread over a process pool.
+    fdr_qvalues:             Benjamini-Hochberg q-values across features.
+    add_significance:        p- and q-value columns next to spread_avg and ic_cs_avg of perform_aggregation_across_time.
+
+P-values are two sided, (1 + number of resampled statistics at least as extreme) / (1 + number of resamples).
+All random draws are seeded (seed=1234 as in modelling), results do not depend on n_jobs.
+
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .information_coefficient import cross_sectional_corr
+from .panel_backtesting import long_to_panel, panel_backtest, bins_from_values, bin_return_statistics
+from .rolling_metrics import wide_detail_metric
+
+
+KEY_COLS = ['feature', 'category']
+
+
+def fdr_qvalues(p_values):
+    """
+    Description: This function computes Benjamini-Hochberg q-values, ignoring NaN p-values.
+
+    :param p_values:Type numpy array or pandas series. p-values.
+    :return:Type numpy array or pandas series. q-values, same shape as p_values.
+    """
+
+    p = np.asarray(p_values, dtype=float)
+    q = np.full(p.shape, np.nan)
+
+    valid = ~np.isnan(p)
+    n = valid.sum()
+    if n > 0:
+        order = np.argsort(p[valid])
+        ranked = p[valid][order] * n / np.arange(1, n + 1)
+        ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+        q_valid = np.empty(n)
+        q_valid[order] = np.minimum(ranked, 1.0)
+        q[valid] = q_valid
+
+    if isinstance(p_values, pd.Series):
+        return pd.Series(q, index=p_values.index, name=p_values.name)
+    return q
+
+
+def _two_sided_pvalues(observed, null):
+    """
+    p-values of observed (feature) against null statistics (resample x feature), NaN null values are skipped
+    """
+
+    with np.errstate(invalid='ignore'):
+        extreme = np.abs(null) >= np.abs(observed)
+    n_null = (~np.isnan(null)).sum(axis=0)
+    p_values = (1.0 + extreme.sum(axis=0)) / (1.0 + n_null)
+    p_values[np.isnan(observed) | (n_null == 0)] = np.nan
+
+    return p_values
+
+
+def block_bootstrap_indices(n_dates, n_boot, block_size, random_state):
+    """
+    Description: This function draws the date indices of moving block bootstrap resamples in one call.
+
+    :param n_dates:Type int. number of dates.
+    :param n_boot:Type int. number of resamples.
+    :param block_size:Type int. number of consecutive dates per block.
+    :param random_state:Type numpy RandomState. random number generator.
+    :return:Type numpy array. int (resample x date) indices.
+    """
+
+    block_size = max(1, min(block_size, n_dates))
+    n_blocks = int(math.ceil(n_dates / block_size))
+    starts = random_state.randint(0, n_dates - block_size + 1, size=(n_boot, n_blocks))
+
+    return (starts[:, :, np.newaxis] + np.arange(block_size)).reshape(n_boot, -1)[:, :n_dates]
+
+
+def block_bootstrap_pvalues(detail_results, cols=('spread', 'ic_cs'), n_boot=1000, block_size=6, seed=1234,
+                            date_col_name='date'):
+    """
+    Description: This function tests a zero mean of detail results columns per feature with a moving block
+                 bootstrap over dates, which keeps the autocorrelation within blocks. Dates dropped for a feature
+                 are skipped in its means.
+
+    :param detail_results:Type pandas dataframe. detail results as returned by get_detail_backtest_results.
+    :param cols:Type list. columns to test.
+    :param n_boot:Type int. number of bootstrap resamples.
+    :param block_size:Type int. number of consecutive dates per block.
+    :param seed:Type int. seed of the random number generator.
+    :param date_col_name:Type str. Name of the date index.
+    :return:Type pandas dataframe. indexed by feature and category, with a <col>_pvalue_boot column per column.
+    """
+
+    random_state = np.random.RandomState(seed)
+
+    df_out = None
+    for col in cols:
+        df_wide = wide_detail_metric(detail_results, col, date_col_name)
+        values = df_wide.to_numpy(dtype=float, na_value=np.nan)
+        valid = ~np.isnan(values)
+        n_dates = values.shape[0]
+
+        # same resamples for every column
+        if df_out is None:
+            indices = block_bootstrap_indices(n_dates, n_boot, block_size, random_state)
+            rows = np.repeat(np.arange(n_boot), indices.shape[1])
+            counts = np.bincount(rows * n_dates + indices.ravel(), minlength=n_boot * n_dates)
+            counts = counts.reshape(n_boot, n_dates).astype(float)
+
+        with np.errstate(all='ignore'):
+            observed = np.where(valid, values, 0.0).sum(axis=0) / valid.sum(axis=0)
+            boot_means = (counts @ np.where(valid, values, 0.0)) / (counts @ valid.astype(float))
+
+        p_values = _two_sided_pvalues(observed, boot_means - observed)
+
+        df_col = pd.DataFrame({col + '_pvalue_boot': p_values}, index=df_wide.columns)
+        df_out = df_col if df_out is None else df_out.join(df_col)
+
+    return _with_key_index(df_out)
+
+
+def _with_key_index(df):
+    df.index.name = 'feature'
+    df = df.reset_index()
+    df['category'] = [feature.split('_bshift')[0] for feature in df['feature']]
+    return df.set_index(KEY_COLS)
+
+
+def permute_within_dates(returns, present, random_state, n_perm=None):
+    """
+    Description: This function shuffles the returns across the equities present on each date. With n_perm, all
+                 permutations are drawn at once (in the order of n_perm consecutive single draws).
+
+    :param returns:Type numpy array. (date x equity) returns.
+    :param present:Type numpy array. boolean (date x equity) array of equities present on each date.
+    :param random_state:Type numpy RandomState. random number generator.
+    :param n_perm:Type int. optional number of permutations.
+    :return:Type numpy array. (date x equity) shuffled returns, or (permutation x date x equity) with n_perm.
+    """
+
+    n_equities = returns.shape[1]
+    shape = returns.shape if n_perm is None else (n_perm,) + returns.shape
+    position = np.broadcast_to(np.arange(n_equities, dtype=float), returns.shape)
+
+    # present equities first (random order as source, original order as destination), absent ones unchanged
+    source = np.argsort(np.where(present, random_state.random_sample(shape), 1.0 + position), axis=-1)
+    destination = np.argsort(np.where(present, position, n_equities + position), axis=-1)
+
+    shuffled = np.empty(shape)
+    np.put_along_axis(shuffled, np.broadcast_to(destination, shape),
+                      np.take_along_axis(np.broadcast_to(returns, shape), source, axis=-1), axis=-1)
+
+    return shuffled
+
+
+def _mean_over_dates(values, axis=0):
+    valid = ~np.isnan(values)
+    with np.errstate(all='ignore'):
+        return np.where(valid, values, 0.0).sum(axis=axis) / valid.sum(axis=axis)
+
+
+def _panel_statistics(returns, bin_no, kept_values, n_bins, corr_method):
+    """
+    mean spread and mean IC over dates per feature
+    """
+
+    bin_avg, _ = bin_return_statistics(returns, bin_no, n_bins)
+    spread = (bin_avg[:, :, 0] - bin_avg[:, :, n_bins - 1]) * 100
+    ic_cs = cross_sectional_corr(returns, kept_values, corr_method)
+
+    return _mean_over_dates(spread), _mean_over_dates(ic_cs)
+
+
+def _permutation_batch(returns, present, bin_no, kept_values, n_bins, corr_method, n_perm, seed):
+    """
+    Worker task: null statistics of n_perm permutations, (permutation x feature) arrays for spread and IC.
+    The permutations are drawn as one (permutation x date x equity) array and stacked along the date axis, so
+    the statistics of all of them are computed in one pass of the panel engine.
+    """
+
+    random_state = np.random.RandomState(seed)
+    n_dates, n_equities, n_features = bin_no.shape
+
+    shuffled = permute_within_dates(returns, present, random_state, n_perm).reshape(n_perm * n_dates, n_equities)
+    stacked_bins = np.broadcast_to(bin_no, (n_perm,) + bin_no.shape).reshape(n_perm * n_dates, n_equities,
+                                                                              n_features)
+    stacked_values = np.broadcast_to(kept_values, (n_perm,) + kept_values.shape).reshape(n_perm * n_dates,
+                                                                                          n_equities, n_features)
+
+    bin_avg, _ = bin_return_statistics(shuffled, stacked_bins, n_bins)
+    spread = (bin_avg[:, :, 0] - bin_avg[:, :, n_bins - 1]) * 100
+    ic_cs = cross_sectional_corr(shuffled, stacked_values, corr_method)
+
+    null_spread = _mean_over_dates(spread.reshape(n_perm, n_dates, n_features), axis=1)
+    null_ic = _mean_over_dates(ic_cs.reshape(n_perm, n_dates, n_features), axis=1)
+
+    return null_spread, null_ic
+
+
+def permutation_pvalues(input_df,
+                        features,
+                        return_col_name='returns',
+                        equity_identifier='Equity Parent',
+                        date_col_name='date',
+                        n_bins=5,
+                        corr_method='spearman',
+                        items_per_bin_deviation_threshold=1,
+                        drop_months_outside_of_threshold=False,
+                        n_perm=200,
+                        seed=1234,
+                        perm_chunk_size=25,
+                        n_jobs=1,
+                        executor=None):
+    """
+    Description: This function tests the mean spread and mean IC of every feature with a cross sectional
+                 permutation test. The dates and bins retained by the back test are kept fixed, the returns are
+                 shuffled across the equities of each date.
+
+                 The permutations are run in chunks of perm_chunk_size, each with its own seed derived from seed,
+                 so the p-values are the same for any n_jobs.
+
+    :param input_df:Type pandas dataframe. long format dataframe, as for get_detail_backtest_results.
+    :param features:Type list. list of features to test.
+    :param return_col_name: Type str. Name of the return column.
+    :param equity_identifier : Type str. Name of the equity identifier column.
+    :param date_col_name:Type str. Name of the date column.
+    :param n_bins:Type int. number of bins to split the equities into.
+    :param corr_method:Type string. correlation method being used.
+    :param items_per_bin_deviation_threshold:Type int. Permissible deviation from the expected number of items per bin.
+    :param drop_months_outside_of_threshold:Type boolean. Decision to drop months that deviate beyond the acceptable
+                                                          items_per_bin_deviation_threshold.
+    :param n_perm:Type int. number of permutations.
+    :param seed:Type int. seed of the random number generators.
+    :param perm_chunk_size:Type int. number of permutations per task, evaluated as one block (bounds the memory).
+    :param n_jobs:Type int. number of worker processes; 1 runs in the calling process, None uses all cpus.
+    :param executor:Type concurrent.futures.Executor. optional executor to submit the chunks to.
+    :return:Type pandas dataframe. indexed by feature and category, with spread_pvalue_perm and ic_cs_pvalue_perm.
+    """
+
+    df_long = input_df
+    if date_col_name not in list(df_long.columns):
+        df_long = df_long.reset_index()
+        df_long.rename(columns={'index': 'date'}, inplace=True)
+
+    features = sorted(feature for feature in features if feature != return_col_name)
+
+    dates, _, present, returns, values = long_to_panel(df_long, features, return_col_name,
+                                                       equity_identifier, date_col_name)
+
+    keep = panel_backtest(dates, present, returns, values, n_bins, corr_method,
+                          items_per_bin_deviation_threshold, drop_months_outside_of_threshold)['keep']
+    bin_no = np.where(keep[:, np.newaxis, :], bins_from_values(values, n_bins), 0)
+    kept_values = np.where(keep[:, np.newaxis, :], values, np.nan)
+
+    observed_spread, observed_ic = _panel_statistics(returns, bin_no, kept_values, n_bins, corr_method)
+
+    chunks = [min(perm_chunk_size, n_perm - start) for start in range(0, n_perm, perm_chunk_size)]
+    args = [(returns, present, bin_no, kept_values, n_bins, corr_method, n_chunk, seed + 1 + k)
+            for k, n_chunk in enumerate(chunks)]
+
+    if executor is None and n_jobs == 1:
+        batches = [_permutation_batch(*arg) for arg in args]
+    else:
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=n_jobs if n_jobs is not None else os.cpu_count())
+        try:
+            futures = [executor.submit(_permutation_batch, *arg) for arg in args]
+            batches = [future.result() for future in futures]
+        finally:
+            if own_executor:
+                executor.shutdown()
+
+    null_spread = np.concatenate([batch[0] for batch in batches])
+    null_ic = np.concatenate([batch[1] for batch in batches])
+
+    df_out = pd.DataFrame({'spread_pvalue_perm': _two_sided_pvalues(observed_spread, null_spread),
+                           'ic_cs_pvalue_perm': _two_sided_pvalues(observed_ic, null_ic)},
+                          index=pd.Index(features))
+
+    return _with_key_index(df_out)
+
+
+def add_significance(df_agg, *df_pvalues):
+    """
+    Description: This function joins p-value tables to the results aggregated across time and adds the
+                 FDR (Benjamini-Hochberg) q-value of every p-value column across features. The p- and q-value
+                 columns of a column are placed right after its _avg column.
+
+    :param df_agg:Type pandas dataframe. output of perform_aggregation_across_time (or aggregation_from_state).
+    :param df_pvalues:Type pandas dataframe. outputs of block_bootstrap_pvalues and/or permutation_pvalues.
+    :return:Type pandas dataframe. aggregated results with p- and q-value columns.
+    """
+
+    df_out = df_agg
+    for df in df_pvalues:
+        df_out = df_out.join(df, how='left')
+
+    columns = list(df_agg.columns)
+    for df in df_pvalues:
+        for p_col in df.columns:
+            q_col = p_col.replace('_pvalue', '_qvalue')
+            df_out[q_col] = fdr_qvalues(df_out[p_col])
+
+            avg_col = p_col.split('_pvalue')[0] + '_avg'
+            position = columns.index(avg_col) + 1 if avg_col in columns else len(columns)
+            while position < len(columns) and ('_pvalue' in columns[position] or '_qvalue' in columns[position]):
+                position += 1
+            columns[position:position] = [p_col, q_col]
+
+    return df_out[columns]
@@ -0,0 +1,148 @@
+"""
+Walk-forward (out of sample) evaluation of features.
+
+The detail back testing rows are computed once for the whole history (get_detail_backtest_results).
+Their spread and ic_cs columns are pivoted to (date x feature) arrays and the aggregates of every train and test
+window are read from the trailing window moments of rolling_metrics.window_moments (running sums of the count,
+the values and the squared values), for all features and folds at once.
+
+In every fold the top features of the train window (by spread_avg or ic_cs_avg) are selected and evaluated
+on the following test window.
+
+The per fold aggregates equal perform_aggregation_across_time on the detail rows of the window. With
+drop_months_outside_of_threshold=True the dates dropped in the full history run are dropped in every fold.
+
+Typical use:
+    detail_results_df = get_detail_backtest_results(input_df, features, equity_identifier=eq_name)
+    df_folds = walk_forward_folds(detail_results_df.index, train_size=36, test_size=12)
+    df_wf = walk_forward_evaluation(detail_results_df, df_folds, top_n=10, select_by='ic_cs_avg')
+    df_wf.groupby('fold')['test_spread_avg'].mean()
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from .rolling_metrics import wide_detail_metric, window_moments
+
+
+def walk_forward_folds(dates, train_size=36, test_size=12, step=None, expanding=False):
+    """
+    Description: This function splits the dates into consecutive train and test windows.
+
+    :param dates:Type pandas DatetimeIndex. dates, eg. the index of the detail results (duplicates are removed).
+    :param train_size:Type int. number of dates in the train window (the first one for expanding windows).
+    :param test_size:Type int. number of dates in the test window.
+    :param step:Type int. number of dates between the starts of two folds, defaults to test_size.
+    :param expanding:Type boolean. if True all train windows start at the first date.
+    :return:Type pandas dataframe. one row per fold with train_start, train_end, test_start, test_end dates
+                                   (inclusive) and the positions of the windows in the sorted dates
+                                   (train_start_pos, test_start_pos, test_end_pos; end positions exclusive).
+    """
+
+    dates = pd.DatetimeIndex(dates).unique().sort_values()
+    if step is None:
+        step = test_size
+
+    rows = []
+    for test_start_pos in range(train_size, len(dates) - test_size + 1, step):
+        train_start_pos = 0 if expanding else test_start_pos - train_size
+        test_end_pos = test_start_pos + test_size
+        rows.append({'train_start': dates[train_start_pos],
+                     'train_end': dates[test_start_pos - 1],
+                     'test_start': dates[test_start_pos],
+                     'test_end': dates[test_end_pos - 1],
+                     'train_start_pos': train_start_pos,
+                     'test_start_pos': test_start_pos,
+                     'test_end_pos': test_end_pos})
+
+    df_folds = pd.DataFrame(rows, columns=['train_start', 'train_end', 'test_start', 'test_end',
+                                           'train_start_pos', 'test_start_pos', 'test_end_pos'])
+    df_folds.index.name = 'fold'
+
+    return df_folds
+
+
+def interval_moments(values, start_pos, end_pos):
+    """
+    Description: This function computes the count, mean and standard deviation (ddof=1) over date intervals
+                 [start_pos, end_pos), for many intervals at once. The moments are taken from
+                 rolling_metrics.window_moments: an expanding window for the intervals starting at the first date
+                 and one trailing window per distinct interval length for the others.
+
+    :param values:Type numpy array. float (date x column) values.
+    :param start_pos:Type numpy array. int start positions, one per interval.
+    :param end_pos:Type numpy array. int end positions (exclusive), one per interval.
+    :return:Type tuple. (count, mean, std), (interval x column) arrays.
+    """
+
+    start_pos = np.asarray(start_pos, dtype=np.int64)
+    end_pos = np.asarray(end_pos, dtype=np.int64)
+    lengths = np.where(start_pos == 0, 0, end_pos - start_pos)
+
+    count, mean, std = [np.full((len(start_pos), values.shape[1]), np.nan) for _ in range(3)]
+    for length in np.unique(lengths):
+        rows = lengths == length
+        moments = window_moments(values, int(length) if length > 0 else None)
+        for out, moment in zip([count, mean, std], moments):
+            out[rows] = moment[end_pos[rows] - 1]
+
+    return count, mean, std
+
+
+def walk_forward_evaluation(detail_results,
+                            df_folds,
+                            top_n=10,
+                            select_by='ic_cs_avg',
+                            min_train_dates=1,
+                            date_col_name='date'):
+    """
+    Description: This function selects the top_n features of every train window and evaluates them on the
+                 test window, with all window aggregates taken from running sums of the detail results.
+
+    :param detail_results:Type pandas dataframe. detail results as returned by get_detail_backtest_results.
+    :param df_folds:Type pandas dataframe. folds as returned by walk_forward_folds on the detail results dates.
+    :param top_n:Type int. number of features selected per fold.
+    :param select_by:Type str. selection metric of the train window, 'spread_avg' or 'ic_cs_avg' (highest first).
+    :param min_train_dates:Type int. minimum number of train dates for a feature to be selected.
+    :param date_col_name:Type str. Name of the date index.
+    :return:Type pandas dataframe. indexed by fold and feature with the fold dates, the selection rank and
+                                   train_/test_ spread_avg, spread_std, ic_cs_avg, ic_cs_std and n_dates.
+    """
+
+    assert select_by in ['spread_avg', 'ic_cs_avg'], 'not implemented'
+
+    train_start = df_folds['train_start_pos'].to_numpy()
+    test_start = df_folds['test_start_pos'].to_numpy()
+    test_end = df_folds['test_end_pos'].to_numpy()
+
+    stats = {}
+    for col in ['spread', 'ic_cs']:
+        df_wide = wide_detail_metric(detail_results, col, date_col_name)
+        features = df_wide.columns
+        values = df_wide.to_numpy(dtype=float, na_value=np.nan)
+        for window, start, end in [('train', train_start, test_start), ('test', test_start, test_end)]:
+            count, mean, std = interval_moments(values, start, end)
+            stats[window + '_' + col + '_avg'] = mean
+            stats[window + '_' + col + '_std'] = std
+            if col == 'spread':
+                stats[window + '_n_dates'] = count
+
+    # highest first, features with too few train dates last
+    score = np.where(stats['train_n_dates'] >= min_train_dates, stats['train_' + select_by], np.nan)
+    order = np.argsort(np.where(np.isnan(score), np.inf, -score), axis=1, kind='stable')
+    n_selected = np.minimum((~np.isnan(score)).sum(axis=1), top_n)
+
+    fold_idx = np.repeat(np.arange(len(df_folds)), n_selected)
+    rank = np.concatenate([np.arange(n) for n in n_selected]).astype(int) if len(n_selected) else np.array([], int)
+    feature_idx = order[fold_idx, rank]
+
+    df_out = pd.DataFrame({'fold': df_folds.index.to_numpy()[fold_idx],
+                           'feature': np.asarray(features, dtype=object)[feature_idx]})
+    for col in ['train_start', 'train_end', 'test_start', 'test_end']:
+        df_out[col] = df_folds[col].to_numpy()[fold_idx]
+    df_out['rank'] = rank + 1
+    for key, array in stats.items():
+        df_out[key] = array[fold_idx, feature_idx]
+
+    return df_out.set_index(['fold', 'feature'])
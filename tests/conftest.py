@@ -0,0 +1,42 @@
+"""
+Shared fixtures: the bundled monthly sample in the long layout of the notebooks.
+
+"""
+
+import datetime
+import os
+import sys
+import warnings
+
+import pandas as pd
+import pytest
+
+# add the base path to python system path, as the notebooks do
+BASE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, BASE_PATH)
+
+DATA_DIR = os.path.join(BASE_PATH, 'data')
+
+FEATURES = ['COGS', 'MarketCap_Mlns', 'NetIncome', 'Revenues', 'size_factor', 'stock_price', 'volume']
+
+EQ_NAME = 'company'
+
+
+@pytest.fixture(autouse=True)
+def ignore_backtest_warnings():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+@pytest.fixture(scope='session')
+def monthly_long():
+    """
+    date indexed long dataframe of the monthly sample, 2010-05 to 2016-04
+    """
+    df = pd.read_csv(os.path.join(DATA_DIR, 'data_sample_monthly.csv'))
+    df['date'] = pd.to_datetime(df['date'])
+    df['size_factor'] = 1 / df['MarketCap_Mlns']
+    df = df.set_index('date')
+    mask = (df.index >= datetime.datetime(2010, 5, 1)) & (df.index <= datetime.datetime(2016, 4, 1))
+    return df[mask]
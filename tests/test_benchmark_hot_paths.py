@@ -0,0 +1,34 @@
+import importlib.util
+import json
+import os
+
+from conftest import BASE_PATH
+
+
+def _benchmark_module():
+    spec = importlib.util.spec_from_file_location('benchmark_hot_paths',
+                                                  os.path.join(BASE_PATH, 'benchmarks', 'benchmark_hot_paths.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_benchmark_runs_all_stages_and_flags_regressions(tmp_path):
+    benchmark = _benchmark_module()
+    baseline_path = str(tmp_path / 'baseline.json')
+    output_path = str(tmp_path / 'bench.json')
+    args = ['--features', '2', '--equities', '10', '--dates', '12', '--repeat', '1']
+
+    assert benchmark.main(args + ['--save-baseline', baseline_path, '--output', output_path]) == 0
+    with open(output_path) as f:
+        report = json.load(f)
+    assert all(item['status'] == 'ok' for item in report['results'])
+    assert len({item['stage'] for item in report['results']}) > 3
+
+    # a baseline ten times faster turns every stage into a regression
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    for item in baseline['results']:
+        item['time_s'] = item['time_s'] / 10
+    comparison = benchmark.compare_to_baseline(report['results'], baseline, threshold=1.25)
+    assert len(comparison) == len(report['results']) and all(item['regression'] for item in comparison)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.compact_panel import CompactPanel
+from src.feature_backtesting_routines import get_detail_backtest_results
+from src.finance_functions import df_restrict_dates
+
+from conftest import FEATURES, EQ_NAME
+
+
+@pytest.fixture(scope='module')
+def panel(monthly_long):
+    return CompactPanel.from_long(monthly_long, FEATURES, equity_identifier=EQ_NAME, field_cols=['MarketCap_Mlns'])
+
+
+def _float32_long(monthly_long):
+    """
+    long dataframe with the inputs rounded to the float32 storage of the panel
+    """
+    df = monthly_long.reset_index()
+    for col in FEATURES + ['returns']:
+        df[col] = df[col].astype(np.float32).astype(np.float64)
+    return df
+
+
+def test_panel_layout(monthly_long, panel):
+    n_dates = monthly_long.index.nunique()
+    n_equities = monthly_long[EQ_NAME].nunique()
+
+    assert panel.shape == (n_dates, n_equities, len(FEATURES))
+    assert panel.features == sorted(FEATURES)
+    assert panel.present.sum() == len(monthly_long)
+    assert panel.dates.is_monotonic_increasing
+    assert panel.returns.dtype == np.float32 and panel.values.dtype == np.float32
+
+
+def test_to_long_round_trip(monthly_long, panel):
+    df_long = panel.to_long(equity_identifier=EQ_NAME).sort_values(['date', EQ_NAME]).reset_index(drop=True)
+    expected = _float32_long(monthly_long).sort_values(['date', EQ_NAME]).reset_index(drop=True)
+
+    assert len(df_long) == len(expected)
+    pd.testing.assert_series_equal(df_long['date'], expected['date'], check_dtype=False)
+    pd.testing.assert_series_equal(df_long[EQ_NAME], expected[EQ_NAME], check_dtype=False)
+    for col in FEATURES + ['returns']:
+        np.testing.assert_array_equal(df_long[col].to_numpy(dtype=np.float64), expected[col].to_numpy())
+
+
+def test_wide_matches_pivot(monthly_long, panel):
+    pivot = monthly_long.reset_index().pivot(index='date', columns=EQ_NAME, values='MarketCap_Mlns')
+    wide = panel.wide('MarketCap_Mlns').reindex(index=pivot.index, columns=pivot.columns)
+
+    np.testing.assert_array_equal(wide.to_numpy(dtype=np.float64), pivot.to_numpy().astype(np.float32))
+    assert np.shares_memory(panel.wide().to_numpy(), panel.returns)
+
+
+def test_restrict_dates_matches_df_restrict_dates(monthly_long, panel):
+    start_date, end_date = pd.Timestamp(2012, 3, 1), pd.Timestamp(2014, 6, 1)
+    restricted = panel.restrict_dates(start_date, end_date)
+    expected = df_restrict_dates(monthly_long, start_date, end_date)
+
+    assert list(restricted.dates) == sorted(expected.index.unique())
+    assert restricted.present.sum() == len(expected)
+    assert np.shares_memory(restricted.values, panel.values)
+
+    only_start = panel.restrict_dates(start_date=start_date)
+    assert only_start.dates[0] == start_date and only_start.dates[-1] == panel.dates[-1]
+    assert panel.restrict_dates(pd.Timestamp(2030, 1, 1)).shape[0] == 0
+
+
+def test_select_features(panel):
+    selected = panel.select_features(['volume', 'COGS'])
+
+    assert selected.features == ['volume', 'COGS']
+    np.testing.assert_array_equal(selected.values[:, :, 0], panel.values[:, :, panel.features.index('volume')])
+    np.testing.assert_array_equal(selected.feature_values(['COGS']), panel.feature_values(['COGS']))
+
+
+@pytest.mark.parametrize('n_bins, corr_method', [(5, 'spearman'), (3, 'pearson')])
+def test_backtest_on_panel_matches_long_input(monthly_long, panel, n_bins, corr_method):
+    result = get_detail_backtest_results(panel, FEATURES, n_bins=n_bins, corr_method=corr_method)
+    expected = get_detail_backtest_results(_float32_long(monthly_long), FEATURES, equity_identifier=EQ_NAME,
+                                           n_bins=n_bins, corr_method=corr_method)
+
+    pd.testing.assert_frame_equal(result.sort_index(axis=1), expected.sort_index(axis=1), check_index_type=False,
+                                  rtol=1e-6)
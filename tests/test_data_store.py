@@ -0,0 +1,81 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from src import data_store
+from src.data_store import load_equity_panels, load_index_history, PRICE_RETURNS
+from src.finance_functions import multiple_returns_from_levels_vec
+
+from conftest import DATA_DIR
+
+
+def test_equity_panels_equal_pivoted_csv(tmp_path):
+    csv_path = str(tmp_path / 'data_sample_monthly.csv')
+    shutil.copy(os.path.join(DATA_DIR, 'data_sample_monthly.csv'), csv_path)
+    df = pd.read_csv(csv_path, parse_dates=['date'])
+
+    d_panels = load_equity_panels(csv_path)
+    for col in ['stock_price', 'MarketCap_Mlns', 'volume']:
+        df_expected = df.pivot(index='date', columns='company', values=col)
+        pd.testing.assert_frame_equal(d_panels['panels'][col], df_expected, check_names=False, check_freq=False,
+                                      check_index_type=False)
+
+    df_prices = df.pivot(index='date', columns='company', values='stock_price')
+    pd.testing.assert_frame_equal(d_panels['panels'][PRICE_RETURNS],
+                                  multiple_returns_from_levels_vec(df_prices.ffill()), check_names=False,
+                                  check_freq=False, check_index_type=False)
+    df_rows = df.assign(row=1.0).pivot(index='date', columns='company', values='row')
+    np.testing.assert_array_equal(d_panels['present'], df_rows.notna().to_numpy())
+
+
+def test_index_history_equals_csv_and_follows_source_changes(tmp_path):
+    csv_path = str(tmp_path / 'dax.csv')
+    shutil.copy(os.path.join(DATA_DIR, 'dax.csv'), csv_path)
+    df_expected = pd.read_csv(csv_path, parse_dates=['Date'], index_col='Date')
+
+    pd.testing.assert_frame_equal(load_index_history(csv_path), df_expected.astype(float), check_freq=False,
+                                  check_index_type=False)
+    # second load from the cache
+    pd.testing.assert_frame_equal(load_index_history(csv_path), df_expected.astype(float), check_freq=False,
+                                  check_index_type=False)
+
+    # a changed source file rebuilds the cache
+    df_expected.iloc[:10].to_csv(csv_path)
+    pd.testing.assert_frame_equal(load_index_history(csv_path), df_expected.iloc[:10].astype(float),
+                                  check_freq=False, check_index_type=False)
+
+
+def test_cache_validation_hashes_only_after_a_modification_time_change(tmp_path, monkeypatch):
+    csv_path = str(tmp_path / 'dax.csv')
+    shutil.copy(os.path.join(DATA_DIR, 'dax.csv'), csv_path)
+    df_expected = load_index_history(csv_path).copy()
+
+    hashed = []
+    file_hash = data_store.file_hash
+    monkeypatch.setattr(data_store, 'file_hash', lambda path: hashed.append(path) or file_hash(path))
+
+    # unchanged file: size and modification time only
+    load_index_history(csv_path)
+    assert hashed == []
+
+    # touched file with the same content: hashed once, the cache is kept and the new time recorded
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    monkeypatch.setattr(data_store, 'build_index_cache', None)
+    pd.testing.assert_frame_equal(load_index_history(csv_path), df_expected)
+    load_index_history(csv_path)
+    assert hashed == [csv_path]
+    monkeypatch.undo()
+
+    # same size, new content: rebuilt
+    with open(csv_path, 'r+b') as f:
+        f.seek(-2, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-2, os.SEEK_END)
+        f.write(b'1' if last != b'1' else b'2')
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+    df_changed = pd.read_csv(csv_path, parse_dates=['Date'], index_col='Date').astype(float)
+    pd.testing.assert_frame_equal(load_index_history(csv_path), df_changed, check_freq=False,
+                                  check_index_type=False)
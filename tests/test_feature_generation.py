@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.feature_generation import generate_features_long, generate_features_to_cache, rolling_transform
+from src.data_store import load_equity_panels
+
+from conftest import EQ_NAME
+
+
+@pytest.fixture(scope='module')
+def sample_long():
+    """
+    long dataframe of five companies over twelve months, one company missing a month
+    """
+    rng = np.random.RandomState(11)
+    dates = pd.date_range('2012-01-01', periods=12, freq='MS')
+    df = pd.DataFrame([(date, 'c' + str(k)) for date in dates for k in range(5)], columns=['date', EQ_NAME])
+    df['NetIncome'] = rng.normal(size=len(df))
+    df['Revenues'] = rng.uniform(1, 2, size=len(df))
+    df.loc[3, 'Revenues'] = 0.0
+    df = df[~((df['date'] == dates[5]) & (df[EQ_NAME] == 'c2'))]
+    return df.sample(frac=1, random_state=3).reset_index(drop=True)
+
+
+def _wide(df_long, col):
+    return df_long.pivot(index='date', columns=EQ_NAME, values=col)
+
+
+def _gather(df_long, wide):
+    stacked = wide.stack(future_stack=True)
+    return stacked.reindex(pd.MultiIndex.from_arrays([df_long['date'], df_long[EQ_NAME]])).to_numpy()
+
+
+def test_lags_and_ratios_match_pivot_shift(sample_long):
+    result = generate_features_long(sample_long, ['NetIncome'], lags=(0, 1, 3), ratios=[('NetIncome', 'Revenues')],
+                                    equity_identifier=EQ_NAME)
+
+    assert len(result) == len(sample_long)
+    pd.testing.assert_frame_equal(result[sample_long.columns], sample_long)
+
+    net_income = _wide(sample_long, 'NetIncome')
+    for lag in (0, 1, 3):
+        np.testing.assert_allclose(result['NetIncome_bshift' + str(lag)], _gather(sample_long, net_income.shift(lag)))
+
+    ratio = (net_income / _wide(sample_long, 'Revenues')).replace([np.inf, -np.inf], np.nan)
+    np.testing.assert_allclose(result['NetIncome_over_Revenues_bshift1'], _gather(sample_long, ratio.shift(1)))
+
+
+def test_missing_month_is_not_skipped(sample_long):
+    result = generate_features_long(sample_long, ['NetIncome'], equity_identifier=EQ_NAME)
+    row = (result['date'] == pd.Timestamp('2012-07-01')) & (result[EQ_NAME] == 'c2')
+
+    assert result.loc[row, 'NetIncome_bshift1'].isna().all()
+
+
+def test_rolling_transforms_match_pandas_rolling(sample_long):
+    window = 3
+    result = generate_features_long(sample_long, ['Revenues'], lags=(1,), windows=(window,),
+                                    equity_identifier=EQ_NAME)
+
+    revenues = _wide(sample_long, 'Revenues')
+    rolling = revenues.rolling(window, min_periods=window)
+    expected = {'mean': rolling.mean(),
+                'zscore': (revenues - rolling.mean()) / rolling.std(),
+                'mom': (revenues / revenues.shift(window) - 1).replace([np.inf, -np.inf], np.nan)}
+    for transform, wide in expected.items():
+        np.testing.assert_allclose(result['Revenues_' + transform + str(window) + '_bshift1'],
+                                   _gather(sample_long, wide.shift(1)), rtol=1e-10, atol=1e-12)
+
+
+def test_rolling_transform_rejects_unknown_transform():
+    with pytest.raises(AssertionError):
+        rolling_transform(np.ones((4, 2)), 'median', 2)
+
+
+def test_date_index_is_kept(sample_long):
+    result = generate_features_long(sample_long.set_index('date'), ['NetIncome'], equity_identifier=EQ_NAME)
+
+    assert result.index.name == 'date'
+    assert 'NetIncome_bshift1' in result.columns
+
+
+def test_features_written_to_cache_match_long(sample_long, tmp_path):
+    csv_path = str(tmp_path / 'sample.csv')
+    sample_long.to_csv(csv_path, index=False)
+    cache_dir = str(tmp_path / 'cache')
+
+    names = generate_features_to_cache(csv_path, ['NetIncome'], lags=(1, 2), ratios=[('NetIncome', 'Revenues')],
+                                       cache_dir=cache_dir)
+    assert sorted(names) == sorted(['NetIncome_bshift1', 'NetIncome_bshift2', 'NetIncome_over_Revenues_bshift1',
+                                    'NetIncome_over_Revenues_bshift2'])
+
+    panels = load_equity_panels(csv_path, cache_dir=cache_dir)['panels']
+    net_income = _wide(sample_long, 'NetIncome')
+    for lag in (1, 2):
+        wide = panels['NetIncome_bshift' + str(lag)]
+        expected = net_income.shift(lag).reindex(index=wide.index, columns=wide.columns)
+        np.testing.assert_allclose(np.asarray(wide, dtype=float), expected.to_numpy())
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.finance_functions import compute_levels, levels_from_returns, monthly_returns
+
+from conftest import DATA_DIR
+
+
+def _levels_loop(l0, returns):
+    levels = [l0]
+    for k in range(len(returns)):
+        levels.append(levels[k] * (1.0 + returns[k]))
+    return np.array(levels)
+
+
+def test_compute_levels_equals_recursion():
+    returns = np.random.RandomState(0).normal(0.0005, 0.01, (2000, 3))
+
+    for col in range(3):
+        np.testing.assert_array_equal(compute_levels(100, returns[:, col]), _levels_loop(100, returns[:, col]))
+    np.testing.assert_array_equal(compute_levels(100, returns),
+                                  np.column_stack([_levels_loop(100, returns[:, col]) for col in range(3)]))
+
+    returns[10, 0] = np.nan
+    assert np.isnan(compute_levels(100, returns[:, 0])[11:]).all()
+    np.testing.assert_array_equal(compute_levels(100, returns[:, 0], nan_policy='zero'),
+                                  _levels_loop(100, np.nan_to_num(returns[:, 0])))
+
+
+def test_levels_of_many_columns_equal_single_columns():
+    dates = pd.date_range('2010-01-01', periods=36, freq='MS')
+    df_returns = pd.DataFrame(np.random.RandomState(1).normal(0.01, 0.05, (36, 3)), index=dates,
+                              columns=['a', 'b', 'c'])
+
+    df_levels = levels_from_returns(df_returns, infield=['a', 'b', 'c'], starting_level=100, frequency='monthly')
+    assert df_levels.index[0] == pd.Timestamp('2009-12-01')
+    for col in ['a', 'b', 'c']:
+        df_single = levels_from_returns(df_returns, infield=col, outfield=col, starting_level=100,
+                                        frequency='monthly')
+        pd.testing.assert_series_equal(df_levels[col], df_single[col])
+
+
+def _monthly_returns_loop(df_in, field):
+    """
+    return of the last available day of each month over the last available day of the previous month,
+    one month at a time
+    """
+    dates = df_in.index
+    month = pd.Timestamp(dates.min().year, dates.min().month, 1) + pd.DateOffset(months=1)
+    rows = {}
+    while month <= dates.max():
+        prev_month = month - pd.DateOffset(months=1)
+        final_val = df_in.loc[dates[(dates.year == month.year) & (dates.month == month.month)].max(), field]
+        prev_val = df_in.loc[dates[(dates.year == prev_month.year) & (dates.month == prev_month.month)].max(), field]
+        rows[month] = (final_val - prev_val) / prev_val if abs(prev_val) > 0.0 else np.nan
+        month = month + pd.DateOffset(months=1)
+    return pd.Series(rows)
+
+
+def test_monthly_returns_equal_month_by_month_loop():
+    df_dax = pd.read_csv(os.path.join(DATA_DIR, 'dax.csv'), parse_dates=['Date'], index_col='Date')
+    df_dax = df_dax[df_dax['Close'].notna()]
+
+    df_monthly = monthly_returns(df_dax, field=['Close', 'Adj Close'])
+    for field in ['Close', 'Adj Close']:
+        expected = _monthly_returns_loop(df_dax, field)
+        np.testing.assert_allclose(df_monthly[field].to_numpy(), expected.to_numpy(), rtol=1e-12)
+        assert (df_monthly.index == expected.index).all()
+
+    df_single = monthly_returns(df_dax, field='Close', out_name='monthly_return')
+    np.testing.assert_array_equal(df_single['monthly_return'].to_numpy(), df_monthly['Close'].to_numpy())
@@ -0,0 +1,46 @@
+import dateutil.relativedelta as relativedelta
+import numpy as np
+import pandas as pd
+
+from src.financial_metrics import performance_metrics, PERFORMANCE_METRICS
+
+
+def _column_metrics(s_returns):
+    """
+    metrics of one return series over the dates of its returns, as computed one portfolio at a time
+    """
+    s_returns = s_returns.dropna()
+    levels = np.append(1.0, np.cumprod(1.0 + s_returns.to_numpy()))
+    cum_return = levels[-1] - 1.0
+    tdel = relativedelta.relativedelta(s_returns.index.max(), s_returns.index.min())
+    n_years = tdel.years + tdel.months / 12
+    drawdown = levels / np.maximum.accumulate(levels) - 1.0
+    return [s_returns.mean(), s_returns.std(), s_returns.mean() / s_returns.std(), cum_return,
+            (1.0 + cum_return) ** (1 / n_years) - 1.0, drawdown.min()]
+
+
+def test_metrics_of_many_portfolios_equal_single_portfolios():
+    dates = pd.date_range('2005-01-01', periods=120, freq='MS')
+    df_returns = pd.DataFrame(np.random.RandomState(0).normal(0.005, 0.05, (120, 8)), index=dates)
+    # portfolios starting and ending at different dates
+    for col in range(8):
+        df_returns.iloc[:col * 5, col] = np.nan
+        df_returns.iloc[len(dates) - col * 3:, col] = np.nan
+
+    df_metrics = performance_metrics(df_returns)
+
+    assert list(df_metrics.index) == PERFORMANCE_METRICS
+    for col in df_returns.columns:
+        np.testing.assert_allclose(df_metrics[col].to_numpy(), _column_metrics(df_returns[col]), rtol=1e-10)
+
+
+def test_gaps_within_a_portfolio_make_level_metrics_missing():
+    dates = pd.date_range('2005-01-01', periods=24, freq='MS')
+    df_returns = pd.DataFrame({'a': np.full(24, 0.01), 'b': np.full(24, 0.01)}, index=dates)
+    df_returns.iloc[10, 1] = np.nan
+
+    df_metrics = performance_metrics(df_returns)
+
+    assert df_metrics[['b']].loc[['cumulative_returns', 'ave_annual_return', 'max_drawdown']].isna().all().all()
+    np.testing.assert_allclose(df_metrics.loc['mean_returns', 'b'], 0.01)
+    np.testing.assert_allclose(df_metrics.loc['cumulative_returns', 'a'], 1.01 ** 24 - 1)
@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src.feature_backtesting_routines import get_detail_backtest_results, perform_aggregation_across_time
+from src.incremental_backtesting import init_backtest_state, append_backtest_dates, aggregation_from_state
+
+from conftest import DATA_DIR
+
+INC_FEATURES = ['MarketCap_Mlns', 'Revenues', 'size_factor', 'volume']
+CUT_DATE = pd.Timestamp('2014-06-01')
+
+
+@pytest.fixture(scope='module')
+def df_sample():
+    df = pd.read_csv(os.path.join(DATA_DIR, 'data_sample_monthly.csv'))
+    df['date'] = pd.to_datetime(df['date'])
+    df['size_factor'] = 1 / df['MarketCap_Mlns']
+    return df
+
+
+def _sorted(df):
+    return df.reset_index().sort_values(['feature', 'date']).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('with_index_returns', [False, True])
+@pytest.mark.parametrize('drop_months', [False, True])
+def test_appended_months_equal_full_run(df_sample, drop_months, with_index_returns):
+    kwargs = dict(equity_identifier='company', n_bins=3, drop_months_outside_of_threshold=drop_months,
+                  items_per_bin_deviation_threshold=2)
+    df_extra = None
+    if with_index_returns:
+        df_extra = pd.DataFrame({'Qe': df_sample.groupby('date')['returns'].mean(),
+                                 'mc_return': df_sample.groupby('date')['index_returns'].mean()})
+
+    full = get_detail_backtest_results(df_sample, INC_FEATURES, **kwargs)
+
+    df_history = df_sample[df_sample['date'] < CUT_DATE]
+    history = get_detail_backtest_results(df_history, INC_FEATURES, **kwargs)
+    if df_extra is not None:
+        history = history.merge(df_extra, left_index=True, right_index=True)
+    state = init_backtest_state(history, df_history, INC_FEATURES, equity_identifier='company', n_bins=3,
+                                drop_months_outside_of_threshold=drop_months, items_per_bin_deviation_threshold=2)
+
+    new_rows = []
+    for date in sorted(df_sample['date'][df_sample['date'] >= CUT_DATE].unique()):
+        rows, state = append_backtest_dates(state, df_sample[df_sample['date'] == date], INC_FEATURES,
+                                            df_extra=df_extra, **kwargs)
+        new_rows.append(rows)
+
+    pd.testing.assert_frame_equal(_sorted(full[full.index >= CUT_DATE]), _sorted(pd.concat(new_rows)),
+                                  check_dtype=False)
+
+    if df_extra is not None:
+        full = full.merge(df_extra, left_index=True, right_index=True)
+    pd.testing.assert_frame_equal(perform_aggregation_across_time(full), aggregation_from_state(state),
+                                  check_dtype=False, rtol=1e-9)
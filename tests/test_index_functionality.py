@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from src.index_functionality import drift_and_rebalance, index_levels_from_returns, \
+    multiple_index_levels_from_returns
+
+
+def _random_weights_and_returns(seed=0, n_dates=60, n_equities=12):
+    random_state = np.random.RandomState(seed)
+    returns = random_state.normal(0.01, 0.08, (n_dates, n_equities))
+    returns[random_state.rand(n_dates, n_equities) < 0.05] = np.nan
+    weights = random_state.rand(n_dates, n_equities) * (random_state.rand(n_dates, n_equities) < 0.7)
+    weights = weights / weights.sum(axis=1, keepdims=True) * 0.95
+    weights[random_state.rand(n_dates, n_equities) < 0.05] = np.nan
+    return weights, returns
+
+
+def _levels_loop(weights, returns, starting_level, cost_percentage):
+    """
+    index levels from money holdings, one date at a time: hold the target weights over the date, let the
+    holdings drift with the returns and pay costs on the amounts bought to reach the next target
+    """
+    weights, returns = np.nan_to_num(weights), np.nan_to_num(returns)
+    value = starting_level
+    levels = [value]
+    for t in range(len(weights)):
+        holdings = value * weights[t] * (1 + returns[t])
+        value = value * (1 - weights[t].sum()) + holdings.sum()
+        if t + 1 < len(weights):
+            bought = np.maximum(value * weights[t + 1] - holdings, 0.0).sum()
+            value = value - cost_percentage * bought
+        levels.append(value)
+    return np.array(levels)
+
+
+def test_drift_and_rebalance_equals_loop():
+    weights, returns = _random_weights_and_returns()
+    result = drift_and_rebalance(weights, returns, starting_level=100, cost_percentage=0.005)
+
+    np.testing.assert_allclose(result['levels'], _levels_loop(weights, returns, 100, 0.005), rtol=1e-12)
+
+
+def test_index_levels_equal_loop():
+    weights, returns = _random_weights_and_returns(seed=1)
+    dates = pd.date_range('2010-01-01', periods=len(weights), freq='MS')
+    df_returns = pd.DataFrame(returns, index=dates)
+    df_weights = pd.DataFrame(weights, index=dates)
+
+    df_levels = index_levels_from_returns(df_weights, df_returns, starting_level=100, out_field='index')
+    assert df_levels.index[0] == pd.Timestamp('2009-12-01')
+    np.testing.assert_allclose(df_levels['index'].to_numpy(), _levels_loop(weights, returns, 100, 0.005),
+                               rtol=1e-12)
+
+    # batched schemes equal the single scheme runs
+    d_weights = {'a': df_weights, 'b': df_weights.shift(1).fillna(0.0)}
+    df_multi, _ = multiple_index_levels_from_returns(d_weights, df_returns)
+    for name, df_scheme in d_weights.items():
+        np.testing.assert_allclose(df_multi[name].to_numpy(),
+                                   index_levels_from_returns(df_scheme, df_returns)['index_name'].to_numpy(),
+                                   rtol=1e-12)
+
+
+def test_missing_period_gives_nan_levels_from_then_on():
+    weights, returns = _random_weights_and_returns(seed=2, n_dates=12)
+    returns[5] = np.nan
+    result = drift_and_rebalance(weights, returns, starting_level=100, cost_percentage=0.005)
+
+    assert np.isnan(result['index_returns'][5]) and not np.isnan(result['index_returns'][6:]).any()
+    np.testing.assert_allclose(result['levels'][:6], _levels_loop(weights, returns, 100, 0.005)[:6], rtol=1e-12)
+    assert np.isnan(result['levels'][6:]).all()
+    np.testing.assert_allclose(result['drifted_weights'][5], np.nan_to_num(weights[5]))
@@ -0,0 +1,60 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.automotive_dictionaries import equity_name2first_date
+from src.finance_functions import project_to_first
+from src.index_weights import membership_mask, index_weights, cap_weights
+
+from conftest import DATA_DIR, EQ_NAME
+
+
+@pytest.fixture(scope='module')
+def market_cap():
+    df = pd.read_csv(os.path.join(DATA_DIR, 'data_sample_monthly.csv'), parse_dates=['date'])
+    df_market_cap = df.pivot(values='MarketCap_Mlns', index='date', columns=EQ_NAME)
+    df_market_cap.index = df_market_cap.index.map(project_to_first)
+    return df_market_cap
+
+
+def test_weights_equal_notebook_construction(market_cap):
+    # market cap and equal weights as built in the index generation notebook
+    df_ref = market_cap.ffill()
+    for col in df_ref.columns:
+        df_ref.loc[df_ref.index < project_to_first(equity_name2first_date[col]), col] = 0.0
+    df_weights_mc = df_ref.div(df_ref.sum(axis=1), axis=0).shift(1)
+    df_temp = (df_weights_mc > 0.0).astype(int)
+    df_weights_equal = df_temp.div(df_temp.sum(axis=1), axis=0)
+
+    mask = membership_mask(market_cap.index, market_cap.columns, equity_name2first_date, project_to_first)
+    d_weights = index_weights(market_cap, mask, ['mcap', 'equal'])
+
+    pd.testing.assert_frame_equal(d_weights['mcap'], df_weights_mc, check_names=False, rtol=1e-12)
+    pd.testing.assert_frame_equal(d_weights['equal'].fillna(0.0), df_weights_equal.fillna(0.0),
+                                  check_names=False, check_dtype=False)
+
+
+def test_membership_with_exit_dates(market_cap):
+    membership = {'DAIMLER AG': (datetime.date(2008, 1, 31), datetime.date(2010, 3, 31))}
+    mask = membership_mask(market_cap.index, market_cap.columns, membership, project_to_first)
+
+    member_dates = mask.index[mask['DAIMLER AG']]
+    assert member_dates[0] == pd.Timestamp('2008-01-01') and member_dates[-1] == pd.Timestamp('2010-02-01')
+    assert not mask.drop(columns='DAIMLER AG').to_numpy().any()
+
+
+def test_capped_weights_respect_the_cap():
+    weights = np.random.RandomState(0).pareto(1.0, (50, 20))
+    weights = weights / weights.sum(axis=1, keepdims=True)
+
+    capped = cap_weights(weights, 0.1)
+    np.testing.assert_allclose(capped.sum(axis=1), 1.0)
+    assert capped.max() <= 0.1 + 1e-12
+    # uncapped weights keep their proportions
+    free = capped < 0.1 - 1e-12
+    for row in range(len(weights)):
+        ratio = capped[row, free[row]] / weights[row, free[row]]
+        np.testing.assert_allclose(ratio, ratio[0])
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.information_coefficient import tie_ranks, long_cross_sectional_ic
+
+from conftest import FEATURES, EQ_NAME
+
+
+def test_tie_ranks_equal_pandas_rank():
+    values = np.random.RandomState(0).randint(0, 6, (20, 15)).astype(float)
+    values[np.random.RandomState(1).rand(20, 15) < 0.2] = np.nan
+    df = pd.DataFrame(values)
+
+    for method in ['min', 'average']:
+        for ascending in [True, False]:
+            np.testing.assert_array_equal(tie_ranks(values, method=method, ascending=ascending, axis=1),
+                                          df.rank(axis=1, method=method, ascending=ascending).to_numpy())
+            np.testing.assert_array_equal(tie_ranks(values, method=method, ascending=ascending, axis=0),
+                                          df.rank(axis=0, method=method, ascending=ascending).to_numpy())
+
+
+@pytest.mark.parametrize('method', ['pearson', 'spearman', 'kendall'])
+def test_ic_equals_groupby_corr(monthly_long, method):
+    df_long = monthly_long.reset_index()
+    # gaps in the returns and features, correlations are pairwise complete
+    df_long = df_long.mask(np.random.RandomState(2).rand(*df_long.shape) < 0.1, other=np.nan)
+    df_long['date'] = monthly_long.index
+    df_long[EQ_NAME] = monthly_long[EQ_NAME].to_numpy()
+
+    df_ic = long_cross_sectional_ic(df_long, FEATURES, equity_identifier=EQ_NAME, methods=[method])[method]
+
+    for feature in FEATURES:
+        corr = df_long.groupby('date')[['returns', feature]].corr(method=method)
+        expected = corr.xs(feature, level=1)['returns']
+        np.testing.assert_allclose(df_ic[feature].to_numpy(), expected.reindex(df_ic.index).to_numpy(),
+                                   rtol=1e-9, atol=1e-12, equal_nan=True)
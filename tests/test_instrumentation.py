@@ -0,0 +1,41 @@
+import pandas as pd
+
+from src.feature_backtesting_routines import get_detail_backtest_results
+from src.instrumentation import BacktestInstrumentation
+
+from conftest import FEATURES, EQ_NAME
+
+
+def _instrumented_run(monthly_long, **kwargs):
+    records = []
+    instrumentation = BacktestInstrumentation(callback=records.append)
+    df_out = get_detail_backtest_results(monthly_long, list(FEATURES), equity_identifier=EQ_NAME,
+                                         drop_months_outside_of_threshold=True, instrumentation=instrumentation,
+                                         **kwargs)
+    return df_out, instrumentation, records
+
+
+def test_instrumentation_records_without_changing_results(monthly_long):
+    df_ref = get_detail_backtest_results(monthly_long, list(FEATURES), equity_identifier=EQ_NAME,
+                                         drop_months_outside_of_threshold=True)
+    df_out, instrumentation, records = _instrumented_run(monthly_long)
+
+    pd.testing.assert_frame_equal(df_out, df_ref)
+    assert records == instrumentation.records
+    assert {'ranking', 'bin_check', 'threshold_check', 'bin_statistics', 'correlation'} <= \
+        set(instrumentation.stage_summary().index)
+
+    # the counters describe the dates dropped from every feature
+    n_dates = monthly_long.index.nunique()
+    df_counters = instrumentation.feature_counters()
+    assert sorted(df_counters.index) == sorted(FEATURES)
+    for feature, row in df_counters.iterrows():
+        assert row['dates_dropped'] == n_dates - (df_out['feature'] == feature).sum()
+        assert row['rows_in'] == len(monthly_long)
+
+
+def test_worker_counters_equal_serial_counters(monthly_long):
+    _, serial, _ = _instrumented_run(monthly_long)
+    _, parallel, _ = _instrumented_run(monthly_long, n_jobs=2)
+
+    pd.testing.assert_frame_equal(parallel.feature_counters().sort_index(), serial.feature_counters().sort_index())
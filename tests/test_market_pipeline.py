@@ -0,0 +1,78 @@
+import datetime
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.finance_functions import monthly_returns
+from src.market_pipeline import MARKET_FILES, run_market_pipeline, load_market, daily_start
+
+from conftest import DATA_DIR
+
+
+@pytest.fixture(scope='module')
+def market_dir(tmp_path_factory):
+    """
+    copy of the index csv files, so the columnar cache is not written into the data directory
+    """
+    tmp_dir = tmp_path_factory.mktemp('markets')
+    for file_name in MARKET_FILES.values():
+        shutil.copy(os.path.join(DATA_DIR, file_name), str(tmp_dir / file_name))
+    return str(tmp_dir)
+
+
+@pytest.fixture(scope='module')
+def monthly_results(market_dir):
+    return run_market_pipeline(market_dir, frequency='monthly')
+
+
+@pytest.mark.parametrize('name', sorted(MARKET_FILES))
+def test_monthly_returns_match_per_file(monthly_results, name):
+    df = pd.read_csv(os.path.join(DATA_DIR, MARKET_FILES[name]), parse_dates=['Date']).set_index('Date')
+    col = 'Adj Close' if 'Adj Close' in df.columns else 'Close'
+    df_ref = monthly_returns(df[df[col].notna()], col, out_name=name)[name].dropna()
+
+    returns = monthly_results['returns'][name].dropna()
+    common = df_ref.index.intersection(returns.index)
+
+    # the per file returns are only undefined after months without trading
+    assert len(common) == len(df_ref)
+    np.testing.assert_allclose(returns.loc[common], df_ref.loc[common], rtol=1e-12)
+
+
+def test_levels_are_rebased_prices(monthly_results):
+    df_prices = monthly_results['prices']
+    df_rebased = 100 * df_prices / df_prices.bfill().iloc[0]
+    np.testing.assert_allclose(monthly_results['levels'].iloc[1:].to_numpy(), df_rebased.iloc[1:].to_numpy(),
+                               rtol=1e-9)
+
+
+def test_start_date_alone_restricts_the_panel(market_dir):
+    start_date = datetime.datetime(2000, 1, 1)
+    results = run_market_pipeline(market_dir, frequency='monthly', start_date=start_date)
+
+    assert results['prices'].index.min() == start_date
+    assert results['prices'].index.max() == pd.Timestamp(2017, 7, 1)
+    assert results['returns'].index.min() > start_date
+
+
+def test_end_date_alone_restricts_the_panel(market_dir):
+    end_date = datetime.datetime(1990, 12, 31)
+    results = run_market_pipeline(market_dir, frequency='monthly', end_date=end_date)
+
+    assert results['prices'].index.max() <= end_date
+    assert results['prices'].index.min() == pd.Timestamp(1789, 5, 1)
+
+
+def test_daily_history_of_the_s_and_p_starts_in_1885(market_dir):
+    assert daily_start(load_market(os.path.join(market_dir, 's_and_p_index.csv')).index) == pd.Timestamp(1885, 2, 17)
+
+
+def test_parallel_loading_equals_serial(market_dir):
+    serial = run_market_pipeline(market_dir, frequency='daily', start_date=datetime.datetime(2010, 1, 1))
+    parallel = run_market_pipeline(market_dir, frequency='daily', start_date=datetime.datetime(2010, 1, 1), n_jobs=2)
+
+    pd.testing.assert_frame_equal(serial['returns'], parallel['returns'])
+    pd.testing.assert_frame_equal(serial['metrics'], parallel['metrics'])
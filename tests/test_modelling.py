@@ -0,0 +1,64 @@
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.modelling import df_fill_missing
+
+from conftest import BASE_PATH, EQ_NAME
+
+COLS = ['COGS', 'MarketCap_Mlns', 'NetIncome', 'Revenues', 'stock_price', 'volume']
+
+
+@pytest.fixture(scope='module')
+def df_gaps(monthly_long):
+    """
+    features of the monthly sample with 30% of the values removed, in company and date order
+    """
+    df = monthly_long.sort_values([EQ_NAME]).sort_index(kind='stable')
+    return df[COLS].mask(np.random.RandomState(0).rand(len(df), len(COLS)) < 0.3), df[EQ_NAME].to_numpy()
+
+
+def _assert_frame_close(df_out, df_expected):
+    np.testing.assert_allclose(df_out.to_numpy(dtype=float), df_expected.to_numpy(dtype=float), equal_nan=True)
+
+
+@pytest.mark.parametrize('limit', [None, 1, 2])
+def test_fills_equal_groupby_fills(df_gaps, limit):
+    df, equities = df_gaps
+
+    _assert_frame_close(df_fill_missing(df, 'ffill', equities=equities, limit=limit),
+                        df.groupby(equities).ffill(limit=limit))
+    _assert_frame_close(df_fill_missing(df, 'bfill', equities=equities, limit=limit),
+                        df.groupby(equities).bfill(limit=limit))
+
+
+def test_statistics_equal_pandas(df_gaps):
+    df, _ = df_gaps
+    dates = df.index
+    df_flat = df.reset_index(drop=True)
+
+    _assert_frame_close(df_fill_missing(df, 'mean'), df.fillna(df.mean()))
+    _assert_frame_close(df_fill_missing(df, 'median'), df.fillna(df.median()))
+    for statistic in ['mean', 'median']:
+        _assert_frame_close(df_fill_missing(df, 'cs_' + statistic, dates=dates),
+                            df_flat.fillna(df_flat.groupby(dates).transform(statistic)))
+    assert df_fill_missing(df, 'drop').equals(df.dropna())
+
+
+def test_wide_layout_equals_pandas(df_gaps):
+    df, equities = df_gaps
+    df_wide = df.assign(equity=equities).reset_index().pivot(index='date', columns='equity', values='volume')
+
+    _assert_frame_close(df_fill_missing(df_wide, 'ffill', limit=2, layout='wide'), df_wide.ffill(limit=2))
+    _assert_frame_close(df_fill_missing(df_wide, 'bfill', layout='wide'), df_wide.bfill())
+    _assert_frame_close(df_fill_missing(df_wide, 'cs_median', layout='wide'),
+                        df_wide.T.fillna(df_wide.median(axis=1)).T)
+
+
+def test_import_does_not_load_scikit_learn():
+    code = 'import sys; import src.modelling; print("sklearn" in sys.modules)'
+    output = subprocess.run([sys.executable, '-c', code], cwd=BASE_PATH, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == 'False'
@@ -0,0 +1,81 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_store import load_equity_panels
+from src.feature_backtesting_routines import get_detail_backtest_results, perform_aggregation_across_time
+from src.out_of_core import backtest_to_disk, iter_spilled_results, aggregate_spilled_results
+
+from conftest import DATA_DIR
+
+OOC_FEATURES = ['COGS', 'MarketCap_Mlns', 'NetIncome', 'Revenues', 'volume']
+
+
+@pytest.fixture(scope='module')
+def sample(tmp_path_factory):
+    tmp_dir = tmp_path_factory.mktemp('ooc')
+    csv_path = str(tmp_dir / 'data_sample_monthly.csv')
+    shutil.copy(os.path.join(DATA_DIR, 'data_sample_monthly.csv'), csv_path)
+
+    df = pd.read_csv(csv_path)
+    df['date'] = pd.to_datetime(df['date'])
+    df['returns'] = df.groupby('company')['stock_price'].pct_change()
+    df['returns'] = df.groupby('company')['returns'].shift(-1)
+    df_forward = df.pivot(index='date', columns='company', values='returns')
+
+    return load_equity_panels(csv_path), df.set_index('date'), df_forward, tmp_dir
+
+
+@pytest.mark.parametrize('drop_months', [False, True])
+def test_spilled_results_equal_in_memory_run(sample, drop_months):
+    source, df_long, df_forward, tmp_dir = sample
+    out_dir = str(tmp_dir / ('spill_%d' % drop_months))
+
+    parts = backtest_to_disk(source, OOC_FEATURES, out_dir, returns=df_forward, feature_chunk_size=2,
+                             drop_months_outside_of_threshold=drop_months)
+    assert len(parts) == 3
+
+    expected = get_detail_backtest_results(df_long, OOC_FEATURES, equity_identifier='company',
+                                           drop_months_outside_of_threshold=drop_months)
+    spilled = pd.concat(list(iter_spilled_results(out_dir)))
+    pd.testing.assert_frame_equal(expected, spilled, check_freq=False, check_index_type=False)
+
+
+@pytest.mark.parametrize('with_index_returns', [False, True])
+def test_streamed_aggregation_equals_perform_aggregation_across_time(sample, with_index_returns):
+    source, df_long, df_forward, tmp_dir = sample
+    out_dir = str(tmp_dir / 'spill_agg')
+    backtest_to_disk(source, OOC_FEATURES, out_dir, returns=df_forward, feature_chunk_size=2)
+
+    detail = get_detail_backtest_results(df_long, OOC_FEATURES, equity_identifier='company')
+    df_extra = None
+    if with_index_returns:
+        rng = np.random.RandomState(0)
+        df_extra = pd.DataFrame({'Qe': rng.randn(len(df_forward)), 'mc_return': rng.randn(len(df_forward))},
+                                index=df_forward.index)
+        detail = detail.merge(df_extra, left_index=True, right_index=True)
+
+    expected = perform_aggregation_across_time(detail)
+    streamed = aggregate_spilled_results(out_dir, df_extra=df_extra)
+    pd.testing.assert_frame_equal(expected, streamed[expected.columns], rtol=1e-9)
+
+
+def test_aggregation_without_index_returns_skips_their_columns(sample):
+    _, df_long, _, _ = sample
+    df_agg = perform_aggregation_across_time(get_detail_backtest_results(df_long, OOC_FEATURES,
+                                                                         equity_identifier='company'))
+
+    assert {'spread_avg', 'spread_std', 'ic_cs_avg', 'ic_cs_std'} <= set(df_agg.columns)
+    assert not {'Qe_avg', 'mc_return_avg'} & set(df_agg.columns)
+
+
+def test_aggregation_without_spilled_rows_is_empty(sample):
+    source, _, df_forward, tmp_dir = sample
+    assert aggregate_spilled_results(str(tmp_dir / 'no_spill')).empty
+
+    out_dir = str(tmp_dir / 'spill_filtered')
+    backtest_to_disk(source, OOC_FEATURES, out_dir, returns=df_forward, feature_chunk_size=2)
+    assert aggregate_spilled_results(out_dir, features=['not_a_feature']).empty
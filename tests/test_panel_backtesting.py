@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.feature_backtesting_routines import get_ranks, add_bins_col_to_rank_df, compute_date_level_metrics, \
+    get_dates_deviating_from_threshold, get_detail_backtest_results
+
+from conftest import FEATURES, EQ_NAME
+
+
+def _per_feature_results(df_long, feature, n_bins, corr_method, drop_months_outside_of_threshold):
+    """
+    detail results of one feature from the pandas building blocks of the per-feature back test,
+    None if no date is retained
+    """
+    bin_labels = ['Q' + str(i + 1) for i in range(n_bins)]
+    df_detail = df_long[[EQ_NAME, 'date', 'returns', feature]].copy()
+    df_detail = add_bins_col_to_rank_df(get_ranks(df_detail, 'date', feature), n_bins)
+
+    insufficient = df_detail.groupby('date')['bin_no'].max() != n_bins
+    df_detail = df_detail[~df_detail['date'].isin(insufficient[insufficient].index)]
+
+    expected = df_detail[EQ_NAME].unique().shape[0] / n_bins
+    bad_dates = []
+    for bin_no in [1, n_bins]:
+        bad_dates += get_dates_deviating_from_threshold(df_detail[df_detail['bin_no'] == bin_no], 'date', EQ_NAME,
+                                                        1, expected)
+    if drop_months_outside_of_threshold:
+        df_detail = df_detail[~df_detail['date'].isin(pd.to_datetime(bad_dates))]
+
+    if df_detail.empty:
+        return None
+
+    df_agg = compute_date_level_metrics(df_detail, bin_labels, 'date', 'returns', feature, corr_method)
+    df_agg['feature'] = feature
+    df_agg['category'] = feature
+    return df_agg
+
+
+@pytest.mark.parametrize('n_bins, corr_method, drop_months', [(5, 'spearman', False), (3, 'pearson', False),
+                                                                (5, 'spearman', True), (4, 'kendall', True)])
+def test_panel_engine_equals_per_feature_back_test(monthly_long, n_bins, corr_method, drop_months):
+    df_out = get_detail_backtest_results(monthly_long, FEATURES, equity_identifier=EQ_NAME, n_bins=n_bins,
+                                         corr_method=corr_method, drop_months_outside_of_threshold=drop_months)
+
+    df_long = monthly_long.reset_index()
+    for feature in FEATURES:
+        df_ref = _per_feature_results(df_long, feature, n_bins, corr_method, drop_months)
+        df_feature = df_out[df_out['feature'] == feature]
+        if df_ref is None:
+            assert df_feature.empty
+            continue
+        pd.testing.assert_frame_equal(df_feature, df_ref[df_feature.columns], check_dtype=False,
+                                      check_index_type=False, check_names=False, check_freq=False,
+                                      rtol=1e-9, atol=1e-12)
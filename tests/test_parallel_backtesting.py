@@ -0,0 +1,25 @@
+import warnings
+
+import pandas as pd
+import pytest
+
+from src.feature_backtesting_routines import get_detail_backtest_results
+
+from conftest import FEATURES, EQ_NAME
+
+
+def _run_with_warnings(monthly_long, **kwargs):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        df_out = get_detail_backtest_results(monthly_long, list(FEATURES), equity_identifier=EQ_NAME,
+                                             drop_months_outside_of_threshold=True, **kwargs)
+    return df_out, [str(warning.message) for warning in caught]
+
+
+@pytest.mark.parametrize('kwargs', [{'n_jobs': 2}, {'n_jobs': 3, 'feature_chunk_size': 2}])
+def test_parallel_results_and_warnings_equal_serial(monthly_long, kwargs):
+    df_serial, serial_warnings = _run_with_warnings(monthly_long)
+    df_parallel, parallel_warnings = _run_with_warnings(monthly_long, **kwargs)
+
+    pd.testing.assert_frame_equal(df_parallel, df_serial)
+    assert parallel_warnings == serial_warnings and len(serial_warnings) > 0
@@ -0,0 +1,42 @@
+import datetime
+import itertools
+
+import pandas as pd
+
+from src.feature_backtesting_routines import get_detail_backtest_results, perform_aggregation_across_time
+from src.finance_functions import df_restrict_dates
+from src.parameter_sweep import parameter_sweep, sweep_aggregation
+
+from conftest import FEATURES, EQ_NAME
+
+
+N_BINS_LIST = [3, 5]
+DATE_WINDOWS = [None, (datetime.datetime(2011, 1, 1), datetime.datetime(2014, 12, 1))]
+THRESHOLDS = [1, 3]
+DROP_MONTHS_OPTIONS = [False, True]
+
+
+def test_sweep_equals_restricted_back_tests(monthly_long):
+    df_sweep = parameter_sweep(monthly_long, FEATURES, N_BINS_LIST, DATE_WINDOWS, THRESHOLDS, DROP_MONTHS_OPTIONS,
+                               equity_identifier=EQ_NAME)
+    df_agg = sweep_aggregation(df_sweep)
+
+    for n_bins, window, threshold, drop_months in itertools.product(N_BINS_LIST, DATE_WINDOWS, THRESHOLDS,
+                                                                     DROP_MONTHS_OPTIONS):
+        df_input = monthly_long if window is None else df_restrict_dates(monthly_long, *window)
+        df_ref = get_detail_backtest_results(df_input, list(FEATURES), equity_identifier=EQ_NAME, n_bins=n_bins,
+                                             items_per_bin_deviation_threshold=threshold,
+                                             drop_months_outside_of_threshold=drop_months)
+
+        start_date = df_input.index.min() if window is None else pd.Timestamp(window[0])
+        end_date = df_input.index.max() if window is None else pd.Timestamp(window[1])
+        config = (n_bins, start_date, end_date, threshold, drop_months)
+
+        df_config = df_sweep.xs(config, level=[0, 1, 2, 3, 4])[df_ref.columns]
+        pd.testing.assert_frame_equal(df_config, df_ref, check_dtype=False, check_index_type=False,
+                                      check_names=False, check_freq=False, rtol=1e-10)
+
+        df_ref_agg = perform_aggregation_across_time(df_ref)
+        df_config_agg = df_agg.xs(config, level=[0, 1, 2, 3, 4])
+        for col in ['spread_avg', 'spread_std', 'ic_cs_avg', 'ic_cs_std']:
+            pd.testing.assert_series_equal(df_config_agg[col], df_ref_agg[col], check_names=False, rtol=1e-10)
@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.optimize as sco
+
+from src.finance_functions import multiple_returns_from_levels_vec
+from src.portfolio_optimization import portfolio_moments, portfolio_statistics, efficient_frontier, \
+    rolling_frontiers
+
+from conftest import DATA_DIR
+
+
+@pytest.fixture(scope='module')
+def daily_returns():
+    """
+    (date x company) daily returns of the daily sample, on the union of the trading dates (with gaps)
+    """
+    df = pd.read_csv(os.path.join(DATA_DIR, 'data_sample_daily.csv'), parse_dates=['date'])
+    df_prices = df.pivot_table(index='date', columns='company', values='Price_USD')
+    return multiple_returns_from_levels_vec(df_prices).iloc[:, :6]
+
+
+def test_frontier_does_not_depend_on_n_jobs(daily_returns):
+    mean, cov = portfolio_moments(daily_returns.dropna())
+    df_serial = efficient_frontier(mean, cov, n_points=25, chunk_size=4)
+
+    assert df_serial.equals(efficient_frontier(mean, cov, n_points=25, chunk_size=4, n_jobs=2))
+    assert df_serial.equals(efficient_frontier(mean, cov, n_points=25, chunk_size=4, n_jobs=3))
+
+
+def test_frontier_points_match_single_solves(daily_returns):
+    mean, cov = portfolio_moments(daily_returns.dropna())
+    n_assets = len(mean)
+    df_frontier = efficient_frontier(mean, cov, n_points=12)
+
+    for target, volatility in df_frontier['volatility'].items():
+        constraints = ({'type': 'eq', 'fun': lambda w: w.sum() - 1},
+                       {'type': 'eq', 'fun': lambda w, t=target: w @ mean - t})
+        res = sco.minimize(lambda w: portfolio_statistics(w, mean, cov)[1], np.full(n_assets, 1.0 / n_assets),
+                           method='SLSQP', bounds=[(0.0, 1.0)] * n_assets, constraints=constraints)
+        assert volatility <= res['fun'] + 1e-5
+
+
+def test_rolling_frontiers_use_pairwise_window_moments(daily_returns):
+    window, min_periods = 252, 200
+    df_frontier, df_special = rolling_frontiers(daily_returns, window=window, step=126, n_points=4,
+                                                min_periods=min_periods)
+
+    # the windows run over the union of the dates, no date is dropped for a missing return
+    assert daily_returns.isna().any(axis=1).sum() > 0
+    assert len(df_special) == 2 * len(range(window - 1, len(daily_returns), 126))
+
+    assets = list(daily_returns.columns)
+    for (date, portfolio), row in pd.concat([df_frontier, df_special]).iterrows():
+        end = daily_returns.index.get_loc(date)
+        df_window = daily_returns.iloc[end + 1 - window:end + 1]
+        keep = (df_window.notna().sum() >= min_periods).to_numpy()
+        mean = df_window.mean().to_numpy()[keep] * 252
+        cov = df_window.cov(min_periods=min_periods).to_numpy()[np.ix_(keep, keep)] * 252
+
+        weights = row[assets].to_numpy(dtype=float)
+        if np.isnan(weights).any():
+            continue
+        assert (weights[~keep] == 0).all()
+        np.testing.assert_allclose(row[['return', 'volatility', 'sharpe']].to_numpy(dtype=float),
+                                   portfolio_statistics(weights[keep], mean, cov), rtol=1e-10)
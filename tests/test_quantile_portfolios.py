@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from src.panel_backtesting import long_to_panel
+from src.feature_backtesting_routines import get_detail_backtest_results, get_ranks, add_bins_col_to_rank_df
+from src.quantile_portfolios import simulate_quantile_portfolios, quantile_portfolio_results
+
+from conftest import FEATURES, EQ_NAME
+
+
+def _panel(monthly_long):
+    dates, _, _, returns, values = long_to_panel(monthly_long.reset_index(), FEATURES, 'returns', EQ_NAME, 'date')
+    return dates, returns, values
+
+
+def test_long_short_costs_are_both_legs(monthly_long):
+    _, returns, values = _panel(monthly_long)
+    results = simulate_quantile_portfolios(returns, values, n_bins=3, cost_percentage=0.005)
+
+    costs = results['gross'] - results['net']
+    drag = results['ls_gross'] - results['ls_net']
+
+    np.testing.assert_allclose(drag, costs[:, 0] + costs[:, 2], atol=1e-15)
+    assert (drag > -1e-12).all() and drag.sum() > 0
+
+
+def test_no_costs_without_cost_percentage(monthly_long):
+    _, returns, values = _panel(monthly_long)
+    results = simulate_quantile_portfolios(returns, values, n_bins=3, cost_percentage=0.0)
+
+    np.testing.assert_allclose(results['ls_net'], results['ls_gross'])
+
+
+def test_gross_bin_returns_equal_backtest_bin_averages(monthly_long):
+    df_q = quantile_portfolio_results(monthly_long, FEATURES, equity_identifier=EQ_NAME, n_bins=3)
+    df_bt = get_detail_backtest_results(monthly_long, FEATURES, equity_identifier=EQ_NAME, n_bins=3)
+
+    for feature in FEATURES:
+        q = df_q[df_q['feature'] == feature]
+        bt = df_bt[df_bt['feature'] == feature]
+        common = q.index.intersection(bt.index)
+        assert len(common) > 0
+        for lbl in ['Q1', 'Q2', 'Q3']:
+            np.testing.assert_allclose(q.loc[common, lbl + '_gross'], bt.loc[common, lbl + '_avg'], rtol=1e-10)
+
+
+def _mcap_weighted_bin_returns(monthly_long, feature, n_bins):
+    """
+    per date market cap weighted bin returns from the back test binning, weights from the previous date's market cap
+    """
+    df = monthly_long.reset_index()
+    mcap_lag = df.pivot(index='date', columns=EQ_NAME, values='MarketCap_Mlns').shift(1).stack()
+    df['mcap_lag'] = mcap_lag.reindex(pd.MultiIndex.from_arrays([df['date'], df[EQ_NAME]])).to_numpy()
+
+    df = add_bins_col_to_rank_df(get_ranks(df[[EQ_NAME, 'date', 'returns', 'mcap_lag', feature]].copy(), 'date',
+                                           feature), n_bins)
+    df = df[df['returns'].notna() & (df['mcap_lag'] > 0)]
+    df['weighted'] = df['returns'] * df['mcap_lag']
+    sums = df.groupby(['date', 'bin_no'])[['weighted', 'mcap_lag']].sum()
+    return (sums['weighted'] / sums['mcap_lag']).unstack('bin_no')
+
+
+def test_mcap_weights_use_previous_market_cap(monthly_long):
+    n_bins = 3
+    df_q = quantile_portfolio_results(monthly_long, FEATURES, equity_identifier=EQ_NAME, n_bins=n_bins,
+                                      weighting='mcap')
+
+    for feature in ['NetIncome', 'volume']:
+        q = df_q[df_q['feature'] == feature]
+        expected = _mcap_weighted_bin_returns(monthly_long, feature, n_bins)
+        common = q.index.intersection(expected.index)[1:]
+        assert len(common) > 0
+        for index in range(n_bins):
+            np.testing.assert_allclose(q.loc[common, 'Q' + str(index + 1) + '_gross'],
+                                       expected.loc[common, index + 1], rtol=1e-10)
+
+        # no market cap is known before the first date: the bins are held in cash
+        assert q.index[0] == monthly_long.index.min()
+        assert (q.iloc[0][['Q1_gross', 'Q2_gross', 'Q3_gross']] == 0).all()
+
+
+def test_chunk_size_does_not_change_results(monthly_long):
+    df_default = quantile_portfolio_results(monthly_long, FEATURES, equity_identifier=EQ_NAME, n_bins=3)
+    df_small = quantile_portfolio_results(monthly_long, FEATURES, equity_identifier=EQ_NAME, n_bins=3,
+                                          max_bytes=1)
+
+    pd.testing.assert_frame_equal(df_small, df_default)
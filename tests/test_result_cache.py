@@ -0,0 +1,67 @@
+import os
+import time
+
+import numpy as np
+
+from src.feature_backtesting_routines import get_detail_backtest_results
+from src.result_cache import ResultCache, cached_detail_backtest_results
+
+from conftest import FEATURES, EQ_NAME
+
+
+def test_cached_results_equal_uncached_run(monthly_long, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    df_ref = get_detail_backtest_results(monthly_long, FEATURES, equity_identifier=EQ_NAME, n_bins=3)
+
+    cached_detail_backtest_results(cache, monthly_long, FEATURES[:3], equity_identifier=EQ_NAME, n_bins=3)
+    assert len(cache.entries()) == 3
+
+    # the added features are back tested, the others read from the cache
+    df_out = cached_detail_backtest_results(cache, monthly_long, FEATURES, equity_identifier=EQ_NAME, n_bins=3)
+    assert len(cache.entries()) == len(FEATURES)
+    assert df_out.equals(df_ref)
+
+    # other parameters give other entries
+    cached_detail_backtest_results(cache, monthly_long, FEATURES[:1], equity_identifier=EQ_NAME, n_bins=5)
+    assert len(cache.entries()) == len(FEATURES) + 1
+
+
+def test_corrupt_entry_is_a_miss_and_removed(monthly_long, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    df_ref = cached_detail_backtest_results(cache, monthly_long, FEATURES[:2], equity_identifier=EQ_NAME)
+
+    key = cache.entries()['key'].iloc[0]
+    with open(os.path.join(str(tmp_path), key + '.pkl'), 'r+b') as f:
+        f.truncate(10)
+    assert cache.get(key) is None
+    assert key not in cache
+
+    garbled = cache.entries()['key'].iloc[0]
+    with open(os.path.join(str(tmp_path), garbled + '.pkl'), 'wb') as f:
+        f.write(b'not a pickle')
+    df_out = cached_detail_backtest_results(cache, monthly_long, FEATURES[:2], equity_identifier=EQ_NAME)
+    assert df_out.equals(df_ref)
+    assert len(cache.entries()) == 2
+
+
+def test_empty_features_give_empty_frame(monthly_long, tmp_path):
+    cache = ResultCache(str(tmp_path))
+
+    assert cached_detail_backtest_results(cache, monthly_long, [], equity_identifier=EQ_NAME).empty
+    assert cached_detail_backtest_results(cache, monthly_long, ['returns'], equity_identifier=EQ_NAME).empty
+    assert len(cache.entries()) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    for k in range(4):
+        cache.put('key' + str(k), np.zeros(1000))
+        last_used = time.time() - 100 + k
+        os.utime(os.path.join(str(tmp_path), 'key' + str(k) + '.pkl'), (last_used, last_used))
+
+    # reading key0 makes it the most recently used entry
+    assert cache.get('key0') is not None
+    entry_bytes = cache.entries()['bytes'].max()
+
+    assert cache.evict(max_bytes=2 * entry_bytes) == ['key1', 'key2']
+    assert sorted(cache.entries()['key']) == ['key0', 'key3']
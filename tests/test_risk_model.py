@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.finance_functions import multiple_returns_from_levels_vec
+from src.risk_model import sample_covariance, spearman_correlation, ledoit_wolf_covariance, ewma_covariance, \
+    rolling_covariance, index_volatility
+
+from conftest import DATA_DIR
+
+
+@pytest.fixture(scope='module')
+def daily_returns():
+    """
+    (date x company) daily returns of the daily sample, on the union of the trading dates (with gaps)
+    """
+    df = pd.read_csv(os.path.join(DATA_DIR, 'data_sample_daily.csv'), parse_dates=['date'])
+    df_prices = df.pivot_table(index='date', columns='company', values='Price_USD')
+    return multiple_returns_from_levels_vec(df_prices).iloc[1:, :6]
+
+
+def _stack(df_long, n_assets):
+    return df_long.to_numpy().reshape(-1, n_assets, n_assets)
+
+
+def test_sample_and_rank_estimates_equal_pandas(daily_returns):
+    assert daily_returns.isna().any().any()
+    np.testing.assert_allclose(sample_covariance(daily_returns), daily_returns.cov().to_numpy(), rtol=1e-9)
+
+    df_complete = daily_returns.dropna()
+    np.testing.assert_allclose(spearman_correlation(df_complete), df_complete.corr(method='spearman').to_numpy(),
+                               rtol=1e-9)
+
+
+def test_ledoit_wolf_equals_reference_formula(daily_returns):
+    values = daily_returns.dropna().to_numpy()
+    values = values - values.mean(axis=0)
+    n_dates, n_assets = values.shape
+
+    # Ledoit and Wolf (2004), as in scikit-learn
+    cov = values.T @ values / n_dates
+    mu = np.trace(cov) / n_assets
+    delta = ((cov - mu * np.eye(n_assets)) ** 2).sum() / n_assets
+    beta = sum(((np.outer(x, x) - cov) ** 2).sum() for x in values) / n_dates ** 2 / n_assets
+    shrinkage = min(beta, delta) / delta
+
+    shrunk, estimated_shrinkage = ledoit_wolf_covariance(daily_returns)
+    np.testing.assert_allclose(estimated_shrinkage, shrinkage, rtol=1e-9)
+    np.testing.assert_allclose(shrunk, (1 - shrinkage) * cov + shrinkage * mu * np.eye(n_assets), rtol=1e-9)
+
+
+@pytest.mark.parametrize('min_periods', [None, 20])
+def test_rolling_covariance_equals_pandas_rolling(daily_returns, min_periods):
+    stack = rolling_covariance(daily_returns, 60, min_periods=min_periods, refresh=300)
+    expected = _stack(daily_returns.rolling(60, min_periods=min_periods).cov(), daily_returns.shape[1])
+
+    np.testing.assert_array_equal(np.isnan(stack), np.isnan(expected))
+    np.testing.assert_allclose(stack, expected, rtol=1e-7, atol=1e-12, equal_nan=True)
+
+
+def test_rolling_covariance_at_window_ends_equals_full_stack():
+    returns = np.random.RandomState(0).randn(300, 5) * 0.01
+    returns[np.random.RandomState(1).rand(300, 5) < 0.1] = np.nan
+    ends = np.arange(59, 300, 21)
+
+    np.testing.assert_allclose(rolling_covariance(returns, 60, min_periods=40, refresh=50, ends=ends),
+                               rolling_covariance(returns, 60, min_periods=40, refresh=50)[ends], rtol=1e-12)
+
+
+def test_ewma_covariance_equals_pandas_ewm(daily_returns):
+    df_complete = daily_returns.dropna().iloc[:, :4]
+    n_assets = df_complete.shape[1]
+    df_products = pd.DataFrame({(i, j): df_complete.iloc[:, i] * df_complete.iloc[:, j]
+                                for i in range(n_assets) for j in range(n_assets)})
+    expected = _stack(df_products.ewm(halflife=30).mean(), n_assets)
+    np.testing.assert_allclose(ewma_covariance(df_complete, halflife=30), expected, rtol=1e-9)
+
+    mean = df_complete.ewm(halflife=30).mean().to_numpy()
+    np.testing.assert_allclose(ewma_covariance(df_complete, halflife=30, demean=True),
+                               expected - mean[:, :, np.newaxis] * mean[:, np.newaxis, :], rtol=1e-7, atol=1e-14)
+
+
+def test_index_volatility_equals_rolling_volatility_of_the_index(daily_returns):
+    df_complete = daily_returns.dropna()
+    df_weights = pd.DataFrame(1.0 / df_complete.shape[1], index=df_complete.index, columns=df_complete.columns)
+
+    df_vol = index_volatility(df_weights, rolling_covariance(df_complete, 60), periods_per_year=252)
+    expected = df_complete.mean(axis=1).rolling(60).std() * np.sqrt(252)
+
+    pd.testing.assert_series_equal(df_vol['volatility'], expected, check_names=False, rtol=1e-7)
@@ -0,0 +1,53 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from src.feature_backtesting_routines import get_detail_backtest_results
+from src.rolling_metrics import rolling_aggregation, decayed_aggregation, wide_detail_metric
+
+from conftest import FEATURES, EQ_NAME
+
+
+@pytest.fixture(scope='module')
+def detail_results(monthly_long):
+    # dropped months leave gaps in the detail results of some features
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return get_detail_backtest_results(monthly_long, FEATURES, equity_identifier=EQ_NAME,
+                                           drop_months_outside_of_threshold=True)
+
+
+def _assert_series_close(values, expected):
+    np.testing.assert_array_equal(np.isnan(values), expected.isna().to_numpy())
+    np.testing.assert_allclose(values, expected.to_numpy(), rtol=1e-9, atol=1e-12, equal_nan=True)
+
+
+@pytest.mark.parametrize('col', ['spread', 'ic_cs'])
+def test_rolling_and_expanding_aggregates_equal_pandas(detail_results, col):
+    df_rolling = rolling_aggregation(detail_results, windows=[12, None], min_periods=6)
+
+    for feature in FEATURES:
+        s_wide = wide_detail_metric(detail_results, col)[feature]
+        df_feature = df_rolling[df_rolling['feature'] == feature]
+        if df_feature.empty:
+            continue
+        rolling = s_wide.rolling(12, min_periods=6)
+        _assert_series_close(df_feature[col + '_avg_12'].to_numpy(), rolling.mean().reindex(df_feature.index))
+        _assert_series_close(df_feature[col + '_std_12'].to_numpy(), rolling.std().reindex(df_feature.index))
+        _assert_series_close(df_feature[col + '_avg_exp'].to_numpy(),
+                             s_wide.expanding(min_periods=6).mean().reindex(df_feature.index))
+
+
+@pytest.mark.parametrize('col', ['spread', 'ic_cs'])
+def test_decayed_aggregates_equal_pandas_ewm(detail_results, col):
+    df_decayed = decayed_aggregation(detail_results, halflife=6)
+
+    for feature in FEATURES:
+        s_wide = wide_detail_metric(detail_results, col)[feature]
+        df_feature = df_decayed[df_decayed['feature'] == feature]
+        if df_feature.empty:
+            continue
+        ewm = s_wide.ewm(halflife=6)
+        _assert_series_close(df_feature[col + '_avg_hl6'].to_numpy(), ewm.mean().reindex(df_feature.index))
+        _assert_series_close(df_feature[col + '_std_hl6'].to_numpy(), ewm.std().reindex(df_feature.index))
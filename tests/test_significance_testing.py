@@ -0,0 +1,53 @@
+import numpy as np
+
+from src.panel_backtesting import long_to_panel, panel_backtest, bins_from_values
+from src.significance_testing import permute_within_dates, _panel_statistics, _permutation_batch, \
+    permutation_pvalues
+
+from conftest import FEATURES, EQ_NAME
+
+
+def _kept_panel(monthly_long, n_bins=5):
+    dates, _, present, returns, values = long_to_panel(monthly_long.reset_index(), FEATURES, 'returns', EQ_NAME,
+                                                       'date')
+    keep = panel_backtest(dates, present, returns, values, n_bins, 'spearman', 1, False)['keep']
+    bin_no = np.where(keep[:, np.newaxis, :], bins_from_values(values, n_bins), 0)
+    kept_values = np.where(keep[:, np.newaxis, :], values, np.nan)
+    return present, returns, bin_no, kept_values
+
+
+def test_batched_permutations_equal_single_draws(monthly_long):
+    present, returns, _, _ = _kept_panel(monthly_long)
+
+    batched = permute_within_dates(returns, present, np.random.RandomState(7), n_perm=4)
+    random_state = np.random.RandomState(7)
+    for k in range(4):
+        np.testing.assert_array_equal(batched[k], permute_within_dates(returns, present, random_state))
+
+    # returns are only moved between the equities present on a date
+    absent = ~present
+    np.testing.assert_array_equal(batched[:, absent], np.broadcast_to(returns[absent], (4, absent.sum())))
+    for t in range(returns.shape[0]):
+        np.testing.assert_array_equal(np.sort(batched[0, t, present[t]]), np.sort(returns[t, present[t]]))
+
+
+def test_permutation_batch_equals_loop_over_permutations(monthly_long):
+    present, returns, bin_no, kept_values = _kept_panel(monthly_long)
+
+    null_spread, null_ic = _permutation_batch(returns, present, bin_no, kept_values, 5, 'spearman', 6, 11)
+
+    random_state = np.random.RandomState(11)
+    for k in range(6):
+        shuffled = permute_within_dates(returns, present, random_state)
+        spread, ic = _panel_statistics(shuffled, bin_no, kept_values, 5, 'spearman')
+        np.testing.assert_allclose(null_spread[k], spread, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(null_ic[k], ic, rtol=1e-12, atol=1e-12)
+
+
+def test_permutation_pvalues_do_not_depend_on_n_jobs(monthly_long):
+    kwargs = dict(equity_identifier=EQ_NAME, n_perm=30, perm_chunk_size=10)
+    df_serial = permutation_pvalues(monthly_long, FEATURES, **kwargs)
+    df_parallel = permutation_pvalues(monthly_long, FEATURES, n_jobs=2, **kwargs)
+
+    assert df_serial.equals(df_parallel)
+    assert ((df_serial > 0) & (df_serial <= 1)).all().all()
@@ -0,0 +1,39 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from src.feature_backtesting_routines import get_detail_backtest_results
+from src.walk_forward import walk_forward_folds, walk_forward_evaluation
+
+from conftest import FEATURES, EQ_NAME
+
+
+@pytest.fixture(scope='module')
+def detail_results(monthly_long):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return get_detail_backtest_results(monthly_long, FEATURES, equity_identifier=EQ_NAME)
+
+
+@pytest.mark.parametrize('expanding', [False, True])
+def test_fold_aggregates_equal_window_aggregates(detail_results, expanding):
+    df_folds = walk_forward_folds(detail_results.index, train_size=24, test_size=12, expanding=expanding)
+    df_wf = walk_forward_evaluation(detail_results, df_folds, top_n=3, select_by='ic_cs_avg')
+
+    assert len(df_wf) == 3 * len(df_folds)
+    for (fold, feature), row in df_wf.iterrows():
+        df_feature = detail_results[detail_results['feature'] == feature]
+        for window in ['train', 'test']:
+            dates = df_feature.index
+            df_window = df_feature[(dates >= row[window + '_start']) & (dates <= row[window + '_end'])]
+            assert row[window + '_n_dates'] == len(df_window)
+            for col in ['spread', 'ic_cs']:
+                np.testing.assert_allclose(row[window + '_' + col + '_avg'], df_window[col].mean(), rtol=1e-10)
+                np.testing.assert_allclose(row[window + '_' + col + '_std'], df_window[col].std(), rtol=1e-8)
+
+        # the selected features are the best of the train window
+        train_dates = detail_results.index
+        df_train = detail_results[(train_dates >= row['train_start']) & (train_dates <= row['train_end'])]
+        ranking = df_train.groupby('feature')['ic_cs'].mean().sort_values(ascending=False, kind='stable')
+        assert ranking.index[row['rank'] - 1] == feature